@@ -7,6 +7,23 @@ import { RotatingSlideshow } from '../components/RotatingSlideshow';
 import { AnimationParams } from '../types';
 import { X } from 'lucide-react';
 
+// --- Версии картинки из /images: url, размеры и вес ---
+interface ImageRendition {
+  url: string;
+  width: number;
+  height: number;
+  bytes: number;
+}
+
+// --- Наименьшая версия не уже экрана (с учётом плотности пикселей), иначе самая большая ---
+const pickRendition = (renditions: Record<string, ImageRendition | string>, neededWidth: number): string => {
+  const options = Object.values(renditions)
+    .filter((r): r is ImageRendition => typeof r === 'object')
+    .sort((a, b) => a.width - b.width);
+  const fit = options.find(r => r.width >= neededWidth) ?? options[options.length - 1];
+  return fit ? fit.url : (renditions.original as string);
+};
+
 // --- Функция преобразования полутона в pitch factor ---
 const semitonesToPitchFactor = (semitones: number): number => {
   return Math.pow(2, semitones / 12);
@@ -488,7 +505,10 @@ export default function Song() {
       try {
         const res = await fetch(`/images?track_folder=${encodeURIComponent(downloads.images_url)}`);
         const data = await res.json();
-        if (Array.isArray(data.images)) {
+        if (Array.isArray(data.renditions) && data.renditions.length > 0 && data.renditions.length === data.images?.length) {
+          const neededWidth = window.innerWidth * (window.devicePixelRatio || 1);
+          setSlideshowImages(data.renditions.map((r: Record<string, ImageRendition | string>) => pickRendition(r, neededWidth)));
+        } else if (Array.isArray(data.images)) {
           setSlideshowImages(data.images);
         } else {
           console.error('Song.tsx: Неверный формат данных с сервера:', data);
@@ -7,6 +7,7 @@ export interface ProcessTrackResponse {
   };
   analysis?: {
     key: string;
+    key_confidence?: number;
   };
   downloads?: {
     vocals_url: string;
@@ -17,6 +18,17 @@ export interface ProcessTrackResponse {
   };
 }
 
+interface JobResponse {
+  job_id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  result?: ProcessTrackResponse;
+  error?: string;
+}
+
+const POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
 export async function processTrack(trackId: string): Promise<ProcessTrackResponse> {
   try {
     const response = await fetch('/process-track', {
@@ -33,10 +45,25 @@ export async function processTrack(trackId: string): Promise<ProcessTrackRespons
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
-    const data = await response.json();
-    console.log('Response data:', data);
+    const { job_id } = await response.json();
+
+    // Обработка идёт в фоне — опрашиваем статус задачи
+    while (true) {
+      const jobResponse = await fetch(`/jobs/${job_id}`);
+      if (!jobResponse.ok) {
+        throw new Error(`HTTP error! status: ${jobResponse.status}`);
+      }
+      const job: JobResponse = await jobResponse.json();
 
-    return data;
+      if (job.status === 'done' && job.result) {
+        console.log('Response data:', job.result);
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error ?? 'Job failed');
+      }
+      await sleep(POLL_INTERVAL_MS);
+    }
   } catch (err) {
     console.error('Error processing track:', err);
     return { status: 'error' };
@@ -2,6 +2,7 @@ import whisperx
 import torch
 import logging
 from pathlib import Path
+from model_registry import ModelKey, get_registry
 logger = logging.getLogger(__name__)
 
 class ASRService:
@@ -16,7 +17,10 @@ class ASRService:
             logger.error('Incompatible device!')
         logger.info(f'Using device {self._device}')
         self._batch_size = 16
-        self._model = whisperx.load_model(model, device, compute_type=self._compute_type)
+        self._model = get_registry().get(
+            ModelKey(f"whisperx/{model}", self._device, self._compute_type),
+            lambda: whisperx.load_model(model, self._device, compute_type=self._compute_type),
+        )
         
     def transcribe(self, audio):
         result =self._model.transcribe(audio, batch_size=self._batch_size)
@@ -1,18 +1,138 @@
 import logging
 logger = logging.getLogger(__name__)
+import os
+import math
+import resource
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import whisperx
 import torch
 from typing import List, Dict
+from model_registry import ModelKey, get_registry
+
+# Сколько процессов выравнивают сегменты на CPU; 1 — одним вызовом whisperx.align.
+# Каждый процесс держит свою копию модели выравнивания, поэтому по умолчанию их не больше 4
+ALIGN_WORKERS = int(os.getenv("ALIGN_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Меньше сегментов на процесс не окупает передачу аудио и результата: потоковая пачка
+# из ALIGN_STREAM_BATCH (8) сегментов делится на 4 процесса
+ALIGN_MIN_GROUP = 2
+# Запас аудио вокруг группы сегментов, секунды
+ALIGN_PADDING = 1
+SAMPLE_RATE = 16000
+
+# Модель выравнивания в процессе пула
+_worker_model = None
+# Блокировки на модель (устройство, язык) для выравнивания в основном процессе
+_model_locks: Dict[tuple, threading.Lock] = {}
+_model_locks_lock = threading.Lock()
+
+
+def _group_segments(segments: List[Dict], n: int) -> List[List[Dict]]:
+    # Подряд идущие сегменты делятся на n групп примерно равной длительности
+    durations = np.array([max(seg["end"] - seg["start"], 0.0) for seg in segments])
+    bounds = np.cumsum(durations)
+    cuts = np.searchsorted(bounds, bounds[-1] * np.arange(1, n) / n, side="right")
+    edges = [0, *sorted(set(int(c) for c in cuts if 0 < c < len(segments))), len(segments)]
+    return [segments[a:b] for a, b in zip(edges, edges[1:])]
+
+
+def _shift(segments: List[Dict], offset: float) -> List[Dict]:
+    shifted = []
+    for seg in segments:
+        seg = dict(seg)
+        for field in ("start", "end"):
+            if field in seg:
+                seg[field] = round(seg[field] + offset, 3)
+        if "words" in seg:
+            seg["words"] = [
+                {k: round(v + offset, 3) if k in ("start", "end") else v for k, v in word.items()}
+                for word in seg["words"]
+            ]
+        shifted.append(seg)
+    return shifted
+
+
+def _group_window(segments: List[Dict], audio_length: int):
+    # Аудио режется с целой секунды, чтобы номера сэмплов в куске совпадали с номерами
+    # во всём треке и результат не отличался от последовательного
+    offset = max(0, math.floor(segments[0]["start"] - ALIGN_PADDING))
+    end = min(audio_length, math.ceil(segments[-1]["end"] + ALIGN_PADDING) * SAMPLE_RATE)
+    return offset, end
+
+
+def _init_worker(language: str):
+    # Выполняется при запуске процесса пула
+    global _worker_model
+    torch.set_num_threads(1)
+    _worker_model = whisperx.load_align_model(language_code=language, device="cpu")
+
+
+def _align_group(segments: List[Dict], audio: np.ndarray, offset: int) -> List[Dict]:
+    # Выполняется в процессе пула: audio — кусок трека, начинающийся с offset секунды
+    model_a, metadata = _worker_model
+    aligned = whisperx.align(
+        _shift(segments, -offset),
+        model_a,
+        metadata,
+        audio,
+        "cpu",
+        return_char_alignments=False
+    )
+    return _shift(aligned["segments"], offset)
+
+
+def _worker_footprint():
+    # Выполняется в процессе пула после загрузки модели: (pid, пиковый RSS в байтах)
+    return os.getpid(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _start_pool(language: str, workers: int) -> ProcessPoolExecutor:
+    # spawn, а не fork: пул может создаваться, когда в сервере уже работают потоки
+    return ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(language,),
+    )
+
+
+def _pool_footprint(pool: ProcessPoolExecutor, workers: int) -> int:
+    # Процессы запускаются по мере отправки задач: прогрев заодно загружает модель во всех,
+    # память тех, до кого прогрев не дошёл, считается по среднему
+    footprints = dict(future.result() for future in [pool.submit(_worker_footprint) for _ in range(workers)])
+    return sum(footprints.values()) * workers // len(footprints)
+
+
+def _get_pool(language: str, workers: int) -> ProcessPoolExecutor:
+    """
+    Пул выравнивания для языка хранится в реестре моделей, как и остальные модели: копии модели
+    во всех процессах учитываются в бюджете памяти, а при вытеснении пул останавливается
+    (начатые задачи дорабатывают).
+    """
+    return get_registry().get(
+        ModelKey("whisperx/align-pool", "cpu", language=language),
+        lambda: _start_pool(language, workers),
+        size=lambda pool: _pool_footprint(pool, workers),
+        release=lambda pool: pool.shutdown(wait=False),
+    )
+
+
+def _model_lock(device: str, language: str) -> threading.Lock:
+    with _model_locks_lock:
+        return _model_locks.setdefault((device, language), threading.Lock())
 
 
 class Aligner:
-    def __init__(self, device: str):
+    def __init__(self, device: str, workers: int = ALIGN_WORKERS):
         if device=='cuda' and torch.cuda.is_available():
             self._device = device
         elif device=='cpu':
             self._device = device
         else:
             logger.error('Incompatible device!')
+        self._workers = workers
 
     def align(
         self,
@@ -20,17 +140,47 @@ class Aligner:
         segments: List[Dict],
         language: str,
     ) -> List[Dict]:
-        model_a, metadata = whisperx.load_align_model(
-            language_code=language,
-            device=self._device,
-        )
-        aligned = whisperx.align(
-            segments,
-            model_a,
-            metadata,
-            audio,
-            self._device,
-            return_char_alignments=False
+        # Процессы пула считают на CPU со своей копией модели; на GPU модель одна и считает весь батч сразу
+        groups = min(self._workers, len(segments) // ALIGN_MIN_GROUP)
+        if self._device == 'cpu' and groups > 1:
+            return self._align_parallel(audio, segments, language, groups)
+        model_a, metadata = get_registry().get(
+            ModelKey("whisperx/align", self._device, language=language),
+            lambda: whisperx.load_align_model(language_code=language, device=self._device),
         )
+        # Модель общая для всех запросов с этим языком: блокируется только она
+        with _model_lock(self._device, language):
+            aligned = whisperx.align(
+                segments,
+                model_a,
+                metadata,
+                audio,
+                self._device,
+                return_char_alignments=False
+            )
 
         return aligned["segments"]
+
+    def _align_parallel(self, audio, segments: List[Dict], language: str, n: int) -> List[Dict]:
+        """
+        Сегменты делятся на n подряд идущих групп, каждая выравнивается в процессе общего пула
+        по своему куску аудио (в процесс передаётся только кусок). Результаты склеиваются
+        в исходном порядке. Одновременные задачи делят пул, не дожидаясь друг друга целиком.
+        """
+        groups = _group_segments(segments, n)
+        windows = [_group_window(group, len(audio)) for group in groups]
+
+        def submit(pool):
+            return [
+                pool.submit(_align_group, group, audio[offset * SAMPLE_RATE:end], offset)
+                for group, (offset, end) in zip(groups, windows)
+            ]
+
+        try:
+            futures = submit(_get_pool(language, self._workers))
+        except RuntimeError:
+            # Пул вытеснили из реестра между получением и отправкой задач: берётся новый
+            futures = submit(_get_pool(language, self._workers))
+        results = [future.result() for future in futures]
+        logger.info(f'Aligned {len(segments)} segments in {len(groups)} processes')
+        return [seg for group in results for seg in group]
@@ -8,11 +8,17 @@ logger = logging.getLogger(__name__)
 
 class AudioLoader:
     """
-    Загружает аудиофайл и приводит его к формату (mono, 16kHz)
+    Загружает аудиофайл и приводит его к формату (mono, 16kHz).
+    Вместо пути можно передать уже декодированный буфер (separation.AudioBuffer) —
+    тогда файл повторно не читается.
     """
-    
-    def __init__(self, path: str, target_sr: int = 16000):
+
+    def __init__(self, path, target_sr: int = 16000):
         self.target_sr = target_sr
+        self._buffer = None
+        if hasattr(path, "view"):
+            self._buffer = path
+            return
         self._path = Path(path)
         if not self._path.exists():
             logger.error(f'Audio file not found: {path}')
@@ -22,7 +28,9 @@ class AudioLoader:
         """
         Загружает аудио
         """
+        if self._buffer is not None:
+            return self._buffer.view(self.target_sr, channels=1)
         path = str(self._path)
-        audio = whisperx.load_audio(path)
+        audio = whisperx.load_audio(path, sr=self.target_sr)
         logger.info(f'Successfully loaded audio {path}!')
-        return audio
\ No newline at end of file
+        return audio
@@ -1,10 +1,15 @@
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
+import numpy as np
 import whisperx
 from .Aligner import *
 from .LyricsProvider import *
 from .ASRService import *
 from .AudioLoader import *
 from .LLMTextEditor import *
+from .LyricsMatcher import LyricsMatcher
+
+# Сколько исправленных сегментов набирается из потока LLM перед очередным выравниванием
+ALIGN_STREAM_BATCH = 8
 
 
 class KaraokeProcessor:
@@ -14,7 +19,7 @@ class KaraokeProcessor:
         audio_loader : AudioLoader,
         lyrics_provider : LyricsProvider | None,
         text_editor : LLMTextEditor, 
-        asr_service : ASRService,
+        asr_service : ASRService | None,
         aligner : Aligner,
     ):
         self.audio_loader = audio_loader
@@ -24,18 +29,106 @@ class KaraokeProcessor:
         self.aligner = aligner
         self._text = ""
 
-    def process(self) -> Dict:
+    @property
+    def has_synced_lyrics(self) -> bool:
+        return self.lyrics_provider is not None and self.lyrics_provider.is_synced
+
+    def transcribe(self) -> Tuple[np.ndarray, Dict]:
         audio = self.audio_loader.load()
+        if self.has_synced_lyrics:
+            # Есть LRC: строки уже размечены по времени, распознавание не нужно
+            duration = len(audio) / self.audio_loader.target_sr
+            asr_result = {
+                "segments": self.lyrics_provider.segments(duration),
+                "language": self.lyrics_provider.language(),
+                "synced": True,
+            }
+            return audio, asr_result
         asr_result = self.asr_service.transcribe(audio)
+        return audio, asr_result
+
+    def edit(self, asr_result: Dict) -> List[Dict]:
+        if asr_result.get("synced"):
+            # Текст из LRC уже правильный, исправлять его через LLM не нужно
+            self._text = "".join(seg["text"] + '\n' for seg in asr_result["segments"])
+            return asr_result["segments"]
        # print(json.dumps(asr_result["segments"]))
         if self.lyrics_provider is not None:
-            asr_correct_result = self.text_editor.edit(json.dumps(asr_result["segments"]), self.lyrics_provider.process_text())
+            asr_correct_result = self.correct(asr_result["segments"], self.lyrics_provider.process_text())
         else:
-            asr_correct_result = self.text_editor.edit(json.dumps(asr_result["segments"]), None)
-        _text = []
+            asr_correct_result = self.text_editor.edit(asr_result["segments"], None)
+        self._text = ""
         for seg in asr_correct_result:
             self._text += seg["text"] + '\n'
-        aligned_segs = self.aligner.align(audio, asr_correct_result, asr_result["language"])
+        return asr_correct_result
+
+    def correct(self, segments: List[Dict], reference: str) -> List[Dict]:
+        """
+        Текст сегментов заменяется словами эталона локальным выравниванием,
+        LLM получает только сегменты, которые сопоставить не удалось.
+        """
+        matched, unreliable = LyricsMatcher(reference).match(segments)
+        if not unreliable:
+            return matched
+        fixed = self.text_editor.edit([segments[i] for i in unreliable], reference)
+        # LLM может удалить пустые сегменты, поэтому исправления сопоставляются по времени
+        fixed_text = {(seg["start"], seg["end"]): seg["text"] for seg in fixed}
+        dropped = set()
+        for i in unreliable:
+            key = (matched[i]["start"], matched[i]["end"])
+            if key in fixed_text:
+                matched[i]["text"] = fixed_text[key]
+            else:
+                dropped.add(i)
+        return [seg for i, seg in enumerate(matched) if i not in dropped]
+
+    def align(self, audio, segments: List[Dict], language: str) -> List[Dict]:
+        return self.aligner.align(audio, segments, language)
+
+    def edit_batches(self, asr_result: Dict, batch_size: int = ALIGN_STREAM_BATCH) -> Iterator[List[Dict]]:
+        """
+        Исправленные сегменты пачками по batch_size по мере того, как их отдаёт LLM, чтобы
+        выравнивание шло внахлёст с генерацией. Для LRC и эталонного текста LLM почти не нужна —
+        там все сегменты приходят одной пачкой.
+        """
+        if asr_result.get("synced") or self.lyrics_provider is not None:
+            yield self.edit(asr_result)
+            return
+        edited, batch = [], []
+        for seg in self.text_editor.edit_stream(asr_result["segments"]):
+            edited.append(seg)
+            batch.append(seg)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        self._text = "".join(seg["text"] + '\n' for seg in edited)
+
+    def align_batches(self, audio, batches: Iterable[List[Dict]], language: str) -> List[Dict]:
+        aligned = []
+        for batch in batches:
+            aligned.extend(self.align(audio, batch, language))
+        return aligned
+
+    def edit_and_align(self, audio, asr_result: Dict, batch_size: int = ALIGN_STREAM_BATCH) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Правка и выравнивание внахлёст в одном потоке: каждая пачка выравнивается, пока LLM
+        генерирует следующую.
+        """
+        edited = []
+
+        def collect():
+            for batch in self.edit_batches(asr_result, batch_size):
+                edited.extend(batch)
+                yield batch
+
+        aligned = self.align_batches(audio, collect(), asr_result["language"])
+        return edited, aligned
+
+    def process(self) -> Dict:
+        audio, asr_result = self.transcribe()
+        _, aligned_segs = self.edit_and_align(audio, asr_result)
         return aligned_segs
         
     def create_image_prompts(self, num: int) -> List:
@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "data/llm_cache")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+# LLM_CACHE=0 — все запросы идут в модель, кэш не читается и не пополняется
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+
+class LLMCache:
+    """
+    Ответы LLM на диске, по файлу на запрос. Ключ — sha256 от модели, параметров генерации
+    и сообщений (шаблон промпта, входные сегменты, эталонный текст).
+    При превышении max_bytes удаляются файлы, к которым дольше всего не обращались (по mtime).
+    """
+
+    def __init__(self, directory: str = LLM_CACHE_DIR, max_bytes: int = LLM_CACHE_MAX_MB << 20, enabled: bool = LLM_CACHE_ENABLED):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, temperature: float, max_tokens: int, messages: List[Dict]) -> str:
+        payload = json.dumps([model, temperature, max_tokens, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any | None:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            value = json.loads(path.read_text(encoding="utf-8"))
+            # mtime — время последнего обращения, по нему идёт вытеснение
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._lock:
+            # Перезапись ключа заменяет файл: его прежний размер из учёта вычитается
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.directory.glob("*/*.json"))
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Удаляем самые давно использованные файлы, пока кэш не станет меньше 90% лимита
+        files = []
+        for p in self.directory.glob("*/*.json"):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, p))
+        files.sort()
+        self._size = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, p in files:
+            if self._size <= target:
+                break
+            p.unlink(missing_ok=True)
+            self._size -= size
+            removed += 1
+        logger.info(f"LLM cache: evicted {removed} entries, {self._size} bytes left")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
@@ -3,13 +3,7 @@ edit_prompt = """
 
 Тебе даётся текст песни в виде списка сегментов:
 
-[
-  {
-    "text": "текст сегмента",
-    "start": start_time,
-    "end": end_time
-  }
-]
+[{"id":0,"text":"текст сегмента"},{"id":1,"text":"текст сегмента"}]
 
 Твоя задача:
 1. Исправить опечатки и орфографические ошибки.
@@ -23,10 +17,10 @@ edit_prompt = """
    - не добавлять новые поля,
    - не удалять существующие сегменты, кроме случаев пустого текста или некорректных символов,
    - не менять порядок сегментов,
-   - не изменять значения `start` и `end`.
+   - не изменять значения `id`.
 
 Вывод:
-- Вернуть ТОЛЬКО исправленный список сегментов.
+- Вернуть ТОЛЬКО исправленный список сегментов в том же формате [{"id":...,"text":...}].
 - Без комментариев, объяснений, предупреждений или любого дополнительного текста.
 - Разрешены только исправления ошибок и пунктуации!
 """
@@ -38,13 +32,7 @@ correct_prompt = """
 1. Эталонный, полностью правильный текст песни в виде простого текста.
 2. Текущий текст песни в виде списка сегментов:
 
-[
-  {
-    "text": "текст сегмента",
-    "start": start_time,
-    "end": end_time
-  }
-]
+[{"id":0,"text":"текст сегмента"},{"id":1,"text":"текст сегмента"}]
 
 Эталонный текст является единственным источником истины.
 
@@ -57,7 +45,7 @@ correct_prompt = """
 1. Строго сохранить структуру и формат списка сегментов.
 2. Не добавлять и не удалять сегменты.
 3. Не менять порядок сегментов.
-4. Не изменять значения `start` и `end`.
+4. Не изменять значения `id`.
 5. В каждом сегменте должно остаться ТОЧНО то же количество слов, что и было.
 6. Запрещено:
    - перефразирование,
@@ -69,7 +57,7 @@ correct_prompt = """
 9. Если сегмент содержит некорректные символы или пустой текст, он должен быть удалён.
 
 Вывод:
-- Вернуть ТОЛЬКО исправленный список сегментов.
+- Вернуть ТОЛЬКО исправленный список сегментов в том же формате [{"id":...,"text":...}].
 - Без комментариев, объяснений, предупреждений или любого дополнительного текста.
 """
 
@@ -117,10 +105,9 @@ json_schema = {
     "items": {
         "type": "object",
         "properties": {
-            "start": {"type": "number", "description": "Время начала сегмента в секундах"},
-            "end": {"type": "number", "description": "Время окончания сегмента в секундах"},
+            "id": {"type": "integer", "description": "Номер сегмента во входном списке"},
             "text": {"type": "string", "description": "Текст сегмента"}
         },
-        "required": ["start", "end", "text"]
+        "required": ["id", "text"]
     }
 }
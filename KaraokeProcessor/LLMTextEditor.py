@@ -1,6 +1,12 @@
 import openai
 import json
-from .LLMPrompt import edit_prompt, correct_prompt, image_prompt
+import asyncio
+import contextlib
+import threading
+from typing import AsyncIterator, Dict, Iterator, List
+from .LLMPrompt import edit_prompt, correct_prompt, image_prompt, json_schema
+from .LLMCache import LLMCache, get_llm_cache
+from outbound import BATCH, INTERACTIVE, OutboundError, get_outbound
 from dotenv import load_dotenv
 import os
 import logging
@@ -16,71 +22,371 @@ YANDEX_CLOUD_FOLDER = os.getenv("YANDEX_CLOUD_FOLDER")
 YANDEX_CLOUD_MODEL = os.getenv("YANDEX_CLOUD_MODEL")
 YANDEX_CLOUD_BASE_URL = os.getenv("YANDEX_CLOUD_BASE_URL")
 
-class LLMTextEditor:
+# Ограничение на длину ответа модели; окно сегментов подбирается так, чтобы ответ в него помещался
+EDIT_MAX_TOKENS = 2000
+# Параметры генерации входят в ключ кэша: в запрос и в ключ идут одни и те же значения
+EDIT_TEMPERATURE = 0.1
+IMAGE_PROMPT_TEMPERATURE = 0.1
+IMAGE_PROMPT_MAX_TOKENS = 2000
+EDIT_WINDOW_TOKENS = int(os.getenv("EDIT_WINDOW_TOKENS", "1200"))
+# Сколько раз переспрашивается окно с невалидным ответом; число одновременных запросов
+# и повторы при сетевых ошибках и квотах задаются лимитами сервиса "llm" в outbound
+EDIT_RETRIES = 2
+# Сколько готовых сегментов edit_stream держит впереди вызывающего кода
+EDIT_STREAM_BUFFER = 16
+# Грубая оценка: в среднем около трёх символов JSON на токен
+CHARS_PER_TOKEN = 3
+
+
+def _make_llm_client():
+    # Один клиент (и пул соединений) на процесс, создаётся в event loop планировщика outbound
+    return openai.AsyncOpenAI(
+        api_key=YANDEX_CLOUD_API_KEY,
+        base_url=YANDEX_CLOUD_BASE_URL,
+        project=YANDEX_CLOUD_FOLDER
+    )
+
+
+def _matches_schema(value, schema: Dict) -> bool:
+    # Проверка по подмножеству JSON Schema, которое используется в LLMPrompt.json_schema
+    expected = schema.get("type")
+    if expected == "array":
+        return isinstance(value, list) and all(_matches_schema(item, schema.get("items", {})) for item in value)
+    if expected == "object":
+        return (
+            isinstance(value, dict)
+            and all(key in value for key in schema.get("required", []))
+            and all(_matches_schema(value[key], sub) for key, sub in schema.get("properties", {}).items() if key in value)
+        )
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == "string":
+        return isinstance(value, str)
+    return True
+
+
+def compact_payload(window: List[Dict]) -> str:
+    """
+    Окно сегментов в том виде, в каком оно уходит в модель: только номер в окне и текст.
+    Время и остальные поля сегмента модель не видит и испортить не может.
+    """
+    return json.dumps([{"id": i, "text": seg["text"]} for i, seg in enumerate(window)], ensure_ascii=False, separators=(",", ":"))
+
+
+def split_windows(segments: List[Dict], max_tokens: int = EDIT_WINDOW_TOKENS) -> List[List[Dict]]:
+    """
+    Делит сегменты на подряд идущие окна, ответ на каждое из которых укладывается в max_tokens.
+    """
+    windows, window, size = [], [], 0
+    for seg in segments:
+        seg_tokens = len(json.dumps({"id": len(window), "text": seg["text"]}, ensure_ascii=False)) // CHARS_PER_TOKEN + 1
+        if window and size + seg_tokens > max_tokens:
+            windows.append(window)
+            window, size = [], 0
+        window.append(seg)
+        size += seg_tokens
+    if window:
+        windows.append(window)
+    return windows
+
+
+def parse_edits(response_text: str, window: List[Dict]) -> List[Dict] | None:
+    """
+    Ответ модели -> список {"id", "text"} или None, если он не проходит проверку: не JSON,
+    не соответствует json_schema или содержит чужие или переставленные id.
+    """
+    text = response_text.strip()
+    if text.startswith("```"):
+        # Модель иногда оборачивает ответ в markdown-блок
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not _matches_schema(parsed, json_schema):
+        return None
+    # Сегменты можно только удалять (пустые), но не придумывать и не переставлять
+    ids = [item["id"] for item in parsed]
+    if any(b <= a for a, b in zip(ids, ids[1:])) or any(not 0 <= i < len(window) for i in ids):
+        return None
+    return [{"id": item["id"], "text": item["text"]} for item in parsed]
+
+
+def rebuild_segments(window: List[Dict], edits: List[Dict]) -> List[Dict]:
+    # Время сегментов берётся из распознавания, от модели — только текст
+    return [{"start": window[item["id"]]["start"], "end": window[item["id"]]["end"], "text": item["text"]} for item in edits]
+
+
+class SegmentStreamParser:
+    """
+    Инкрементальный разбор JSON-массива сегментов из потока ответа модели.
+    feed() принимает очередной кусок текста и возвращает объекты, закрывшиеся в нём.
+    Текст до открывающей "[" (например, ```json) пропускается.
+    """
+
     def __init__(self):
-        try:
-            if not all([YANDEX_CLOUD_API_KEY, YANDEX_CLOUD_FOLDER, YANDEX_CLOUD_MODEL, YANDEX_CLOUD_BASE_URL]):
-                raise ValueError("Не все переменные окружения заданы!")
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        completed = []
+        for char in chunk:
+            if self.closed:
+                break
+            if self._depth < 2:
+                # Уровень массива: ждём "[" и "{", разделители пропускаем
+                if char == "[" and self._depth == 0:
+                    self._depth = 1
+                elif char == "{" and self._depth == 1:
+                    self._depth = 2
+                    self._current = [char]
+                elif char == "]" and self._depth == 1:
+                    self.closed = True
+                continue
+            self._current.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    completed.append(json.loads("".join(self._current)))
+                    self._current = []
+        return completed
+
+
+class LLMTextEditor:
+    def __init__(self, cache: LLMCache | None = None, use_cache: bool = True, priority: int = INTERACTIVE):
+        # use_cache=False — запросы всегда идут в модель (например, чтобы получить новый вариант ответа)
+        self.cache = (cache or get_llm_cache()) if use_cache else None
+        # Правка текста на критическом пути обработки трека, промпты для картинок — фоновая работа
+        self.priority = priority
+        if not all([YANDEX_CLOUD_API_KEY, YANDEX_CLOUD_FOLDER, YANDEX_CLOUD_MODEL, YANDEX_CLOUD_BASE_URL]):
+            logger.error("Ошибка инициализации клиента: не все переменные окружения заданы!")
+            raise ValueError("Не все переменные окружения заданы!")
+        self.outbound = get_outbound()
+
+    async def _complete(self, messages: List[Dict]) -> str:
+        response = await self.outbound.run(
+            "llm",
+            _make_llm_client,
+            lambda client: client.chat.completions.create(
+                model=YANDEX_CLOUD_MODEL,
+                messages=messages,
+                stream=False,
+                temperature=EDIT_TEMPERATURE,
+                max_tokens=EDIT_MAX_TOKENS
+            ),
+            self.priority,
+        )
+        return response.choices[0].message.content
+
+    async def _stream_completion(self, messages: List[Dict]) -> AsyncIterator[str]:
+        # Поток читается в loop планировщика (там живёт клиент), куски текста передаются в текущий loop
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
 
-            self.client = openai.OpenAI(
-                api_key=YANDEX_CLOUD_API_KEY,
-                base_url=YANDEX_CLOUD_BASE_URL,
-                project=YANDEX_CLOUD_FOLDER
+        async def request(client):
+            stream = await client.chat.completions.create(
+                model=YANDEX_CLOUD_MODEL,
+                messages=messages,
+                stream=True,
+                temperature=EDIT_TEMPERATURE,
+                max_tokens=EDIT_MAX_TOKENS
             )
-            logger.info("Клиент LLM успешно инициализирован.")
-        except Exception as e:
-            logger.error(f"Ошибка инициализации клиента: {e}")
-            raise
+            async for chunk in stream:
+                if chunk.choices:
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.choices[0].delta.content or "")
 
-    def edit(self, data: str, reference: str | None = None):
+        # Без повторов: часть ответа уже могла уйти дальше, остаток окна доправляется отдельным запросом
+        future = asyncio.ensure_future(self.outbound.run("llm", _make_llm_client, request, self.priority, retries=0))
+        future.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while (text := await chunks.get()) is not None:
+                yield text
+            await future
+        finally:
+            future.cancel()
+
+    def _messages(self, data: str, reference: str | None):
         if reference is None:
-            messages = [
+            return [
                 {"role": "system", "content": edit_prompt},
                 {"role": "user", "content": data}
             ]
-        else:
-            messages = [
-                {"role": "system", "content": correct_prompt},
-                {"role": "user", "content": data + '\n\n' + reference}
-            ]
+        return [
+            {"role": "system", "content": correct_prompt},
+            {"role": "user", "content": data + '\n\n' + reference}
+        ]
+
+    async def _edit_window(self, window: List[Dict], reference: str | None) -> List[Dict]:
+        messages = self._messages(compact_payload(window), reference)
+        cache_key = LLMCache.key(YANDEX_CLOUD_MODEL, EDIT_TEMPERATURE, EDIT_MAX_TOKENS, messages)
+        if self.cache is not None and (cached := self.cache.get(cache_key)) is not None:
+            return rebuild_segments(window, cached)
+        for attempt in range(1 + EDIT_RETRIES):
+            try:
+                response_text = await self._complete(messages)
+            except (openai.OpenAIError, OutboundError, AttributeError, IndexError) as e:
+                logger.warning(f"Ошибка запроса к модели (попытка {attempt + 1}): {e}")
+                continue
+            edits = parse_edits(response_text or "", window)
+            if edits is not None:
+                # В кэш попадают только прошедшие проверку ответы, без времени сегментов
+                if self.cache is not None:
+                    self.cache.put(cache_key, edits)
+                return rebuild_segments(window, edits)
+            logger.warning(f"Модель вернула невалидный ответ для окна из {len(window)} сегментов (попытка {attempt + 1})")
+        # Окно остаётся без правок, остальная песня не страдает
+        logger.error(f"Окно из {len(window)} сегментов не исправлено, используется исходный текст")
+        return [{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in window]
+
+    async def edit_async(self, segments: List[Dict], reference: str | None = None) -> List[Dict]:
+        """
+        Сегменты делятся на окна, окна исправляются параллельно (в пределах лимитов сервиса "llm"),
+        невалидные ответы переспрашиваются только для своего окна. Результат склеивается в исходном порядке.
+        """
+        segments = [{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in segments]
+        windows = split_windows(segments)
+        results = await asyncio.gather(*(self._edit_window(window, reference) for window in windows))
+        logger.info(f"Текст исправлен по {len(windows)} окнам")
+        if self.cache is not None:
+            logger.info(f"LLM cache: {self.cache.stats()}")
+        return [seg for window in results for seg in window]
+
+    def edit(self, data: str | List[Dict], reference: str | None = None) -> List[Dict]:
+        segments = json.loads(data) if isinstance(data, str) else data
+        return asyncio.run(self.edit_async(segments, reference))
+
+    async def _stream_window(self, window: List[Dict], reference: str | None, output: asyncio.Queue):
+        # Исправленные сегменты окна кладутся в output по мере генерации, в конце — None
+        messages = self._messages(compact_payload(window), reference)
+        cache_key = LLMCache.key(YANDEX_CLOUD_MODEL, EDIT_TEMPERATURE, EDIT_MAX_TOKENS, messages)
         try:
-            response = self.client.chat.completions.create(
-                model=YANDEX_CLOUD_MODEL,
-                messages=messages,
-                stream=False,
-                temperature=0.1,
-                max_tokens=2000
-            )
-        except Exception as e:
-            logger.error(f"Ошибка запроса к модели: {e}")
-            return None
+            if self.cache is not None and (cached := self.cache.get(cache_key)) is not None:
+                for seg in rebuild_segments(window, cached):
+                    await output.put(seg)
+                return
+            produced, position = [], 0
+            try:
+                parser = SegmentStreamParser()
+                async for text in self._stream_completion(messages):
+                    for item in parser.feed(text):
+                        # Те же проверки, что в parse_edits, но по одному сегменту
+                        if not _matches_schema(item, json_schema["items"]):
+                            raise ValueError(f"сегмент не соответствует схеме: {item}")
+                        if not position <= item["id"] < len(window):
+                            raise ValueError(f"чужой или переставленный id: {item}")
+                        position = item["id"] + 1
+                        edit = {"id": item["id"], "text": item["text"]}
+                        produced.append(edit)
+                        await output.put(rebuild_segments(window, [edit])[0])
+                if not parser.closed:
+                    raise ValueError("ответ оборвался до конца массива")
+            except (openai.OpenAIError, OutboundError, ValueError, AttributeError, IndexError) as e:
+                # Уже отданные сегменты не отзываются, остаток окна правится обычным запросом
+                logger.warning(f"Поток ответа для окна из {len(window)} сегментов прерван: {e}")
+                for seg in await self._edit_window(window[position:], reference):
+                    await output.put(seg)
+                return
+            if self.cache is not None:
+                self.cache.put(cache_key, produced)
+        finally:
+            await output.put(None)
 
+    async def edit_stream_async(self, segments: List[Dict], reference: str | None = None) -> AsyncIterator[Dict]:
+        """
+        Как edit_async, но исправленные сегменты отдаются по одному, как только модель закрыла объект.
+        Окна генерируются параллельно, а отдаются строго по порядку.
+        """
+        segments = [{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in segments]
+        windows = split_windows(segments)
+        outputs = [asyncio.Queue() for _ in windows]
+        tasks = [
+            asyncio.create_task(self._stream_window(window, reference, output))
+            for window, output in zip(windows, outputs)
+        ]
         try:
-            response_text = response.choices[0].message.content
-        except (AttributeError, IndexError) as e:
-            logger.error(f"Некорректная структура ответа: {e}")
-            return None
+            for output in outputs:
+                while (seg := await output.get()) is not None:
+                    yield seg
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def edit_stream(self, data: str | List[Dict], reference: str | None = None) -> Iterator[Dict]:
+        """
+        Синхронная обёртка над edit_stream_async: event loop крутится в отдельном потоке,
+        поэтому модель продолжает генерировать, пока вызывающий код обрабатывает полученные сегменты.
+        Вперёд генерируется не больше EDIT_STREAM_BUFFER сегментов; если вызывающий код перестал
+        читать (break, close, исключение), генерация отменяется и поток завершается.
+        """
+        segments = json.loads(data) if isinstance(data, str) else data
+        loop = asyncio.new_event_loop()
+        results = asyncio.Queue(maxsize=EDIT_STREAM_BUFFER)
+
+        async def pump():
+            try:
+                async with contextlib.aclosing(self.edit_stream_async(segments, reference)) as stream:
+                    async for seg in stream:
+                        await results.put(seg)
+            except Exception as e:
+                await results.put(e)
+            else:
+                await results.put(None)
 
-        # Проверка на валидный JSON
+        def stop():
+            task.cancel()
+            task.add_done_callback(lambda _: loop.stop())
+
+        task = loop.create_task(pump())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
         try:
-            parsed_data = json.loads(response_text)
-            return parsed_data
-        except json.JSONDecodeError:
-            print(response_text)
-            logger.warning(f"Модель вернула невалидный JSON, возвращаем сырой текст.")
-            return response_text
+            while (item := asyncio.run_coroutine_threadsafe(results.get(), loop).result()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            loop.call_soon_threadsafe(stop)
+            thread.join()
+            loop.close()
+
     def create_image_prompts(self, num: int, data: str):
         messages = [
                 {"role": "user", "content": image_prompt.format(n=num, data=data)}
             ]
-        
+        cache_key = LLMCache.key(YANDEX_CLOUD_MODEL, IMAGE_PROMPT_TEMPERATURE, IMAGE_PROMPT_MAX_TOKENS, messages)
+        if self.cache is not None and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
         try:
-            response = self.client.chat.completions.create(
-                model=YANDEX_CLOUD_MODEL,
-                messages=messages,
-                stream=False,
-                temperature=0.1,
-                max_tokens=2000
+            # Промпты для картинок не на критическом пути: уступают очередь правке текста
+            response = self.outbound.call(
+                "llm",
+                _make_llm_client,
+                lambda client: client.chat.completions.create(
+                    model=YANDEX_CLOUD_MODEL,
+                    messages=messages,
+                    stream=False,
+                    temperature=IMAGE_PROMPT_TEMPERATURE,
+                    max_tokens=IMAGE_PROMPT_MAX_TOKENS
+                ),
+                BATCH,
             )
         except Exception as e:
             logger.error(f"Ошибка запроса к модели: {e}")
@@ -92,4 +398,6 @@ class LLMTextEditor:
             if len(prompt.strip()) != 0:
                 clear_plist.append(prompt)
        # print(clear_plist)
+        if self.cache is not None and clear_plist:
+            self.cache.put(cache_key, clear_plist)
         return clear_plist
\ No newline at end of file
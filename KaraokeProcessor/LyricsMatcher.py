@@ -0,0 +1,225 @@
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ширина полосы DP (в словах) вокруг диагонали, растянутой под соотношение длин текстов
+MATCH_BAND = 32
+# Средняя стоимость на слово, выше которой сегмент отдаётся на исправление LLM
+MATCH_THRESHOLD = 0.4
+# Цепочка слов эталона без пары длиннее этого считается не распознанной (проигрыш, бэк-вокал) и не вставляется
+MAX_INSERTED_WORDS = 3
+# Доля отличающихся букв, начиная с которой слова считаются разными
+WORD_CUTOFF = 0.5
+# Замена разных слов дороже вставки или удаления, но дешевле их пары:
+# иначе DP охотно сопоставляет галлюцинации whisper с пропущенными словами эталона
+MISMATCH_COST = 1.5
+
+_WORD_PATTERN = re.compile(r"[^\w']+")
+_MATCH, _DELETE, _INSERT = 0, 1, 2
+
+
+def normalize_word(word: str) -> str:
+    return _WORD_PATTERN.sub("", word.lower()).replace("ё", "е")
+
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    Расстояние Левенштейна, бит-параллельный алгоритм Майерса (Hyyrö): одна итерация на букву b.
+    """
+    if not a:
+        return len(b)
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, score = full, 0, len(a)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+
+@lru_cache(maxsize=65536)
+def word_distance(a: str, b: str) -> float:
+    """
+    Нормированное расстояние Левенштейна между словами: 0 — совпадают, MISMATCH_COST — разные слова
+    (всё, что дальше WORD_CUTOFF).
+    """
+    if a == b:
+        return 0.0
+    longest = max(len(a), len(b))
+    if not a or not b or abs(len(a) - len(b)) > WORD_CUTOFF * longest:
+        return MISMATCH_COST
+    distance = levenshtein(a, b) / longest
+    return distance if distance <= WORD_CUTOFF else MISMATCH_COST
+
+
+def tokenize_reference(reference: str) -> List[Tuple[str, str, bool]]:
+    """
+    Эталонный текст -> [(слово как в тексте, нормализованное слово, начинает ли слово строку)].
+    Отдельно стоящая пунктуация («—», «...») приклеивается к предыдущему слову.
+    """
+    tokens = []
+    for line in reference.splitlines():
+        line_start = True
+        for raw in line.split():
+            norm = normalize_word(raw)
+            if norm:
+                tokens.append((raw, norm, line_start))
+                line_start = False
+            elif tokens:
+                tokens[-1] = (tokens[-1][0] + " " + raw, *tokens[-1][1:])
+    return tokens
+
+
+def banded_alignment(source: List[str], target: List[str], band: int = MATCH_BAND) -> List[Tuple[int | None, int | None, float]]:
+    """
+    Выравнивание двух последовательностей слов по редакционному расстоянию в полосе вокруг диагонали.
+    Замена стоит word_distance, вставка и удаление — 1.
+
+    Returns:
+        [(индекс в source или None, индекс в target или None, стоимость)] по порядку.
+    """
+    n, m = len(source), len(target)
+    cost = np.full((n + 1, m + 1), np.inf)
+    move = np.full((n + 1, m + 1), _INSERT, dtype=np.int8)
+    # Полоса расширяется на разницу длин, чтобы из неё всегда был путь в (n, m)
+    width = band + abs(n - m)
+
+    def columns(i):
+        center = round(i * m / n) if n else 0
+        return max(0, center - width), min(m, center + width)
+
+    cost[0, : columns(0)[1] + 1] = np.arange(columns(0)[1] + 1)
+    for i in range(1, n + 1):
+        lo, hi = columns(i)
+        j = np.arange(lo, hi + 1)
+        word = source[i - 1]
+        # Удаление (сверху) или замена (по диагонали) ...
+        best = cost[i - 1, lo : hi + 1] + 1
+        step = np.full(len(j), _DELETE, dtype=np.int8)
+        first = 1 if lo == 0 else 0
+        diagonal = cost[i - 1, lo - 1 + first : hi] + [word_distance(word, target[k]) for k in range(lo - 1 + first, hi)]
+        better = diagonal < best[first:]
+        best[first:][better] = diagonal[better]
+        step[first:][better] = _MATCH
+        # ... затем цепочки вставок слева: row[j] = min(best[k] + j - k) по k <= j.
+        # best - j + j не всегда равно best в float, поэтому вставка засчитывается, только если она
+        # заметно дешевле: иначе обратный проход уходит с пути, по которому считалась стоимость
+        chain = np.minimum.accumulate(best - j) + j
+        insert = chain < best - 1e-9
+        row = np.where(insert, chain, best)
+        step[insert] = _INSERT
+        cost[i, lo : hi + 1] = row
+        move[i, lo : hi + 1] = step
+
+    path = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        step = move[i, j] if i > 0 else _INSERT
+        if step == _MATCH:
+            path.append((i - 1, j - 1, word_distance(source[i - 1], target[j - 1])))
+            i, j = i - 1, j - 1
+        elif step == _DELETE:
+            path.append((i - 1, None, 1.0))
+            i -= 1
+        else:
+            path.append((None, j - 1, 1.0))
+            j -= 1
+    path.reverse()
+    return path
+
+
+class LyricsMatcher:
+    """
+    Переписывает текст сегментов распознавания словами эталонного текста песни без обращения к LLM.
+    Слова whisper выравниваются со словами эталона (banded_alignment), каждый сегмент получает
+    слова эталона, сопоставленные его словам. Сегменты, где выравнивание дорогое (много несовпадений),
+    помечаются как ненадёжные — их имеет смысл отдать LLM.
+    """
+
+    def __init__(self, reference: str, band: int = MATCH_BAND, threshold: float = MATCH_THRESHOLD):
+        self.reference = tokenize_reference(reference)
+        self.band = band
+        self.threshold = threshold
+
+    def match(self, segments: List[Dict]) -> Tuple[List[Dict], List[int]]:
+        """
+        Returns:
+            Сегменты {"start", "end", "text"} с текстом из эталона и индексы ненадёжных сегментов
+            (их текст оставлен как есть).
+        """
+        words, owners = [], []
+        for index, seg in enumerate(segments):
+            for raw in seg["text"].split():
+                norm = normalize_word(raw)
+                if norm:
+                    words.append(norm)
+                    owners.append(index)
+        texts = [[] for _ in segments]
+        costs = [0.0] * len(segments)
+        counts = [0] * len(segments)
+        if words and self.reference:
+            path = banded_alignment(words, [norm for _, norm, _ in self.reference], self.band)
+            self._assign(path, owners, texts, costs, counts)
+
+        matched, unreliable = [], []
+        for index, seg in enumerate(segments):
+            reliable = counts[index] > 0 and costs[index] / counts[index] <= self.threshold and texts[index]
+            if not reliable:
+                unreliable.append(index)
+            text = " ".join(texts[index]) if reliable else seg["text"].strip()
+            matched.append({"start": seg["start"], "end": seg["end"], "text": text})
+        logger.info(f"Lyrics matched locally for {len(segments) - len(unreliable)} of {len(segments)} segments")
+        return matched, unreliable
+
+    def _insert(self, host, pending, texts, costs, counts):
+        if host is None or not pending or len(pending) > MAX_INSERTED_WORDS:
+            return
+        texts[host].extend(self.reference[t][0] for t in pending)
+        costs[host] += len(pending)
+        counts[host] += len(pending)
+
+    def _assign(self, path, owners, texts, costs, counts):
+        # Слова эталона без пары идут в сегмент соседнего сопоставленного слова. На границе сегментов
+        # цепочка делится по началу строки эталона: до него — в предыдущий сегмент, после — в следующий.
+        # Длинные цепочки пропускаются
+        pending = []
+        last_owner = None
+        for source, target, step_cost in path + [(None, None, 0.0)]:
+            if source is None and target is not None:
+                pending.append(target)
+                continue
+            owner = owners[source] if source is not None else None
+            if pending:
+                if last_owner is None or owner is None or last_owner == owner:
+                    self._insert(last_owner if last_owner is not None else owner, pending, texts, costs, counts)
+                else:
+                    split = next((k for k, t in enumerate(pending) if self.reference[t][2]), len(pending))
+                    self._insert(last_owner, pending[:split], texts, costs, counts)
+                    self._insert(owner, pending[split:], texts, costs, counts)
+                pending = []
+            if source is None:
+                continue
+            costs[owner] += step_cost
+            counts[owner] += 1
+            if target is not None:
+                texts[owner].append(self.reference[target][0])
+            last_owner = owner
@@ -1,21 +1,71 @@
 from pathlib import Path
 import re
 from dataclasses import dataclass
+from typing import Dict, List
 import logging
 logger = logging.getLogger(__name__)
 
+LRC_TIME_PATTERN = re.compile(r'\[(\d{1,2}):(\d{2}(?:\.\d{1,3})?)\]')
+CYRILLIC_PATTERN = re.compile(r'[а-яё]', re.IGNORECASE)
+LATIN_PATTERN = re.compile(r'[a-z]', re.IGNORECASE)
+# Строка не тянется дальше этого на проигрыш, если следующая метка далеко
+MAX_LINE_SECONDS = 15.0
+
+
 class LyricsProvider:
     def __init__(self, path: str):
         self._path = Path(path)
         if not self._path.exists():
             logger.error(f'Text file not found: {path}')
             raise FileNotFoundError(f"Text file not found: {path}")
+        self._lines = self._path.read_text(encoding='utf-8').splitlines()
+
     def process_text(self):
-        lrc_time_pattern = re.compile(r'\[\d{1,2}:\d{2}(?:\.\d{1,2})?\]')
-        lines = self._path.read_text(encoding='utf-8').splitlines()
         cleaned_lines = []
-        for line in lines:
-            cleaned_line = lrc_time_pattern.sub('', line).strip()
+        for line in self._lines:
+            cleaned_line = LRC_TIME_PATTERN.sub('', line).strip()
             if cleaned_line:
                 cleaned_lines.append(cleaned_line)
         return '\n'.join(cleaned_lines)
+
+    def _timed_lines(self):
+        # [(секунда, текст)] по возрастанию времени; у строки может быть несколько меток (повтор припева).
+        # Пустой текст — метка конца предыдущей строки (проигрыш). Теги [ar:...] и т.п. пропускаются.
+        timed = []
+        for line in self._lines:
+            stamps = []
+            rest = line.strip()
+            while (match := LRC_TIME_PATTERN.match(rest)) is not None:
+                stamps.append(int(match.group(1)) * 60 + float(match.group(2)))
+                rest = rest[match.end():].lstrip()
+            timed.extend((stamp, rest) for stamp in stamps)
+        timed.sort(key=lambda item: item[0])
+        return timed
+
+    @property
+    def is_synced(self) -> bool:
+        return any(text for _, text in self._timed_lines())
+
+    def segments(self, duration: float | None = None) -> List[Dict]:
+        """
+        Синхронизированный текст (LRC) в виде сегментов {"start", "end", "text"} для выравнивания по словам.
+        Строка длится до следующей метки, но не дольше MAX_LINE_SECONDS и не дальше конца трека.
+        """
+        timed = self._timed_lines()
+        segments = []
+        for i, (start, text) in enumerate(timed):
+            if not text:
+                continue
+            end = start + MAX_LINE_SECONDS
+            if i + 1 < len(timed):
+                end = min(end, timed[i + 1][0])
+            if duration is not None:
+                start, end = min(start, duration), min(end, duration)
+            if end > start:
+                segments.append({"start": round(start, 3), "end": round(end, 3), "text": text})
+        return segments
+
+    def language(self) -> str:
+        # Для выравнивания нужен язык, а распознавание (которое его определяет) пропускается
+        text = self.process_text()
+        return "ru" if len(CYRILLIC_PATTERN.findall(text)) > len(LATIN_PATTERN.findall(text)) else "en"
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from KaraokeProcessor import Aligner as aligner_module
+from KaraokeProcessor.Aligner import SAMPLE_RATE, Aligner
+from model_registry import ModelKey, ModelRegistry
+
+
+def fake_align(segments, model, metadata, audio, device, return_char_alignments=False):
+    # Слово ставится на самый громкий сэмпл сегмента: результат зависит от того,
+    # совпадают ли номера сэмплов куска с номерами во всём треке. Время округляется, как в whisperx
+    aligned = []
+    for seg in segments:
+        a, b = int(seg["start"] * SAMPLE_RATE), int(seg["end"] * SAMPLE_RATE)
+        peak = round((a + int(np.argmax(audio[a:b]))) / SAMPLE_RATE, 3)
+        aligned.append({**seg, "words": [{"word": seg["text"], "start": peak, "end": seg["end"]}]})
+    return {"segments": aligned}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(aligner_module, "get_registry", lambda: registry)
+    monkeypatch.setattr(aligner_module.whisperx, "align", fake_align)
+    monkeypatch.setattr(aligner_module.whisperx, "load_align_model", lambda language_code, device: ("model", "metadata"))
+    # Пул в потоках вместо процессов: подмены whisperx видны и в нём
+    monkeypatch.setattr(aligner_module, "_worker_model", ("model", "metadata"))
+    monkeypatch.setattr(aligner_module, "_start_pool", lambda language, workers: ThreadPoolExecutor(workers))
+    yield registry
+    registry.clear()
+
+
+@pytest.fixture
+def track():
+    rng = np.random.default_rng(0)
+    starts = np.cumsum(rng.uniform(0.5, 3.0, 24))
+    segments = [{"start": round(float(s), 3), "end": round(float(s) + 1.2, 3), "text": f"слово{i}"} for i, s in enumerate(starts)]
+    audio = 0.01 * rng.standard_normal(int((starts[-1] + 3) * SAMPLE_RATE)).astype(np.float32)
+    for seg in segments:
+        audio[int((seg["start"] + rng.uniform(0.1, 1.0)) * SAMPLE_RATE)] = 1.0
+    return audio, segments
+
+
+def times(segments):
+    return [(seg["start"], seg["end"], *(t for word in seg["words"] for t in (word["start"], word["end"]))) for seg in segments]
+
+
+def texts(segments):
+    return [(seg["text"], [word["word"] for word in seg["words"]]) for seg in segments]
+
+
+@pytest.mark.parametrize("batch", [8, 24])
+def test_parallel_matches_serial(registry, track, batch):
+    """
+    Groups aligned on their own audio windows give the same words as one call on the whole track.
+    Times may differ by one millisecond: whisperx rounds them before the group offset is added back.
+    """
+    audio, segments = track
+    serial, parallel = Aligner("cpu", workers=1), Aligner("cpu", workers=4)
+    for i in range(0, len(segments), batch):
+        expected = serial.align(audio, segments[i : i + batch], "ru")
+        result = parallel.align(audio, segments[i : i + batch], "ru")
+        assert texts(result) == texts(expected)
+        np.testing.assert_allclose(times(result), times(expected), atol=1e-3 + 1e-9)
+    assert ModelKey("whisperx/align-pool", "cpu", language="ru") in registry
+
+
+def test_small_batches_stay_in_process(registry, track):
+    audio, segments = track
+    Aligner("cpu", workers=4).align(audio, segments[:3], "ru")
+    assert ModelKey("whisperx/align-pool", "cpu", language="ru") not in registry
+    assert ModelKey("whisperx/align", "cpu", language="ru") in registry
+
+
+def test_evicted_pool_is_shut_down(registry, track):
+    audio, segments = track
+    Aligner("cpu", workers=2).align(audio, segments[:8], "ru")
+    key = ModelKey("whisperx/align-pool", "cpu", language="ru")
+    pool = registry.get(key, lambda: None)
+    registry.evict(key)
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
+    # Следующий батч запускает новый пул
+    assert len(Aligner("cpu", workers=2).align(audio, segments[:8], "ru")) == 8
+    assert registry.get(key, lambda: None) is not pool
+
+
+def test_group_segments_keeps_order():
+    segments = [{"start": float(i), "end": i + 0.5 * (i % 3 + 1), "text": str(i)} for i in range(10)]
+    groups = aligner_module._group_segments(segments, 4)
+    assert len(groups) == 4
+    assert [seg for group in groups for seg in group] == segments
@@ -0,0 +1,62 @@
+import os
+
+from KaraokeProcessor.LLMCache import LLMCache
+
+
+def entry_bytes(cache):
+    return sum(p.stat().st_size for p in cache.directory.glob("*/*.json"))
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = LLMCache(tmp_path, max_bytes=1 << 20)
+    key = LLMCache.key("model", 0.1, 100, [{"role": "user", "content": "текст"}])
+    assert cache.get(key) is None
+    cache.put(key, [{"text": "Привет"}])
+    assert cache.get(key) == [{"text": "Привет"}]
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_key_depends_on_generation_parameters():
+    messages = [{"role": "user", "content": "a"}]
+    assert LLMCache.key("model", 0.1, 100, messages) == LLMCache.key("model", 0.1, 100, list(messages))
+    assert LLMCache.key("model", 0.1, 100, messages) != LLMCache.key("model", 0.2, 100, messages)
+    assert LLMCache.key("model", 0.1, 100, messages) != LLMCache.key("model", 0.1, 200, messages)
+
+
+def test_overwrite_replaces_size(tmp_path):
+    """Writing the same key again accounts for the new entry only."""
+    cache = LLMCache(tmp_path, max_bytes=1 << 20)
+    cache.put("aa", "first")
+    cache.put("bb", "x" * 100)
+    for _ in range(10):
+        cache.put("bb", "y" * 50)
+    assert cache._size == entry_bytes(cache)
+    assert cache.get("bb") == "y" * 50
+
+
+def test_overwrites_do_not_evict(tmp_path):
+    """Repeated overwrites of one key never push a small cache over its limit."""
+    cache = LLMCache(tmp_path, max_bytes=1000)
+    cache.put("aa", "a" * 300)
+    for _ in range(20):
+        cache.put("bb", "b" * 300)
+    assert cache.get("aa") == "a" * 300
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = LLMCache(tmp_path, max_bytes=1000)
+    for i, key in enumerate(["aa", "bb", "cc"]):
+        cache.put(key, str(i) * 300)
+        os.utime(cache._path(key), (i, i))
+    cache.get("aa")  # "aa" becomes the most recently used
+    cache.put("dd", "3" * 300)
+    assert cache.get("bb") is None
+    assert cache.get("aa") is not None and cache.get("dd") is not None
+    assert cache._size == entry_bytes(cache) <= 900
+
+
+def test_disabled_cache(tmp_path):
+    cache = LLMCache(tmp_path, enabled=False)
+    cache.put("aa", "value")
+    assert cache.get("aa") is None
+    assert not any(tmp_path.iterdir())
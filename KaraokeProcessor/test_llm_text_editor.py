@@ -0,0 +1,180 @@
+import json
+import threading
+
+import pytest
+
+from KaraokeProcessor import LLMTextEditor as editor_module
+from KaraokeProcessor.LLMPrompt import json_schema
+from KaraokeProcessor.LLMTextEditor import (
+    LLMTextEditor,
+    SegmentStreamParser,
+    _matches_schema,
+    compact_payload,
+    parse_edits,
+    rebuild_segments,
+    split_windows,
+)
+
+RESPONSE = '```json\n[{"id":0,"text":"Привет, мир"},{"id":1,"text":"скобки {[ и \\"кавычки\\""}]\n```'
+
+
+def segments(count):
+    return [{"start": float(i), "end": i + 0.5, "text": f"строка {i}"} for i in range(count)]
+
+
+def feed_all(parser, chunks):
+    return [item for chunk in chunks for item in parser.feed(chunk)]
+
+
+def test_split_windows_respects_budget():
+    """Windows keep the order of segments, and each fits the token budget."""
+    source = segments(40)
+    windows = split_windows(source, 50)
+    assert len(windows) > 1
+    assert [seg for window in windows for seg in window] == source
+    for window in windows:
+        assert sum(len(json.dumps({"id": i, "text": seg["text"]}, ensure_ascii=False)) // 3 + 1 for i, seg in enumerate(window)) <= 50
+
+
+def test_split_windows_oversized_segment():
+    """A segment larger than the budget still gets a window of its own."""
+    source = [{"start": 0, "end": 1, "text": "a"}, {"start": 1, "end": 2, "text": "б" * 500}, {"start": 2, "end": 3, "text": "c"}]
+    assert split_windows(source, 10) == [source[:1], source[1:2], source[2:]]
+    assert split_windows([], 10) == []
+
+
+def test_compact_payload_hides_timing():
+    payload = json.loads(compact_payload(segments(2)))
+    assert payload == [{"id": 0, "text": "строка 0"}, {"id": 1, "text": "строка 1"}]
+
+
+@pytest.mark.parametrize(
+    "value, valid",
+    [
+        ([{"id": 0, "text": "a"}], True),
+        ([], True),
+        ([{"id": 0, "text": "a", "extra": 1}], True),
+        ({"id": 0, "text": "a"}, False),
+        ([{"id": 0}], False),
+        ([{"id": "0", "text": "a"}], False),
+        ([{"id": True, "text": "a"}], False),
+        ([{"id": 0, "text": None}], False),
+    ],
+)
+def test_matches_schema(value, valid):
+    assert _matches_schema(value, json_schema) is valid
+
+
+def test_parse_edits_valid():
+    window = segments(3)
+    assert parse_edits('[{"id":0,"text":"А"},{"id":2,"text":"В","note":"x"}]', window) == [
+        {"id": 0, "text": "А"},
+        {"id": 2, "text": "В"},
+    ]
+    assert parse_edits('```json\n[{"id":1,"text":"Б"}]\n```', window) == [{"id": 1, "text": "Б"}]
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        "не JSON",
+        '[{"id":0,"text":"a"}',
+        '{"id":0,"text":"a"}',
+        '[{"id":0}]',
+        '[{"id":1,"text":"b"},{"id":0,"text":"a"}]',
+        '[{"id":0,"text":"a"},{"id":0,"text":"a"}]',
+        '[{"id":3,"text":"d"}]',
+        '[{"id":-1,"text":"z"}]',
+    ],
+)
+def test_parse_edits_rejects(response):
+    """Invalid JSON, wrong schema, reordered, duplicated or foreign ids are all rejected."""
+    assert parse_edits(response, segments(3)) is None
+
+
+def test_rebuild_segments_keeps_timing():
+    window = segments(3)
+    assert rebuild_segments(window, [{"id": 0, "text": "А"}, {"id": 2, "text": "В"}]) == [
+        {"start": 0.0, "end": 0.5, "text": "А"},
+        {"start": 2.0, "end": 2.5, "text": "В"},
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, len(RESPONSE)])
+def test_stream_parser_chunking(size):
+    """Objects come out the same however the response is split into chunks."""
+    parser = SegmentStreamParser()
+    items = feed_all(parser, [RESPONSE[i : i + size] for i in range(0, len(RESPONSE), size)])
+    assert items == [{"id": 0, "text": "Привет, мир"}, {"id": 1, "text": 'скобки {[ и "кавычки"'}]
+    assert parser.closed
+
+
+def test_stream_parser_partial_response():
+    """An object is returned only once it is closed; a cut response is not marked as closed."""
+    parser = SegmentStreamParser()
+    assert parser.feed('[{"id":0,"text":"a"},{"id":1,"te') == [{"id": 0, "text": "a"}]
+    assert parser.feed('xt":"b') == []
+    assert not parser.closed
+    assert parser.feed('"}') == [{"id": 1, "text": "b"}]
+    assert not parser.closed
+
+
+def test_stream_parser_ignores_text_after_array():
+    parser = SegmentStreamParser()
+    assert parser.feed('[{"id":0,"text":"a"}] [{"id":1,"text":"b"}]') == [{"id": 0, "text": "a"}]
+    assert parser.closed
+    assert parser.feed('{"id":2,"text":"c"}') == []
+
+
+def test_stream_parser_garbled_object():
+    """A malformed object raises ValueError, which the editor treats as a broken stream."""
+    parser = SegmentStreamParser()
+    with pytest.raises(ValueError):
+        parser.feed('[{"id":0,"text":"a",}]')
+
+
+@pytest.fixture
+def editor(monkeypatch):
+    for name in ("YANDEX_CLOUD_API_KEY", "YANDEX_CLOUD_FOLDER", "YANDEX_CLOUD_MODEL", "YANDEX_CLOUD_BASE_URL"):
+        monkeypatch.setattr(editor_module, name, "test")
+    return LLMTextEditor(use_cache=False)
+
+
+def fake_stream(calls, finished):
+    # Модель отвечает по одному символу; finished отмечает, что поток закрыт (дочитан или отменён)
+    async def stream_completion(messages):
+        window = json.loads(messages[-1]["content"])
+        calls.append(len(window))
+        try:
+            for char in json.dumps([{"id": item["id"], "text": item["text"].upper()} for item in window], ensure_ascii=False):
+                yield char
+        finally:
+            finished.append(len(window))
+
+    return stream_completion
+
+
+def test_edit_stream_in_order(editor, monkeypatch):
+    """Windows are generated concurrently, segments come out in the original order with their timing."""
+    calls, finished = [], []
+    monkeypatch.setattr(editor, "_stream_completion", fake_stream(calls, finished))
+    monkeypatch.setattr(editor_module, "split_windows", lambda segments: split_windows(segments, 20))
+    source = segments(12)
+
+    result = list(editor.edit_stream(source))
+    assert len(calls) > 1
+    assert result == [{"start": seg["start"], "end": seg["end"], "text": seg["text"].upper()} for seg in source]
+
+
+def test_edit_stream_stops_when_consumer_stops(editor, monkeypatch):
+    """Closing the iterator early cancels generation and ends the loop thread."""
+    calls, finished = [], []
+    monkeypatch.setattr(editor, "_stream_completion", fake_stream(calls, finished))
+    monkeypatch.setattr(editor_module, "EDIT_STREAM_BUFFER", 1)
+    threads = threading.active_count()
+
+    stream = editor.edit_stream(segments(50))
+    assert next(stream)["text"] == "СТРОКА 0"
+    stream.close()
+    assert threading.active_count() == threads
+    assert finished == calls
@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+from KaraokeProcessor.LyricsMatcher import (
+    MISMATCH_COST,
+    LyricsMatcher,
+    banded_alignment,
+    levenshtein,
+    normalize_word,
+    tokenize_reference,
+    word_distance,
+)
+
+REFERENCE = """Ночь, улица, фонарь, аптека,
+Бессмысленный и тусклый свет.
+Живи ещё хоть четверть века —
+Всё будет так. Исхода нет."""
+
+
+def reference_levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        previous, row[0] = row[0], i
+        for j, y in enumerate(b, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (x != y))
+    return row[-1]
+
+
+def full_alignment_cost(source, target):
+    # Полная таблица DP с теми же стоимостями, что у banded_alignment
+    row = [float(j) for j in range(len(target) + 1)]
+    for i, word in enumerate(source, 1):
+        previous, row[0] = row[0], float(i)
+        for j, other in enumerate(target, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + word_distance(word, other))
+    return row[-1]
+
+
+def test_levenshtein_matches_reference():
+    rng = random.Random(0)
+    for _ in range(500):
+        # Длины больше 64 проверяют, что битовые маски не ограничены машинным словом
+        a = "".join(rng.choice("абвгд") for _ in range(rng.randrange(0, 80)))
+        b = "".join(rng.choice("абвгд") for _ in range(rng.randrange(0, 80)))
+        assert levenshtein(a, b) == reference_levenshtein(a, b), (a, b)
+
+
+@pytest.mark.parametrize("a, b, expected", [("", "", 0), ("", "abc", 3), ("abc", "", 3), ("kitten", "sitting", 3), ("ёж", "еж", 1)])
+def test_levenshtein_cases(a, b, expected):
+    assert levenshtein(a, b) == expected
+
+
+def test_word_distance():
+    assert word_distance("свет", "свет") == 0.0
+    assert word_distance("улица", "улицы") == pytest.approx(0.2)
+    assert word_distance("ночь", "аптека") == MISMATCH_COST
+    assert word_distance("", "свет") == MISMATCH_COST
+
+
+def test_normalize_and_tokenize():
+    assert normalize_word("Ещё,") == "еще"
+    assert normalize_word("—") == ""
+    tokens = tokenize_reference("Живи ещё хоть четверть века —\nВсё будет так.")
+    assert tokens[4] == ("века —", "века", False)
+    assert [line_start for _, _, line_start in tokens] == [True, False, False, False, False, True, False, False]
+
+
+def test_banded_alignment_is_optimal():
+    """With a band covering the length difference, the path cost equals the full DP."""
+    rng = random.Random(1)
+    vocabulary = ["ночь", "ночи", "улица", "фонарь", "аптека", "свет", "света", "нет", "век"]
+    for _ in range(100):
+        source = [rng.choice(vocabulary) for _ in range(rng.randrange(0, 30))]
+        target = [rng.choice(vocabulary) for _ in range(rng.randrange(0, 30))]
+        path = banded_alignment(source, target, band=32)
+        assert [s for s, _, _ in path if s is not None] == list(range(len(source)))
+        assert [t for _, t, _ in path if t is not None] == list(range(len(target)))
+        assert sum(cost for _, _, cost in path) == pytest.approx(full_alignment_cost(source, target))
+
+
+def test_banded_alignment_narrow_band():
+    """Identical long texts align on the diagonal even with a narrow band."""
+    words = [f"слово{i}" for i in range(500)]
+    path = banded_alignment(words, words, band=2)
+    assert path == [(i, i, 0.0) for i in range(500)]
+
+
+def test_matcher_replaces_text_with_reference():
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": "ночь улица фонарь аптэка"},
+        {"start": 2.0, "end": 4.0, "text": "бесмысленный и тусклый свет"},
+    ]
+    matched, unreliable = LyricsMatcher(REFERENCE).match(segments)
+    assert unreliable == []
+    assert matched == [
+        {"start": 0.0, "end": 2.0, "text": "Ночь, улица, фонарь, аптека,"},
+        {"start": 2.0, "end": 4.0, "text": "Бессмысленный и тусклый свет."},
+    ]
+
+
+def test_matcher_inserts_missed_words_by_line():
+    """Reference words whisper missed at a segment border go to the side of the line they belong to."""
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": "живи ещё хоть четверть"},
+        {"start": 2.0, "end": 4.0, "text": "будет так исхода нет"},
+    ]
+    matched, unreliable = LyricsMatcher("Живи ещё хоть четверть века —\nВсё будет так. Исхода нет.").match(segments)
+    assert unreliable == []
+    assert [seg["text"] for seg in matched] == ["Живи ещё хоть четверть века —", "Всё будет так. Исхода нет."]
+
+
+def test_matcher_marks_unreliable_segments():
+    """Segments that do not match the reference keep their text and are reported for the LLM."""
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": "ночь улица фонарь аптека"},
+        {"start": 2.0, "end": 4.0, "text": "совсем другие слова здесь поются"},
+        {"start": 4.0, "end": 5.0, "text": "   "},
+    ]
+    matched, unreliable = LyricsMatcher(REFERENCE).match(segments)
+    assert unreliable == [1, 2]
+    assert matched[1]["text"] == "совсем другие слова здесь поются"
+    assert matched[0]["text"] == "Ночь, улица, фонарь, аптека,"
+
+
+def test_matcher_empty_reference():
+    segments = [{"start": 0.0, "end": 1.0, "text": "текст"}]
+    assert LyricsMatcher("").match(segments) == (segments, [0])
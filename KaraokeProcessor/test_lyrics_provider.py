@@ -0,0 +1,77 @@
+import pytest
+
+from KaraokeProcessor.LyricsProvider import MAX_LINE_SECONDS, LyricsProvider
+
+LRC = """[ar:Исполнитель]
+[ti:Песня]
+[00:01.50]Первая строка
+[00:04.00]Вторая строка
+[00:06.25][01:10.00]Припев
+[00:09.00]
+[00:30]После проигрыша
+"""
+
+
+@pytest.fixture
+def lyrics(tmp_path):
+    def write(text):
+        path = tmp_path / "lyrics.lrc"
+        path.write_text(text, encoding="utf-8")
+        return LyricsProvider(str(path))
+
+    return write
+
+
+def test_segments(lyrics):
+    """Lines last until the next stamp; repeated stamps repeat the line; an empty stamp ends the previous one."""
+    assert lyrics(LRC).segments() == [
+        {"start": 1.5, "end": 4.0, "text": "Первая строка"},
+        {"start": 4.0, "end": 6.25, "text": "Вторая строка"},
+        {"start": 6.25, "end": 9.0, "text": "Припев"},
+        {"start": 30.0, "end": 30.0 + MAX_LINE_SECONDS, "text": "После проигрыша"},
+        {"start": 70.0, "end": 70.0 + MAX_LINE_SECONDS, "text": "Припев"},
+    ]
+
+
+def test_segments_clipped_to_duration(lyrics):
+    segments = lyrics(LRC).segments(duration=35.0)
+    assert segments[-1] == {"start": 30.0, "end": 35.0, "text": "После проигрыша"}
+    assert all(seg["end"] <= 35.0 for seg in segments)
+
+
+def test_unsorted_stamps(lyrics):
+    provider = lyrics("[00:05.00]Вторая\n[00:01.00]Первая\n")
+    assert [seg["text"] for seg in provider.segments()] == ["Первая", "Вторая"]
+    assert provider.segments()[0]["end"] == 5.0
+
+
+def test_plain_text(lyrics):
+    """Text without stamps is not synced and gives no segments."""
+    provider = lyrics("Первая строка\n\nВторая строка\n")
+    assert not provider.is_synced
+    assert provider.segments() == []
+    assert provider.process_text() == "Первая строка\nВторая строка"
+
+
+def test_process_text_strips_stamps(lyrics):
+    provider = lyrics(LRC)
+    assert provider.is_synced
+    assert provider.process_text().splitlines()[2:] == ["Первая строка", "Вторая строка", "Припев", "После проигрыша"]
+
+
+@pytest.mark.parametrize(
+    "text, language",
+    [
+        ("[00:01.00]Ночь, улица, фонарь", "ru"),
+        ("[00:01.00]Hello darkness, my old friend", "en"),
+        ("[00:01.00]Baby, ты не знаешь", "ru"),
+        ("[00:01.00]Я say hello", "en"),
+    ],
+)
+def test_language(lyrics, text, language):
+    assert lyrics(text).language() == language
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LyricsProvider(str(tmp_path / "missing.lrc"))
@@ -1,21 +1,23 @@
 
 from __future__ import annotations
 import os
+import asyncio
+import threading
 os.environ["CUDA_VISIBLE_DEVICES"] = '5'
-import librosa
 import subprocess
 import torch
+from functools import partial
 from dotenv import load_dotenv
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from music_service.music_service import SearchDownloadTrack
-from skey.skey import detect_key
-from separation.source_separator import SourceSeparator
-from KaraokeProcessor.KaraokeProcessor import KaraokeProcessor, AudioLoader, LyricsProvider, LLMTextEditor, ASRService, Aligner
-from yandex_generate.image_generator import ImageGenerator
+from model_registry import get_registry
+from pipeline import JobManager, track_pipeline
+from transposition import ShiftedWavStream, get_transposer, parse_range, shifted_key
+from yandex_generate.renditions import RENDITIONS_DIR, get_rendition_renderer, is_fresh, load_manifest, source_images
 
 load_dotenv()
 TOKEN = os.getenv("YANDEX_MUSIC_API_TOKEN")
@@ -24,7 +26,35 @@ app = FastAPI(title="Music Backend API")
 app.mount("/data", StaticFiles(directory="data/"), name="separated_songs")
 app.mount("/assets", StaticFiles(directory="Frontend/dist/assets"), name="assets")
 
-yandex_service = SearchDownloadTrack(token=TOKEN)
+# Клиент музыкального сервиса и очередь задач создаются при первом запросе, а не при импорте:
+# процессы пулов (spawn) заново импортируют главный модуль, и им не нужны ни сеть, ни воркеры
+_yandex_service: SearchDownloadTrack | None = None
+_job_manager: JobManager | None = None
+_services_lock = threading.Lock()
+
+
+def get_yandex_service() -> SearchDownloadTrack:
+    global _yandex_service
+    with _services_lock:
+        if _yandex_service is None:
+            _yandex_service = SearchDownloadTrack(token=TOKEN)
+        return _yandex_service
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    with _services_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
+
+
+@app.on_event("startup")
+def create_services():
+    # Подключение к сервису — при старте сервера, а не в первом запросе /search внутри event loop
+    get_yandex_service()
+    get_job_manager()
+
 
 # --- Pydantic модели (для валидации входящих JSON) ---
 class TrackRequest(BaseModel):
@@ -33,13 +63,14 @@ class TrackRequest(BaseModel):
 # --- Эндпоинты (Ручки API) ---
 
 @app.get("/search")
-def search_tracks(q: str):
+async def search_tracks(q: str):
     """
     Пример: GET /search?q=Linkin Park
     Возвращает список треков (без скачивания).
+    Async-обработчик не занимает поток пула; результаты кэшируются (SearchCache).
     """
     try:
-        results = yandex_service.search(q)
+        results = await get_yandex_service().search_async(q)
         
         return [
             {
@@ -55,104 +86,139 @@ def search_tracks(q: str):
 
 
 @app.post("/process-track")
-async def process_track(request: TrackRequest):
+def process_track(request: TrackRequest):
     """
     Пример: POST /process-track с JSON {"track_id": "123456"}
-    1. Качает трек через YandexService
-    2. Передает результат в AudioProcessorService
-    3. Отдает отчет JSON
+    Ставит трек в очередь на обработку и сразу возвращает id задачи.
+    Статус и результат — GET /jobs/{job_id}
     """
-    # Select and set GPU before processin
-    try:
-        # Шаг 1: Скачиваем (используем первый класс)
-        print(f"Запрос на обработку трека ID: {request.track_id}")
-        track_file_dto = yandex_service.download_and_get_info(request.track_id)
-
-        # Шаг 2: Передаем в skey, определяем тональность
-        sf, _ = librosa.load(track_file_dto.file_path)
-        key = detect_key(audio=sf, extension=track_file_dto.format, device="cuda")
-        #key = 'C'
-        # Шаг 3: Передаем в source_separator, отделяем вокал от инструментала
-        source_separator = SourceSeparator()
-        source_separator.separate(track_file_dto.file_path, output_dir="data/separated_songs")
-
-        # Генерируем ссылки для скачивания (для фронтенда)
-        # Предполагаем, что сервер запущен локально
-        base_url = f"data/separated_songs/mdx_q/{Path(track_file_dto.file_name).stem}"
-        vocal_filename = os.path.basename("vocals.mp3")
-        instr_filename = os.path.basename("no_vocals.mp3")
-        
-        lyrics_provider = None
-        if os.path.exists(track_file_dto.lyrics_path):
-            lyrics_provider = LyricsProvider(track_file_dto.lyrics_path)
-
-        kp = KaraokeProcessor(
-            AudioLoader(os.path.abspath(f"{base_url}/{vocal_filename}")),
-            lyrics_provider,
-            LLMTextEditor(),
-            ASRService("large-v3", "cuda"),
-            Aligner("cuda")
-        )
-        processed_lyrics = kp.process()
-
-        if not os.path.exists(f"{base_url}/images"):
-            os.makedirs(f"{base_url}/images")
-
-        img_generator = ImageGenerator()
-        await img_generator.generate_list_of_images(kp.create_image_prompts(10), f"{base_url}/images/")
-        
-        return {
-            "status": "success",
-            "track_info": {
-                "id": track_file_dto.track_id,
-                "title": track_file_dto.title,
-                "artist": track_file_dto.artist,
-                "coverUrl": "http://" + track_file_dto.cover_url
-            },
-            "analysis": {
-                "key": key,  # Результат работы первого класса
-            },
-            "downloads": {
-                # Ссылки на файлы для песни
-                "vocals_url": f"{base_url}/{vocal_filename}",
-                "instrumental_url": f"{base_url}/{instr_filename}",
-                "images_url": f"{Path(track_file_dto.file_name).stem}"
-            },
-            "karaokeData": processed_lyrics # Результат работы KaraokeProcessor
-        }
+    job = get_job_manager().submit(request.track_id, partial(track_pipeline.process_track, yandex_service=get_yandex_service()))
+    return {
+        "status": job.status,
+        "job_id": job.job_id,
+    }
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Статус задачи по этапам и итоговый результат (поле result), когда задача завершена.
+    Пока идёт разделение, stages.separate.partial_stems содержит ссылки на уже записанное
+    начало стемов и его длительность в секундах — их можно слушать до конца обработки.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job.to_dict()
+
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail="Трек не найден")
-    except Exception as e:
-        print(f"Ошибка: {e}")
-        return {
-            "status": "error",
-        }
-    
 @app.get("/images")
 def get_images(track_folder: str):
     """
-    Возвращает ссылки на картинки списком
+    Возвращает ссылки на картинки списком. renditions — уменьшенные WebP-версии каждой картинки
+    (thumbnail, mobile, full) с размерами и весом, чтобы клиент скачивал наименьшую подходящую.
+    Если версий ещё нет или картинка с тех пор заменена, они рендерятся в фоне и появятся при следующем запросе.
     """
+    if Path(track_folder).name != track_folder:
+        raise HTTPException(status_code=400, detail="Некорректная папка трека")
+    images_dir = f"data/separated_songs/mdx_q/{track_folder}/images"
     try:
-        files = os.listdir(f"data/separated_songs/mdx_q/{track_folder}/images")
+        base_url = f"/{images_dir}/"
+        sources = source_images(Path(images_dir))
+        urls = [base_url + source.name for source in sources]
+
+        manifest = load_manifest(images_dir) or {}
+        fresh = [source for source in sources if is_fresh(manifest.get(source.name), source)]
+        if len(fresh) < len(sources):
+            get_rendition_renderer().submit_folder(images_dir)
+        renditions = [
+            {
+                "original": base_url + source.name,
+                **{
+                    name: {
+                        "url": f"{base_url}{RENDITIONS_DIR}/{info['file']}",
+                        "width": info["width"],
+                        "height": info["height"],
+                        "bytes": info["bytes"],
+                    }
+                    for name, info in manifest[source.name]["renditions"].items()
+                },
+            }
+            for source in fresh
+        ]
 
-        urls = []
-        for filename in files:
-            full_url = f"/data/separated_songs/mdx_q/{track_folder}/images/" + filename
-            urls.append(full_url)
-        
         return {
             "status": "success",
-            "images": urls
+            "images": urls,
+            "renditions": renditions
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/transpose")
+async def transpose_track(track_folder: str, semitones: int, key: str | None = None):
+    """
+    Пример: GET /transpose?track_folder=...&semitones=-2&key=C Major
+    Ссылка на минус, сдвинутый на semitones полутонов, и новая тональность (если передана текущая).
+    Популярные сдвиги отдаются из кэша, остальные рендерятся по запросу; ожидание рендера
+    не занимает поток пула обработчиков.
+    """
+    if Path(track_folder).name != track_folder or not -12 <= semitones <= 12:
+        raise HTTPException(status_code=400, detail="Некорректный запрос")
+    source = f"{track_pipeline.SEPARATED_DIR}/mdx_q/{track_folder}/no_vocals.mp3"
+    try:
+        new_key = shifted_key(key, semitones) if key else None
+        path = await asyncio.wrap_future(get_transposer().render(track_folder, source, semitones))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "instrumental_url": f"/{path.as_posix()}",
+        "key": new_key,
+    }
+
+@app.get("/transpose/stream")
+def stream_transposed(track_folder: str, semitones: int, request: Request):
+    """
+    Пример: GET /transpose/stream?track_folder=...&semitones=3
+    Минус со сдвигом высоты тона, который считается блоками прямо во время отдачи (PCM WAV).
+    Поддерживает Range, поэтому плеер может перематывать без рендера всего файла.
+    """
+    if Path(track_folder).name != track_folder or not -12 <= semitones <= 12:
+        raise HTTPException(status_code=400, detail="Некорректный запрос")
+    source = f"{track_pipeline.SEPARATED_DIR}/mdx_q/{track_folder}/no_vocals.mp3"
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail=f"Стем не найден: {source}")
+
+    stream = ShiftedWavStream(source, semitones)
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = parse_range(request.headers.get("range"), stream.size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Некорректный диапазон", headers={"Content-Range": f"bytes */{stream.size}"})
+    if byte_range is None:
+        headers["Content-Length"] = str(stream.size)
+        return StreamingResponse(stream.iter_bytes(), media_type="audio/wav", headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stream.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(stream.iter_bytes(start, end), status_code=206, media_type="audio/wav", headers=headers)
+
+@app.get("/models")
+def get_models():
+    """
+    Резидентные модели и занимаемая ими память (в байтах)
+    """
+    return get_registry().memory_report()
+
 app.mount("/", StaticFiles(directory="Frontend/dist", html=True), name="frontend_root")
 
-# For local startup:
+# For local startup (server.py does the same without making this module __main__):
 if __name__ == "__main__":
    # results = yandex_service.search("Her")
    # print(results)
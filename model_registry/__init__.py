@@ -0,0 +1 @@
+from .model_registry import ModelKey, ModelRegistry, get_registry
@@ -0,0 +1,195 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Бюджет памяти под резидентные модели (в мегабайтах); 0 или пусто — без ограничения
+MODEL_MEMORY_BUDGET_MB = os.getenv("MODEL_MEMORY_BUDGET_MB")
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    name: str
+    device: str
+    compute_type: Optional[str] = None
+    language: Optional[str] = None
+
+    def __str__(self) -> str:
+        parts = [self.name, self.device]
+        if self.compute_type:
+            parts.append(self.compute_type)
+        if self.language:
+            parts.append(self.language)
+        return ":".join(parts)
+
+
+@dataclass
+class _Entry:
+    model: Any
+    size_bytes: int
+    release: Optional[Callable[[Any], None]] = None
+
+
+def _process_rss() -> int:
+    """
+    Текущий RSS процесса в байтах (Linux), 0 если узнать нельзя.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _cuda_allocated() -> int:
+    try:
+        import torch
+    except ImportError:
+        return 0
+    if not torch.cuda.is_available():
+        return 0
+    return sum(torch.cuda.memory_allocated(i) for i in range(torch.cuda.device_count()))
+
+
+def _tensor_bytes(model: Any) -> int:
+    """
+    Размер параметров и буферов torch-модулей внутри объекта (рекурсивно по tuple/list/dict).
+    """
+    if isinstance(model, (tuple, list)):
+        return sum(_tensor_bytes(m) for m in model)
+    if isinstance(model, dict):
+        return sum(_tensor_bytes(m) for m in model.values())
+    if hasattr(model, "__dataclass_fields__"):
+        return sum(_tensor_bytes(getattr(model, f)) for f in model.__dataclass_fields__)
+    if hasattr(model, "parameters") and hasattr(model, "buffers"):
+        try:
+            tensors = list(model.parameters()) + list(model.buffers())
+        except TypeError:
+            return 0
+        return sum(t.numel() * t.element_size() for t in tensors)
+    return 0
+
+
+class ModelRegistry:
+    """
+    Общий на процесс реестр загруженных моделей.
+    Модель загружается один раз на ключ (имя, устройство, compute type, язык),
+    при превышении бюджета памяти выгружаются давно не использованные модели.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._entries: "OrderedDict[ModelKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading_locks: Dict[ModelKey, threading.Lock] = {}
+
+    def get(
+        self,
+        key: ModelKey,
+        loader: Callable[[], Any],
+        size: Optional[Callable[[Any], int]] = None,
+        release: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """
+        Возвращает модель по ключу, загружая её через loader при первом обращении.
+        size — размер загруженного объекта в байтах, если его память не видна в этом процессе
+        (например, модели в процессах пула); release вызывается при выгрузке.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry.model
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        # Параллельные запросы одного ключа ждут единственную загрузку
+        with loading_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry.model
+
+            logger.info(f"Loading model {key}")
+            rss_before, cuda_before = _process_rss(), _cuda_allocated()
+            model = loader()
+            if size is not None:
+                size_bytes = size(model)
+            else:
+                measured = (_process_rss() - rss_before) + (_cuda_allocated() - cuda_before)
+                size_bytes = max(measured, _tensor_bytes(model), 0)
+            logger.info(f"Model {key} is resident, ~{size_bytes / 2**20:.1f} MB")
+
+            with self._lock:
+                self._entries[key] = _Entry(model, size_bytes, release)
+                self._loading_locks.pop(key, None)
+                self._evict_over_budget(keep=key)
+            return model
+
+    def _evict_over_budget(self, keep: ModelKey) -> None:
+        if not self.memory_budget_bytes:
+            return
+        while self.total_bytes() > self.memory_budget_bytes:
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                logger.warning(f"Model {keep} alone exceeds memory budget")
+                return
+            self._drop(victim)
+
+    def _drop(self, key: ModelKey) -> None:
+        entry = self._entries.pop(key)
+        logger.info(f"Evicting model {key} (~{entry.size_bytes / 2**20:.1f} MB)")
+        if entry.release is not None:
+            entry.release(entry.model)
+        del entry
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def evict(self, key: ModelKey) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def total_bytes(self) -> int:
+        return sum(e.size_bytes for e in self._entries.values())
+
+    def memory_report(self) -> Dict[str, int]:
+        """
+        Резидентная память по моделям в байтах, от давно использованных к недавним.
+        """
+        with self._lock:
+            return {str(k): e.size_bytes for k, e in self._entries.items()}
+
+    def __contains__(self, key: ModelKey) -> bool:
+        with self._lock:
+            return key in self._entries
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """
+    Реестр моделей процесса; бюджет берётся из MODEL_MEMORY_BUDGET_MB.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            budget = int(float(MODEL_MEMORY_BUDGET_MB) * 2**20) if MODEL_MEMORY_BUDGET_MB else None
+            _registry = ModelRegistry(budget)
+        return _registry
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from model_registry import ModelKey, ModelRegistry
+from model_registry import model_registry as registry_module
+
+MB = 2**20
+
+
+class Loader:
+    """Fake loader: returns a named object and records how often it was called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, name, delay=0.0):
+        def load():
+            self.calls.append(name)
+            time.sleep(delay)
+            return f"model-{name}"
+
+        return load
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    # Память процесса не меняется: размер задаётся явно через size
+    monkeypatch.setattr(registry_module, "_process_rss", lambda: 0)
+    monkeypatch.setattr(registry_module, "_cuda_allocated", lambda: 0)
+    return Loader()
+
+
+def sized(mb):
+    return lambda model: mb * MB
+
+
+def test_loads_once_per_key(loader):
+    registry = ModelRegistry()
+    key = ModelKey("asr", "cpu", "int8")
+    assert registry.get(key, loader("a")) == "model-a"
+    assert registry.get(key, loader("b")) == "model-a"
+    assert registry.get(ModelKey("asr", "cuda", "int8"), loader("c")) == "model-c"
+    assert loader.calls == ["a", "c"]
+
+
+def test_concurrent_requests_share_one_load(loader):
+    registry = ModelRegistry()
+    key = ModelKey("align", "cpu", language="ru")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get(key, loader("a", delay=0.1)))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["model-a"] * 5
+    assert loader.calls == ["a"]
+
+
+def test_lru_eviction_over_budget(loader):
+    """Loading past the budget evicts the least recently used models first."""
+    registry = ModelRegistry(memory_budget_bytes=100 * MB)
+    a, b, c = ModelKey("a", "cpu"), ModelKey("b", "cpu"), ModelKey("c", "cpu")
+    registry.get(a, loader("a"), size=sized(50))
+    registry.get(b, loader("b"), size=sized(30))
+    registry.get(a, loader("a"))  # a becomes the most recently used
+    registry.get(c, loader("c"), size=sized(40))
+    assert list(registry.memory_report()) == ["a:cpu", "c:cpu"]
+    assert registry.total_bytes() == 90 * MB
+    assert b not in registry
+
+    registry.get(b, loader("b"), size=sized(30))  # evicted models are loaded again
+    assert loader.calls == ["a", "b", "c", "b"]
+    assert list(registry.memory_report()) == ["c:cpu", "b:cpu"]
+
+
+def test_model_over_budget_stays(loader):
+    """A model larger than the whole budget evicts the others but is kept itself."""
+    registry = ModelRegistry(memory_budget_bytes=100 * MB)
+    registry.get(ModelKey("a", "cpu"), loader("a"), size=sized(30))
+    registry.get(ModelKey("big", "cuda"), loader("big"), size=sized(150))
+    assert list(registry.memory_report()) == ["big:cuda"]
+
+
+def test_no_budget_keeps_everything(loader):
+    registry = ModelRegistry()
+    for name in "abc":
+        registry.get(ModelKey(name, "cpu"), loader(name), size=sized(1000))
+    assert len(registry.memory_report()) == 3
+
+
+def test_measured_size(loader, monkeypatch):
+    """Without a size hook the growth of process memory during loading is used."""
+    rss = iter([100 * MB, 160 * MB])
+    monkeypatch.setattr(registry_module, "_process_rss", lambda: next(rss))
+    registry = ModelRegistry()
+    registry.get(ModelKey("a", "cpu"), loader("a"))
+    assert registry.memory_report() == {"a:cpu": 60 * MB}
+
+
+def test_release_on_evict_and_clear(loader):
+    registry = ModelRegistry(memory_budget_bytes=100 * MB)
+    released = []
+    registry.get(ModelKey("a", "cpu"), loader("a"), size=sized(60), release=released.append)
+    registry.get(ModelKey("b", "cpu"), loader("b"), size=sized(60), release=released.append)
+    assert released == ["model-a"]
+    registry.evict(ModelKey("missing", "cpu"))  # unknown keys are ignored
+    registry.clear()
+    assert released == ["model-a", "model-b"]
+    assert registry.memory_report() == {}
+
+
+def test_model_key_str():
+    assert str(ModelKey("whisperx/align", "cpu", language="ru")) == "whisperx/align:cpu:ru"
+    assert str(ModelKey("asr", "cuda", "float16")) == "asr:cuda:float16"
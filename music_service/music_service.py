@@ -1,8 +1,11 @@
 import os
+import asyncio
 from pathlib import Path
 from dataclasses import dataclass
 from typing import List, Optional
-from yandex_music import Client
+from yandex_music import Client, ClientAsync
+
+from .search_cache import SearchCache
 
 # Передается дальше
 @dataclass
@@ -20,9 +23,14 @@ class DownloadedTrack:
 
 
 class SearchDownloadTrack:
-    def __init__(self, token: str, download_folder: str = "downloads"):
+    def __init__(self, token: str, download_folder: str = "downloads", search_cache: Optional[SearchCache] = None):
         self.client = Client(token).init()
+        self.token = token
         self.download_folder = download_folder
+        self.search_cache = search_cache or SearchCache()
+        # Async-клиент для поиска из обработчиков FastAPI; создаётся при первом запросе в loop приложения
+        self._async_client: Optional[ClientAsync] = None
+        self._async_client_lock: Optional[asyncio.Lock] = None
         
         # Cоздаем папку для загрузок, если её нет
         if not os.path.exists(self.download_folder):
@@ -33,8 +41,36 @@ class SearchDownloadTrack:
         Ищет треки. Возвращает список словарей (для отображения на сайте).
         Не скачивает файлы, только метаданные.
         """
-        search_result = self.client.search(query, type_='track', page=page)
-        
+        key = self.search_cache.key(query, page)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        results = self._search_results(self.client.search(query, type_='track', page=page))
+        self.search_cache.put(key, results)
+        return results
+
+    async def _get_async_client(self) -> ClientAsync:
+        if self._async_client is None:
+            if self._async_client_lock is None:
+                self._async_client_lock = asyncio.Lock()
+            async with self._async_client_lock:
+                if self._async_client is None:
+                    self._async_client = await ClientAsync(self.token).init()
+        return self._async_client
+
+    async def search_async(self, query: str, page: int = 0) -> dict:
+        """
+        То же, что search, но не блокирует поток: для async-обработчиков.
+        Одинаковые запросы, пришедшие одновременно, отправляются в Яндекс Музыку один раз.
+        """
+        async def load():
+            client = await self._get_async_client()
+            return self._search_results(await client.search(query, type_='track', page=page))
+
+        return await self.search_cache.get_or_load(self.search_cache.key(query, page), load)
+
+    @staticmethod
+    def _search_results(search_result) -> dict:
         if not search_result.tracks or not search_result.tracks.results:
             return {"total": 0, "tracks": []}
 
@@ -54,18 +90,27 @@ class SearchDownloadTrack:
             "tracks": results
         }
 
-    def download_and_get_info(self, track_id: str) -> DownloadedTrack:
+    def get_track(self, track_id: str):
         """
-        Скачивает трек, получает текст и упаковывает всё в объект.
-        Этот метод вызывается, когда пользователь нажал кнопку выбора.
+        Получает метаданные трека (без скачивания).
         """
-        # Получаем объект трека
         tracks = self.client.tracks([track_id])
         if not tracks:
             raise ValueError("Трек не найден")
-        
-        track = tracks[0]
-        
+        return tracks[0]
+
+    def _safe_filename(self, track) -> str:
+        # Используем ID в имени файла, чтобы избежать проблем с дублями или спецсимволами
+        filename = f"{track.id}_{track.artists[0].name}-{track.title}"
+
+        # Очистка имени файла от запрещенных символов
+        valid_chars = "-_.()abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+        return "".join(c for c in filename if c in valid_chars)
+
+    def download_track(self, track) -> DownloadedTrack:
+        """
+        Скачивает аудио трека. Текст не запрашивается (поля lyrics пустые).
+        """
         # Логика выбора битрейта
         download_info = track.get_download_info(get_direct_links=True)
         mp3_list = [i for i in download_info if i.codec == 'mp3']
@@ -76,24 +121,37 @@ class SearchDownloadTrack:
         )
 
         # Формируем путь файла
-        # Используем ID в имени файла, чтобы избежать проблем с дублями или спецсимволами
-        filename = f"{track.id}_{track.artists[0].name}-{track.title}"
-
-        # Очистка имени файла от запрещенных символов
-        valid_chars = "-_.()abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
-        safe_filename = "".join(c for c in filename if c in valid_chars)
+        safe_filename = self._safe_filename(track)
         
         full_path = os.path.join(self.download_folder, f"{safe_filename}.{best_quality.codec}")
         lyricspath = os.path.join(self.download_folder, f"{safe_filename}.txt")
         # Скачивание (если файла еще нет)
         if not os.path.exists(full_path):
-            print(f"Скачиваю трек ID {track_id}...")
+            print(f"Скачиваю трек ID {track.id}...")
             best_quality.download(full_path)
             print("Трек успешно скачан")
         else:
             print(f"Файл уже существует: {full_path}")
 
-        # Получение текста
+        return DownloadedTrack(
+            track_id=str(track.id),
+            title=track.title,
+            artist=", ".join([a.name for a in track.artists]),
+            file_path=os.path.abspath(full_path),
+            file_name=safe_filename,
+            lyrics_path=lyricspath,
+            lyrics=None,
+            cover_url=track.cover_uri.replace("%%", "200x200") if track.cover_uri else None,
+            bitrate=best_quality.bitrate_in_kbps,
+            format=best_quality.codec
+        )
+
+    def fetch_lyrics(self, track) -> tuple[Optional[str], str]:
+        """
+        Получает текст трека (LRC, если есть синхронизированный) и сохраняет его рядом с аудио.
+        Возвращает (текст или None, путь к файлу текста).
+        """
+        lyricspath = os.path.join(self.download_folder, f"{self._safe_filename(track)}.txt")
         lyrics_text = None
         lyricstype = "NONE"
         if track.lyrics_info.has_available_sync_lyrics:
@@ -108,16 +166,16 @@ class SearchDownloadTrack:
             with open(lyricspath, "w", encoding="utf-8") as f:
                 f.write(lyrics_text)
 
+        return lyrics_text, lyricspath
+
+    def download_and_get_info(self, track_id: str) -> DownloadedTrack:
+        """
+        Скачивает трек, получает текст и упаковывает всё в объект.
+        Этот метод вызывается, когда пользователь нажал кнопку выбора.
+        """
+        track = self.get_track(track_id)
+        downloaded = self.download_track(track)
+        downloaded.lyrics, downloaded.lyrics_path = self.fetch_lyrics(track)
+
         # Возвращаем готовый объект для другого класса
-        return DownloadedTrack(
-            track_id=str(track.id),
-            title=track.title,
-            artist=", ".join([a.name for a in track.artists]),
-            file_path=os.path.abspath(full_path),
-            file_name=safe_filename,
-            lyrics_path=lyricspath,
-            lyrics=lyrics_text,
-            cover_url=track.cover_uri.replace("%%", "200x200") if track.cover_uri else None,
-            bitrate=best_quality.bitrate_in_kbps,
-            format=best_quality.codec
-        )
\ No newline at end of file
+        return downloaded
@@ -0,0 +1,96 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))  # секунд
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))  # запросов
+
+
+def normalize_query(query: str) -> str:
+    # "Linkin  Park " и "linkin park" — один и тот же запрос
+    return " ".join(query.casefold().split())
+
+
+class SearchCache:
+    """
+    LRU-кэш результатов поиска с временем жизни записей. Ключ — (нормализованный запрос, страница).
+
+    get_or_load объединяет одновременные одинаковые запросы: пока первый ждёт ответа сервиса,
+    остальные ждут тот же результат, а не отправляют свой запрос. Ошибки не кэшируются.
+    Ожидание запросов в полёте работает в одном event loop (loop приложения).
+
+    put сохраняет копию значения, get и get_or_load возвращают копии: вызывающий код может
+    менять полученные словари, не портя кэш и ответы другим клиентам.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    @staticmethod
+    def key(query: str, page: int = 0) -> Tuple[str, int]:
+        return normalize_query(query), page
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Any):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            self._count("misses")
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, load))
+        else:
+            self._count("coalesced")
+        # shield: если клиент, начавший запрос, отключится, остальные всё равно получат ответ
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await load()
+            self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "inflight": len(self._inflight)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+import search_cache
+from search_cache import SearchCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_key_normalization():
+    assert SearchCache.key("  Linkin  PARK ") == SearchCache.key("linkin park") == ("linkin park", 0)
+    assert SearchCache.key("linkin park", 1) != SearchCache.key("linkin park")
+
+
+def test_ttl_expiry(clock):
+    cache = SearchCache(ttl=10, max_entries=4)
+    cache.put("a", {"tracks": [1]})
+    clock.now += 9
+    assert cache.get("a") == {"tracks": [1]}
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0  # the expired entry is dropped on access
+
+
+def test_lru_eviction(clock):
+    cache = SearchCache(ttl=10, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" becomes the most recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_disabled_cache():
+    cache = SearchCache(ttl=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_returns_copies():
+    """Mutating a returned result changes neither the cache nor the caller's stored object."""
+    cache = SearchCache()
+    results = {"tracks": [{"title": "Numb"}]}
+    cache.put("a", results)
+    results["tracks"].clear()
+    first = cache.get("a")
+    first["tracks"][0]["title"] = "changed"
+    assert cache.get("a") == {"tracks": [{"title": "Numb"}]}
+
+
+def test_coalesces_concurrent_loads():
+    """Concurrent identical queries share one load; every caller gets its own copy."""
+    cache = SearchCache()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"tracks": [calls]}
+
+    async def main():
+        results = await asyncio.gather(*(cache.get_or_load("a", load) for _ in range(5)))
+        return results, await cache.get_or_load("a", load)
+
+    results, cached = asyncio.run(main())
+    assert calls == 1
+    assert results == [{"tracks": [1]}] * 5
+    assert results[0] is not results[1]
+    assert cached == {"tracks": [1]}
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["inflight"]) == (1, 4, 1, 0)
+
+
+def test_cancelled_caller_does_not_cancel_load():
+    """The load is shielded: the caller that started it may disconnect, the others still get the answer."""
+    cache = SearchCache()
+    release = None
+
+    async def load():
+        await release.wait()
+        return "result"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.ensure_future(cache.get_or_load("a", load))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_load("a", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "result"
+    assert cache.get("a") == "result"
+
+
+def test_errors_are_not_cached():
+    cache = SearchCache()
+    attempts = 0
+
+    async def load():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError("service unavailable")
+        return "result"
+
+    async def main():
+        with pytest.raises(ConnectionError):
+            await cache.get_or_load("a", load)
+        return await cache.get_or_load("a", load)
+
+    assert asyncio.run(main()) == "result"
+    assert attempts == 2
+    assert cache.stats()["inflight"] == 0
@@ -0,0 +1,2 @@
+from .limits import BATCH, INTERACTIVE, CircuitBreaker, CircuitOpenError, OutboundError, PrioritySemaphore, TokenBucket
+from .scheduler import EndpointConfig, OutboundScheduler, get_outbound
@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Optional
+
+# Приоритеты запросов: меньше — раньше
+INTERACTIVE = 0
+BATCH = 1
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Имена исключений клиентов (openai, grpc в SDK Yandex Cloud), означающие временную проблему
+RETRYABLE_NAMES = ("RateLimit", "Timeout", "Connection", "ResourceExhausted", "Unavailable", "InternalServer")
+
+
+class OutboundError(Exception):
+    pass
+
+
+class CircuitOpenError(OutboundError):
+    """
+    Сервис недавно много раз подряд отвечал ошибкой — запрос отклонён без обращения к нему.
+    """
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    code = getattr(exc, "code", None)
+    if callable(code):
+        # grpc.aio.AioRpcError: code() -> StatusCode.RESOURCE_EXHAUSTED и т.п.
+        try:
+            name = getattr(code(), "name", "")
+        except Exception:
+            name = ""
+        if name in ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "ABORTED"):
+            return True
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(part in type(exc).__name__ for part in RETRYABLE_NAMES)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Задержка из заголовка Retry-After ответа (если клиент его сохранил), секунды.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    # Экспоненциальная задержка с полным джиттером: одновременные клиенты не повторяют запрос синхронно
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов: rate запросов в секунду в среднем, не больше burst подряд.
+    Используется только из одного event loop.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def drain(self, seconds: float):
+        """
+        Сервис сообщил о превышении квоты: новые запросы не выпускаются ближайшие seconds секунд.
+        """
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class PrioritySemaphore:
+    """
+    Ограничение числа одновременных запросов; освободившийся слот получает ожидающий
+    с наименьшим приоритетом (INTERACTIVE раньше BATCH), при равном — пришедший раньше.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже был передан, но ожидающий отменён — отдаём слот дальше
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Слот передаётся напрямую, счётчик активных не меняется
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold неудач подряд запросы отклоняются reset_timeout секунд,
+    затем пропускается один пробный: успех закрывает цепь, неудача снова открывает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """
+        Пробный запрос отменён, не дойдя до результата: следующий запрос снова может стать пробным.
+        """
+        self._probing = False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
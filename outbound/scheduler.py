@@ -0,0 +1,235 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .limits import (
+    INTERACTIVE,
+    CircuitBreaker,
+    CircuitOpenError,
+    OutboundError,
+    PrioritySemaphore,
+    TokenBucket,
+    backoff,
+    is_retryable,
+    retry_after,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    rate: float  # запросов в секунду в среднем
+    burst: int  # запросов подряд без ожидания
+    concurrency: int  # одновременных запросов
+    retries: int = 3
+    backoff_base: float = 0.5
+    backoff_cap: float = 20.0
+    failure_threshold: int = 5  # неудач подряд до размыкания цепи
+    reset_timeout: float = 30.0  # секунд до пробного запроса
+
+
+def _env_config(prefix: str, rate: float, burst: int, concurrency: int) -> EndpointConfig:
+    return EndpointConfig(
+        rate=float(os.getenv(f"{prefix}_RPS", str(rate))),
+        burst=int(os.getenv(f"{prefix}_BURST", str(burst))),
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+    )
+
+
+# Лимиты по умолчанию для внешних сервисов; переопределяются переменными окружения (LLM_RPS, ART_CONCURRENCY, ...)
+DEFAULT_ENDPOINTS = {
+    "llm": lambda: _env_config("LLM", rate=5, burst=5, concurrency=8),
+    "art": lambda: _env_config("ART", rate=1, burst=2, concurrency=2),
+}
+
+
+class Endpoint:
+    """
+    Лимиты одного внешнего сервиса: частота (TokenBucket), одновременность с приоритетами
+    (PrioritySemaphore), повтор временных ошибок с экспоненциальной задержкой и CircuitBreaker.
+    Живёт в event loop планировщика.
+    """
+
+    def __init__(self, name: str, config: EndpointConfig):
+        self.name = name
+        self.config = config
+        self.bucket = TokenBucket(config.rate, config.burst)
+        self.slots = PrioritySemaphore(config.concurrency)
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_timeout)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    async def run(self, call: Callable[[], Awaitable[Any]], priority: int, retries: Optional[int]) -> Any:
+        retries = self.config.retries if retries is None else retries
+        self.stats["calls"] += 1
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name}: сервис временно недоступен, запрос отклонён")
+            try:
+                await self.slots.acquire(priority)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            try:
+                await self.bucket.acquire()
+                result = await call()
+            except asyncio.CancelledError:
+                # Отмена ничего не говорит о здоровье сервиса, но пробный запрос надо отпустить
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # Ошибка в самом запросе (400, невалидные данные) — сервис жив
+                    self.breaker.record_success()
+                if not retryable or attempt == retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = retry_after(e)
+                if delay is not None:
+                    # Квота исчерпана: тормозим все запросы к сервису, а не только этот
+                    self.bucket.drain(delay)
+                else:
+                    delay = backoff(attempt, self.config.backoff_base, self.config.backoff_cap)
+                self.stats["retries"] += 1
+                logger.warning(f"{self.name}: {type(e).__name__}: {e}; retry {attempt + 1}/{retries} in {delay:.1f} s")
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.slots.release()
+            await asyncio.sleep(delay)
+
+
+class OutboundScheduler:
+    """
+    Общий на процесс слой исходящих запросов к внешним сервисам.
+
+    Клиенты (openai.AsyncOpenAI, SDK Yandex Cloud) создаются один раз на пару (сервис, фабрика)
+    и живут в собственном event loop в фоновом потоке, поэтому соединения переиспользуются между запросами и этапами,
+    каждый из которых может крутить свой loop (asyncio.run). Вызывающий код передаёт функцию
+    от клиента, она выполняется в loop планировщика с лимитами сервиса:
+
+        result = await get_outbound().run("llm", make_llm, lambda client: client.chat.completions.create(...))
+        result = get_outbound().call("llm", make_llm, ..., priority=BATCH)  # из синхронного кода
+    """
+
+    def __init__(self, endpoints: Optional[Dict[str, EndpointConfig]] = None):
+        self._configs = dict(endpoints or {})
+        self._endpoints: Dict[str, Endpoint] = {}
+        self._clients: Dict[Tuple[str, Callable[[], Any]], Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="outbound", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def configure(self, name: str, config: EndpointConfig):
+        """
+        Лимиты сервиса; действуют для запросов, отправленных после вызова.
+        """
+        with self._lock:
+            self._configs[name] = config
+            self._endpoints.pop(name, None)
+
+    def _endpoint(self, name: str) -> Endpoint:
+        with self._lock:
+            endpoint = self._endpoints.get(name)
+            if endpoint is None:
+                config = self._configs.get(name)
+                if config is None:
+                    if name not in DEFAULT_ENDPOINTS:
+                        raise OutboundError(f"Неизвестный сервис {name}")
+                    config = self._configs[name] = DEFAULT_ENDPOINTS[name]()
+                endpoint = self._endpoints[name] = Endpoint(name, config)
+            return endpoint
+
+    def _client(self, name: str, factory: Callable[[], Any]) -> Any:
+        # Вызывается только в loop планировщика, поэтому клиент привязан к нему.
+        # Ключ включает фабрику: клиенты с разными настройками не подменяют друг друга
+        key = (name, factory)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = factory()
+        return client
+
+    def submit(
+        self,
+        name: str,
+        client_factory: Callable[[], Any],
+        request: Callable[[Any], Awaitable[Any]],
+        priority: int = INTERACTIVE,
+        retries: Optional[int] = None,
+    ) -> Future:
+        """
+        Ставит запрос в очередь сервиса name. request получает общий клиент (создаётся
+        client_factory при первом обращении) и возвращает корутину. Клиент кэшируется по самой
+        фабрике, поэтому она должна быть долгоживущей функцией, а не lambda на каждый вызов.
+        retries=0 — без повторов (например, для потоковых ответов, часть которых уже отдана).
+        """
+        endpoint = self._endpoint(name)
+
+        async def call():
+            client = self._client(name, client_factory)
+            return await endpoint.run(lambda: request(client), priority, retries)
+
+        return asyncio.run_coroutine_threadsafe(call(), self.loop)
+
+    async def run(self, name, client_factory, request, priority: int = INTERACTIVE, retries: Optional[int] = None) -> Any:
+        """
+        submit для вызова из любого event loop.
+        """
+        future = self.submit(name, client_factory, request, priority, retries)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def call(self, name, client_factory, request, priority: int = INTERACTIVE, retries: Optional[int] = None, timeout: Optional[float] = None) -> Any:
+        """
+        submit для синхронного кода: блокирует до результата.
+        """
+        return self.submit(name, client_factory, request, priority, retries).result(timeout)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            endpoints = dict(self._endpoints)
+        return {
+            name: {**e.stats, "breaker": e.breaker.state, "waiting": e.slots.waiting}
+            for name, e in endpoints.items()
+        }
+
+    def shutdown(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            self._endpoints.clear()
+            self._clients.clear()
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+_outbound: Optional[OutboundScheduler] = None
+_outbound_lock = threading.Lock()
+
+
+def get_outbound() -> OutboundScheduler:
+    global _outbound
+    with _outbound_lock:
+        if _outbound is None:
+            _outbound = OutboundScheduler()
+        return _outbound
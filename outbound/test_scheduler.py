@@ -0,0 +1,211 @@
+import asyncio
+import http.client
+import http.server
+import threading
+import time
+
+import pytest
+
+from outbound import BATCH, INTERACTIVE, CircuitOpenError, EndpointConfig, OutboundScheduler
+from outbound import scheduler as scheduler_module
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    # Ответы по порядку: (статус, заголовки, задержка в секундах); когда список кончился — 200
+    responses = []
+    hits = []
+
+    def do_GET(self):
+        self.hits.append((self.path, time.monotonic()))
+        status, headers, delay = self.responses.pop(0) if self.responses else (200, {}, 0)
+        time.sleep(delay)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(self.path.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class StubError(Exception):
+    def __init__(self, status_code, headers):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers
+
+
+class StubClient:
+    """Minimal blocking HTTP client, run in a thread so the scheduler loop stays free."""
+
+    def __init__(self, port):
+        self.port = port
+
+    def _get(self, path):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read().decode()
+            if response.status != 200:
+                raise StubError(response.status, dict(response.getheaders()))
+            return body
+        finally:
+            connection.close()
+
+    async def get(self, path="/"):
+        return await asyncio.to_thread(self._get, path)
+
+
+@pytest.fixture
+def server():
+    StubHandler.responses = []
+    StubHandler.hits = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def outbound():
+    scheduler = OutboundScheduler()
+    yield scheduler
+    scheduler.shutdown()
+
+
+@pytest.fixture
+def factory(server):
+    port = server.server_address[1]
+
+    def make_stub_client():
+        return StubClient(port)
+
+    return make_stub_client
+
+
+def test_retry_after_is_honoured(outbound, factory):
+    """A 429 with Retry-After holds the request for that long, then the retry succeeds."""
+    outbound.configure("stub", EndpointConfig(rate=100, burst=10, concurrency=2))
+    StubHandler.responses = [(429, {"Retry-After": "0.3"}, 0)]
+
+    assert outbound.call("stub", factory, lambda client: client.get("/a"), timeout=5) == "/a"
+    (_, first), (_, second) = StubHandler.hits
+    assert second - first >= 0.3
+    assert outbound.stats()["stub"]["retries"] == 1
+
+
+def test_backoff_between_retries(outbound, factory, monkeypatch):
+    """Without Retry-After the exponential backoff is used; after the last retry the error is raised."""
+    attempts = []
+    monkeypatch.setattr(scheduler_module, "backoff", lambda attempt, base, cap: attempts.append(attempt) or 0.01)
+    outbound.configure("stub", EndpointConfig(rate=100, burst=10, concurrency=2, retries=2, failure_threshold=10))
+    StubHandler.responses = [(503, {}, 0)] * 3
+
+    with pytest.raises(StubError) as error:
+        outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    assert error.value.status_code == 503
+    assert attempts == [0, 1]
+    assert len(StubHandler.hits) == 3
+
+
+def test_client_errors_are_not_retried(outbound, factory):
+    outbound.configure("stub", EndpointConfig(rate=100, burst=10, concurrency=2))
+    StubHandler.responses = [(400, {}, 0)]
+
+    with pytest.raises(StubError):
+        outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    assert len(StubHandler.hits) == 1
+    assert outbound.stats()["stub"]["breaker"] == "closed"
+
+
+def test_interactive_requests_go_first(outbound, factory):
+    """With one slot busy, a later interactive request overtakes the queued batch ones."""
+    outbound.configure("stub", EndpointConfig(rate=1000, burst=1000, concurrency=1))
+    StubHandler.responses = [(200, {}, 0.2)]
+
+    busy = outbound.submit("stub", factory, lambda client: client.get("/busy"))
+    time.sleep(0.05)  # /busy holds the only slot
+    futures = [outbound.submit("stub", factory, lambda client, i=i: client.get(f"/batch{i}"), BATCH) for i in range(3)]
+    futures.append(outbound.submit("stub", factory, lambda client: client.get("/interactive"), INTERACTIVE))
+    for future in [busy] + futures:
+        future.result(5)
+
+    assert [path for path, _ in StubHandler.hits] == ["/busy", "/interactive", "/batch0", "/batch1", "/batch2"]
+
+
+def test_circuit_breaker_opens_and_recovers(outbound, factory):
+    """Failures in a row open the circuit; after reset_timeout one probe is let through."""
+    outbound.configure(
+        "stub", EndpointConfig(rate=1000, burst=1000, concurrency=1, retries=0, failure_threshold=2, reset_timeout=0.3)
+    )
+    StubHandler.responses = [(503, {}, 0)] * 3
+
+    for _ in range(2):
+        with pytest.raises(StubError):
+            outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    assert outbound.stats()["stub"]["breaker"] == "open"
+    with pytest.raises(CircuitOpenError):
+        outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    assert len(StubHandler.hits) == 2  # the rejected request never reached the service
+
+    # A failed probe opens the circuit again
+    time.sleep(0.35)
+    assert outbound.stats()["stub"]["breaker"] == "half-open"
+    with pytest.raises(StubError):
+        outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    assert outbound.stats()["stub"]["breaker"] == "open"
+
+    # A successful probe closes it
+    time.sleep(0.35)
+    assert outbound.call("stub", factory, lambda client: client.get("/probe"), timeout=5) == "/probe"
+    assert outbound.stats()["stub"]["breaker"] == "closed"
+    assert outbound.stats()["stub"]["rejected"] == 1
+
+
+def test_clients_are_cached_per_factory(outbound):
+    """Each factory gets its own client, created once and reused across requests."""
+    created = []
+
+    def make_a():
+        created.append("a")
+        return "a"
+
+    def make_b():
+        created.append("b")
+        return "b"
+
+    async def echo(client):
+        return client
+
+    outbound.configure("stub", EndpointConfig(rate=1000, burst=1000, concurrency=2))
+    results = [outbound.call("stub", factory, echo, timeout=5) for factory in (make_a, make_b, make_a, make_b)]
+    assert results == ["a", "b", "a", "b"]
+    assert created == ["a", "b"]
+
+
+def test_cancelled_probe_releases_half_open(outbound, factory):
+    """A half-open probe that is cancelled does not leave the service rejected forever."""
+    outbound.configure(
+        "stub", EndpointConfig(rate=1000, burst=1000, concurrency=1, retries=0, failure_threshold=1, reset_timeout=0.2)
+    )
+    StubHandler.responses = [(503, {}, 0), (200, {}, 0.5)]
+
+    with pytest.raises(StubError):
+        outbound.call("stub", factory, lambda client: client.get(), timeout=5)
+    time.sleep(0.25)
+    assert outbound.stats()["stub"]["breaker"] == "half-open"
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(outbound.run("stub", factory, lambda client: client.get("/slow")))
+        await asyncio.sleep(0.1)  # the probe is inside the request
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+    time.sleep(0.5)  # the cancelled request finishes in its thread
+    assert outbound.call("stub", factory, lambda client: client.get("/next"), timeout=5) == "/next"
+    assert outbound.stats()["stub"]["breaker"] == "closed"
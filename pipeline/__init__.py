@@ -0,0 +1,2 @@
+from .jobs import Job, JobManager
+from . import track_pipeline
@@ -0,0 +1,114 @@
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .jobs import Job, QUEUED, SKIPPED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Этап конвейера. fn вызывается с результатами зависимостей в виде именованных аргументов.
+    """
+    name: str
+    fn: Callable[..., Any]
+    deps: Sequence[str] = ()
+
+
+class StageGraph:
+    """
+    Граф зависимостей этапов. Каждый этап запускается, как только готовы все его входы,
+    независимые этапы выполняются параллельно.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Имена этапов должны быть уникальны")
+        for stage in stages:
+            unknown = [d for d in stage.deps if d not in self.stages]
+            if unknown:
+                raise ValueError(f"Этап {stage.name} зависит от неизвестных этапов: {unknown}")
+        self._check_acyclic()
+        self.timings: Dict[str, float] = {}
+
+    def _check_acyclic(self) -> None:
+        visiting, visited = set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Цикл в графе этапов через {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _run_stage(self, stage: Stage, kwargs: Dict[str, Any], job: Optional[Job]) -> Any:
+        started = time.perf_counter()
+        try:
+            if job is None:
+                return stage.fn(**kwargs)
+            with job.stage(stage.name):
+                return stage.fn(**kwargs)
+        finally:
+            self.timings[stage.name] = time.perf_counter() - started
+
+    def run(self, job: Optional[Job] = None, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Выполняет граф и возвращает результаты всех этапов по именам.
+        При ошибке этапа новые этапы не запускаются, исключение пробрасывается дальше.
+        max_workers меньше числа этапов — ValueError.
+        """
+        # Этапы могут ждать друг друга и в обход deps (align забирает пачки edit из очереди, пока edit
+        # работает), поэтому поток нужен каждому этапу: иначе ждущий этап займёт поток того, кого ждёт
+        workers = max_workers or len(self.stages)
+        if workers < len(self.stages):
+            raise ValueError(f"Графу из {len(self.stages)} этапов нужно не меньше {len(self.stages)} потоков, задано {workers}")
+        if job is not None:
+            for name in self.stages:
+                job.set_stage(name, QUEUED)
+
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage") as executor:
+            while pending or running:
+                if error is None:
+                    ready = [s for s in pending.values() if all(d in results for d in s.deps)]
+                    for stage in ready:
+                        del pending[stage.name]
+                        kwargs = {d: results[d] for d in stage.deps}
+                        running[executor.submit(self._run_stage, stage, kwargs, job)] = stage.name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Этап {name} завершился с ошибкой: {e}")
+                        if error is None:
+                            error = e
+
+        if error is not None:
+            if job is not None:
+                for name in pending:
+                    job.set_stage(name, SKIPPED)
+            raise error
+
+        logger.info("Время этапов: " + ", ".join(f"{n}={t:.2f}s" for n, t in self.timings.items()))
+        return results
@@ -0,0 +1,122 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько треков обрабатывается одновременно
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", "1"))
+# Сколько завершённых задач хранится для GET /jobs/{id}
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "1000"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class Job:
+    job_id: str
+    track_id: int
+    status: str = QUEUED
+    stages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def set_stage(self, name: str, status: str, **info) -> None:
+        with self._lock:
+            self.stages.setdefault(name, {}).update(status=status, **info)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Отмечает этап как выполняющийся и сохраняет его статус и время работы.
+        """
+        started = time.time()
+        self.set_stage(name, RUNNING, started_at=started)
+        try:
+            yield
+        except Exception as e:
+            self.set_stage(name, FAILED, error=str(e), duration=time.time() - started)
+            raise
+        self.set_stage(name, DONE, duration=time.time() - started)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "track_id": self.track_id,
+                "status": self.status,
+                "stages": {name: dict(info) for name, info in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """
+    Очередь задач обработки треков с ограниченным пулом воркеров.
+    """
+
+    def __init__(self, max_workers: int = PROCESSING_WORKERS, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="track-worker")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[int, Job] = {}
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+
+    def submit(self, track_id: int, fn: Callable[[Job], Dict]) -> Job:
+        """
+        Ставит трек в очередь. Повторный запрос того же трека, пока он обрабатывается,
+        возвращает уже существующую задачу.
+        """
+        with self._lock:
+            active = self._active.get(track_id)
+            if active is not None:
+                return active
+            job = Job(job_id=uuid.uuid4().hex, track_id=track_id)
+            self._jobs[job.job_id] = job
+            self._active[track_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict]) -> None:
+        job.status = RUNNING
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except Exception as e:
+            logger.exception(f"Ошибка обработки трека {job.track_id}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            with self._lock:
+                self._active.pop(job.track_id, None)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
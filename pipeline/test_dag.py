@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from pipeline.dag import Stage, StageGraph
+from pipeline.jobs import DONE, FAILED, SKIPPED, Job
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def stage(self, name, value=None, delay=0.0):
+        def run(**deps):
+            with self._lock:
+                self.events.append(("start", name))
+            time.sleep(delay)
+            with self._lock:
+                self.events.append(("end", name))
+            return value if value is not None else (name, deps)
+
+        return run
+
+    def index(self, kind, name):
+        return self.events.index((kind, name))
+
+
+def test_results_and_dependency_order():
+    recorder = Recorder()
+    graph = StageGraph([
+        Stage("c", recorder.stage("c"), ("a", "b")),
+        Stage("a", recorder.stage("a", 1, delay=0.05)),
+        Stage("b", recorder.stage("b", 2, delay=0.05)),
+    ])
+    results = graph.run()
+    assert results["c"] == ("c", {"a": 1, "b": 2})
+    assert recorder.index("start", "c") > max(recorder.index("end", "a"), recorder.index("end", "b"))
+    # Независимые этапы идут параллельно
+    assert max(recorder.index("start", "a"), recorder.index("start", "b")) < min(recorder.index("end", "a"), recorder.index("end", "b"))
+    assert set(graph.timings) == {"a", "b", "c"}
+
+
+def test_failure_skips_dependents():
+    """A failed stage stops new stages; stages already running finish; the error is raised."""
+    recorder = Recorder()
+
+    def fail():
+        raise RuntimeError("сбой")
+
+    graph = StageGraph([
+        Stage("a", fail),
+        Stage("b", recorder.stage("b", delay=0.1)),
+        Stage("after_a", recorder.stage("after_a"), ("a",)),
+        Stage("after_b", recorder.stage("after_b"), ("b",)),
+    ])
+    job = Job(job_id="job", track_id=1)
+    with pytest.raises(RuntimeError, match="сбой"):
+        graph.run(job)
+    assert recorder.events == [("start", "b"), ("end", "b")]
+    statuses = {name: info["status"] for name, info in job.stages.items()}
+    assert statuses == {"a": FAILED, "b": DONE, "after_a": SKIPPED, "after_b": SKIPPED}
+
+
+def test_sibling_handoff_through_queue():
+    """Stages that pass data through a queue outside deps run side by side, as edit and align do."""
+    batches = queue.Queue()
+
+    def produce(source):
+        for item in source:
+            batches.put(item)
+            time.sleep(0.01)
+        batches.put(None)
+        return len(source)
+
+    def consume(source):
+        return list(iter(batches.get, None))
+
+    graph = StageGraph([
+        Stage("source", lambda: [1, 2, 3]),
+        Stage("consume", consume, ("source",)),
+        Stage("produce", produce, ("source",)),
+    ])
+    assert graph.run()["consume"] == [1, 2, 3]
+
+
+def test_too_few_workers():
+    """A pool smaller than the graph could leave a waiting stage holding the only thread."""
+    graph = StageGraph([Stage("a", lambda: 1), Stage("b", lambda: 2), Stage("c", lambda: 3)])
+    with pytest.raises(ValueError):
+        graph.run(max_workers=2)
+    assert graph.run(max_workers=3) == {"a": 1, "b": 2, "c": 3}
+
+
+@pytest.mark.parametrize(
+    "stages",
+    [
+        [Stage("a", print), Stage("a", print)],
+        [Stage("a", print, ("missing",))],
+        [Stage("a", print, ("b",)), Stage("b", print, ("a",))],
+    ],
+)
+def test_invalid_graph(stages):
+    with pytest.raises(ValueError):
+        StageGraph(stages)
@@ -0,0 +1,184 @@
+import os
+import queue
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from music_service.music_service import SearchDownloadTrack
+from skey.skey import detect_key, load_key_model
+from separation import AudioBuffer, SourceSeparator
+from KaraokeProcessor.KaraokeProcessor import KaraokeProcessor, AudioLoader, LyricsProvider, LLMTextEditor, ASRService, Aligner
+from yandex_generate.image_generator import get_image_generator
+from yandex_generate.renditions import get_rendition_renderer
+from model_registry import ModelKey, get_registry
+from transposition import get_transposer
+from .dag import Stage, StageGraph
+from .jobs import RUNNING, Job
+
+logger = logging.getLogger(__name__)
+
+SEPARATED_DIR = "data/separated_songs"
+NUM_IMAGES = 10
+
+
+def build_track_graph(track_id: int, yandex_service: SearchDownloadTrack, job: Optional[Job] = None) -> StageGraph:
+    """
+    Граф этапов обработки трека. Критический путь: download -> decode -> separate -> transcribe -> edit -> align,
+    тональность, текст песни и картинки считаются параллельно с ним. edit и align работают внахлёст:
+    align выравнивает пачки исправленных сегментов, пока LLM генерирует следующие, а prompts
+    начинается сразу после правки текста, не дожидаясь выравнивания. Если у трека есть LRC,
+    transcribe и edit не обращаются к whisper и LLM, а сразу отдают строки текста с метками времени.
+
+    Стемы пишутся в mp3 по мере разделения: с job в статусе этапа separate (GET /jobs/{id})
+    появляются ссылки на них и сколько секунд уже готово, плеер может начинать воспроизведение раньше.
+    """
+
+    def track():
+        return yandex_service.get_track(track_id)
+
+    def download(track):
+        return yandex_service.download_track(track)
+
+    # Пачки исправленных сегментов от edit к align; None — правка закончилась
+    edited_batches = queue.Queue()
+
+    def lyrics(track):
+        _, lyrics_path = yandex_service.fetch_lyrics(track)
+        if os.path.exists(lyrics_path):
+            return LyricsProvider(lyrics_path)
+        return None
+
+    def decode(download):
+        # Трек декодируется один раз, дальше этапы берут из буфера нужную частоту
+        return AudioBuffer.from_file(download.file_path)
+
+    def key(download, decode):
+        key_model = get_registry().get(ModelKey("skey", "cuda"), lambda: load_key_model(device="cuda"))
+        # Тональность оценивается по нескольким фрагментам, весь трек — только если они расходятся
+        return detect_key(audio=decode.view(key_model.sr, channels=1), extension=download.format, model=key_model, excerpt=True)
+
+    def separate(download, decode):
+        track_name = Path(download.file_name).stem
+        base_url = f"{SEPARATED_DIR}/mdx_q/{track_name}"
+
+        def progress(chunk):
+            if job is not None:
+                job.set_stage(
+                    "separate",
+                    RUNNING,
+                    partial_stems={
+                        "vocals_url": f"{base_url}/vocals.mp3",
+                        "instrumental_url": f"{base_url}/no_vocals.mp3",
+                        "seconds": round(chunk.start_seconds + chunk.duration, 1),
+                    },
+                )
+
+        separation = SourceSeparator().separate_buffer_stream(decode, track_name, SEPARATED_DIR, on_chunk=progress)
+        return base_url, separation
+
+    def stems(separate):
+        # mp3 дописываются по ходу разделения; к этому моменту они уже готовы
+        _, separation = separate
+        return separation.wait_saved()
+
+    def transpose(separate, stems):
+        # Популярные сдвиги минуса рендерятся в фоне и к запросу пользователя уже лежат в кэше
+        base_url, _ = separate
+        get_transposer().prefetch(Path(base_url).name, f"{base_url}/no_vocals.mp3")
+
+    def transcribe(separate, lyrics):
+        _, separation = separate
+        synced = lyrics is not None and lyrics.is_synced
+        kp = KaraokeProcessor(
+            AudioLoader(separation.as_buffer("vocals")),
+            lyrics,
+            LLMTextEditor(),
+            # С LRC распознавание не запускается, модель whisper даже не загружается
+            None if synced else ASRService("large-v3", "cuda"),
+            Aligner("cuda")
+        )
+        audio, asr_result = kp.transcribe()
+        return kp, audio, asr_result
+
+    def edit(transcribe):
+        kp, _, asr_result = transcribe
+        edited = []
+        try:
+            for batch in kp.edit_batches(asr_result):
+                edited.extend(batch)
+                edited_batches.put(batch)
+        finally:
+            # align не ждёт вечно, если правка упала: ошибка придёт из этого этапа
+            edited_batches.put(None)
+        return edited
+
+    def align(transcribe):
+        # Стартует вместе с edit и выравнивает пачки по мере их готовности
+        kp, audio, asr_result = transcribe
+        return kp.align_batches(audio, iter(edited_batches.get, None), asr_result["language"])
+
+    def prompts(transcribe, edit):
+        kp, _, _ = transcribe
+        return kp.create_image_prompts(NUM_IMAGES)
+
+    def images(separate, prompts):
+        images_dir = f"{separate[0]}/images"
+        os.makedirs(images_dir, exist_ok=True)
+        asyncio.run(get_image_generator().generate_list_of_images(prompts, f"{images_dir}/"))
+        return images_dir
+
+    def renditions(images):
+        # Уменьшенные WebP-версии для /images: клиент не качает полноразмерные jpg
+        return get_rendition_renderer().render_folder(images)
+
+    return StageGraph([
+        Stage("track", track),
+        Stage("download", download, ("track",)),
+        Stage("lyrics", lyrics, ("track",)),
+        Stage("decode", decode, ("download",)),
+        Stage("key", key, ("download", "decode")),
+        Stage("separate", separate, ("download", "decode")),
+        Stage("stems", stems, ("separate",)),
+        Stage("transpose", transpose, ("separate", "stems")),
+        Stage("transcribe", transcribe, ("separate", "lyrics")),
+        Stage("edit", edit, ("transcribe",)),
+        Stage("align", align, ("transcribe",)),
+        Stage("prompts", prompts, ("transcribe", "edit")),
+        Stage("images", images, ("separate", "prompts")),
+        Stage("renditions", renditions, ("images",)),
+    ])
+
+
+def process_track(job: Job, yandex_service: SearchDownloadTrack) -> Dict:
+    """
+    Полная обработка трека: скачивание, тональность, разделение, караоке-текст и картинки.
+    Выполняется в воркере JobManager, статус этапов пишется в job.
+    """
+    logger.info(f"Запрос на обработку трека ID: {job.track_id}")
+    graph = build_track_graph(job.track_id, yandex_service, job)
+    results = graph.run(job)
+
+    track_file_dto = results["download"]
+    base_url, _ = results["separate"]
+    return {
+        "status": "success",
+        "track_info": {
+            "id": track_file_dto.track_id,
+            "title": track_file_dto.title,
+            "artist": track_file_dto.artist,
+            "coverUrl": "http://" + track_file_dto.cover_url
+        },
+        "analysis": {
+            "key": results["key"].key,
+            "key_confidence": results["key"].confidence,
+        },
+        "downloads": {
+            # Ссылки на файлы для песни
+            "vocals_url": f"{base_url}/vocals.mp3",
+            "instrumental_url": f"{base_url}/no_vocals.mp3",
+            "images_url": f"{Path(track_file_dto.file_name).stem}"
+        },
+        "karaokeData": results["align"],  # Результат работы KaraokeProcessor
+        "timings": graph.timings,
+    }
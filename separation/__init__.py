@@ -1,2 +1,3 @@
 from .source_separator import SourceSeparator
 from .audio_converter import AudioConverter
+from .audio_buffer import AudioBuffer
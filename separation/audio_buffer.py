@@ -0,0 +1,63 @@
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import librosa
+import numpy as np
+
+
+class AudioBuffer:
+    """
+    Аудио, декодированное один раз в память: float32 (channels, samples) на исходной частоте.
+    Ресемплированные представления для разных этапов (skey, demucs, whisper) кэшируются.
+    """
+
+    def __init__(self, samples: np.ndarray, sr: int):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[np.newaxis, :]
+        self.samples = samples
+        self.sr = sr
+        self._views: Dict[Tuple[int, Optional[int]], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "AudioBuffer":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Аудиофайл не найден: {path}")
+        samples, sr = librosa.load(path, sr=None, mono=False)
+        return cls(samples, sr)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[1] / self.sr
+
+    def view(self, sr: int, channels: Optional[int] = None) -> np.ndarray:
+        """
+        Аудио на частоте sr. channels=1 — моно (1D массив), channels=2 — стерео,
+        None — исходное число каналов. Результат кэшируется и общий для всех этапов — не изменять на месте.
+        """
+        key = (sr, channels)
+        with self._lock:
+            cached = self._views.get(key)
+        if cached is not None:
+            return cached
+
+        audio = self.samples
+        if channels == 1:
+            audio = audio.mean(axis=0)
+        elif channels is not None and channels != audio.shape[0]:
+            if audio.shape[0] == 1:
+                audio = np.repeat(audio, channels, axis=0)
+            else:
+                audio = np.repeat(audio.mean(axis=0, keepdims=True), channels, axis=0)
+        if sr != self.sr:
+            audio = librosa.resample(audio, orig_sr=self.sr, target_sr=sr, axis=-1)
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+
+        with self._lock:
+            return self._views.setdefault(key, audio)
@@ -1,9 +1,18 @@
-import demucs.separate
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-import tempfile
-import shutil
+from typing import Callable, Dict, Iterator, Optional, Union
 
-from .audio_converter import AudioConverter
+import numpy as np
+import torch
+from demucs.apply import apply_model
+from demucs.audio import convert_audio, save_audio
+from demucs.pretrained import get_model
+from demucs.separate import load_track
+
+from model_registry import ModelKey, get_registry
+from .audio_buffer import AudioBuffer
+from .streaming import ProgressiveMp3Writer, StemChunk, iter_array_windows, iter_file_windows, with_last
 
 DEMUCS_MODELS = [
     "htdemucs",
@@ -17,63 +26,304 @@ DEMUCS_MODELS = [
     "SIG",
 ]
 
+# Кодирование стемов в mp3 идёт в фоне и не задерживает следующие этапы
+_encoder_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stem-encoder")
+
+
+@dataclass
+class SeparationResult:
+    """
+    Стемы в памяти: float32 массивы (channels, samples) на частоте модели.
+    saved — фоновая запись mp3 на диск (None, если запись не запрашивалась).
+    """
+    stems: Dict[str, np.ndarray]
+    samplerate: int
+    output_dir: Optional[Path] = None
+    saved: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def vocals(self) -> np.ndarray:
+        return self.stems["vocals"]
+
+    @property
+    def no_vocals(self) -> np.ndarray:
+        return self.stems["no_vocals"]
+
+    def as_buffer(self, name: str) -> AudioBuffer:
+        return AudioBuffer(self.stems[name], self.samplerate)
+
+    def wait_saved(self) -> Optional[Path]:
+        """
+        Дожидается записи стемов на диск и пробрасывает ошибку записи, если она была.
+        """
+        if self.saved is not None:
+            self.saved.result()
+        return self.output_dir
+
 
 class SourceSeparator:
-    def __init__(self, model: str = "mdx_q"):
+    """
+    Разделение трека на vocals / no_vocals моделью demucs, загруженной один раз в реестр.
+
+    Args:
+        model: Имя модели demucs.
+        device: "cuda" или "cpu"; по умолчанию cuda, если доступна.
+        segment: Длина сегмента в секундах (None — значение модели).
+        overlap: Перекрытие соседних сегментов (доля).
+        shifts: Число случайных сдвигов для усреднения (больше — качественнее и медленнее).
+        jobs: Число потоков demucs для обработки сегментов на CPU (0 — в текущем потоке).
+    """
+
+    def __init__(
+        self,
+        model: str = "mdx_q",
+        device: str | None = None,
+        segment: Optional[float] = None,
+        overlap: float = 0.25,
+        shifts: int = 1,
+        jobs: int = 0,
+    ):
         if model not in DEMUCS_MODELS:
             raise ValueError(
                 f"Отсутствует данная модель: {model}\nДоступные модели: {DEMUCS_MODELS}"
             )
         self.model = model
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        self.segment = segment
+        self.overlap = overlap
+        self.shifts = shifts
+        self.jobs = jobs
+
+    def _load_model(self):
+        # Модель держится в реестре и не перечитывается на каждый трек
+        def loader():
+            separator_model = get_model(self.model)
+            separator_model.to(self.device)
+            separator_model.eval()
+            return separator_model
+
+        return get_registry().get(ModelKey(f"demucs/{self.model}", self.device), loader)
 
-    def _move_dir(self, input_dir: str, output_dir: str) -> None:
-        input_dir = Path(input_dir)
-        output_dir = Path(output_dir)
+    def _separate_tensor(self, separator_model, wav: torch.Tensor) -> Dict[str, torch.Tensor]:
+        # Та же нормализация, что и в demucs.separate
+        ref = wav.mean(0)
+        # clamp защищает от деления на ноль на полностью тихих фрагментах
+        std = ref.std().clamp_min(1e-8)
+        wav = (wav - ref.mean()) / std
+        with torch.no_grad():
+            sources = apply_model(
+                separator_model,
+                wav[None],
+                device=self.device,
+                shifts=self.shifts,
+                overlap=self.overlap,
+                segment=self.segment,
+                num_workers=self.jobs if self.device == "cpu" else 0,
+                progress=False,
+            )[0]
+        sources = sources * std + ref.mean()
 
-        if not input_dir.is_dir():
-            raise ValueError(f"Источник не является директорией: {input_dir}")
+        vocals = sources[separator_model.sources.index("vocals")]
+        no_vocals = sources.sum(0) - vocals
+        return {"vocals": vocals.cpu(), "no_vocals": no_vocals.cpu()}
 
+    @staticmethod
+    def _save_stems(stems: Dict[str, torch.Tensor], samplerate: int, output_dir: Path) -> None:
         output_dir.mkdir(parents=True, exist_ok=True)
+        save_kwargs = dict(samplerate=samplerate, bitrate=320, preset=2, clip="rescale")
+        for name, wav in stems.items():
+            save_audio(wav, str(output_dir / f"{name}.mp3"), **save_kwargs)
+
+    def separate_waveform(
+        self,
+        wav,
+        samplerate: int,
+        output_dir: Optional[str] = None,
+        track_name: Optional[str] = None,
+        background: bool = True,
+    ) -> SeparationResult:
+        """
+        Разделяет waveform (тензор или массив (channels, samples) / (samples,)) без чтения файлов.
+        Если задан output_dir, стемы пишутся в output_dir/<model>/<track_name>/ —
+        по умолчанию в фоне (см. SeparationResult.wait_saved).
+        """
+        separator_model = self._load_model()
+        wav = torch.as_tensor(wav, dtype=torch.float32)
+        if wav.dim() == 1:
+            wav = wav[None]
+        wav = convert_audio(wav, samplerate, separator_model.samplerate, separator_model.audio_channels)
+        stems = self._separate_tensor(separator_model, wav)
+
+        result = SeparationResult(
+            stems={name: s.numpy() for name, s in stems.items()},
+            samplerate=separator_model.samplerate,
+        )
+        if output_dir is not None:
+            if track_name is None:
+                raise ValueError("Для сохранения стемов нужно имя трека")
+            result.output_dir = Path(output_dir).resolve() / self.model / track_name
+            if background:
+                result.saved = _encoder_pool.submit(
+                    self._save_stems, stems, separator_model.samplerate, result.output_dir
+                )
+            else:
+                self._save_stems(stems, separator_model.samplerate, result.output_dir)
+        return result
+
+    def separate_buffer(
+        self,
+        audio: AudioBuffer,
+        track_name: str,
+        output_dir: Optional[str] = "separated_songs",
+        background: bool = True,
+    ) -> SeparationResult:
+        """
+        Разделяет уже декодированное аудио без повторного чтения файла.
+        """
+        separator_model = self._load_model()
+        wav = audio.view(separator_model.samplerate, separator_model.audio_channels)
+        return self.separate_waveform(wav, separator_model.samplerate, output_dir, track_name, background)
 
-        for item in input_dir.rglob("*"):
-            if item.is_file():
-                target = output_dir / item.relative_to(input_dir)
-                target.parent.mkdir(parents=True, exist_ok=True)
-                shutil.move(str(item), str(target))
+    def separate_buffer_stream(
+        self,
+        audio: AudioBuffer,
+        track_name: str,
+        output_dir: str = "separated_songs",
+        on_chunk: Optional[Callable[[StemChunk], None]] = None,
+        chunk_seconds: float = 30.0,
+        overlap_seconds: float = 2.0,
+    ) -> SeparationResult:
+        """
+        separate_buffer с постепенной записью mp3 (separate_stream): начало стемов доступно клиенту
+        через output_dir/<model>/<track_name>/, пока разделяется остальная часть трека.
+        Фрагменты собираются в полные стемы для следующих этапов; к возврату mp3 уже дописаны.
+        """
+        separator_model = self._load_model()
+        wav = audio.view(separator_model.samplerate, separator_model.audio_channels)
+        stems = {
+            name: np.zeros((separator_model.audio_channels, wav.shape[-1]), dtype=np.float32)
+            for name in ("vocals", "no_vocals")
+        }
+
+        def collect(chunk: StemChunk) -> None:
+            for name, stem in chunk.stems.items():
+                part = stems[name][..., chunk.start:chunk.start + stem.shape[-1]]
+                part[...] = stem[..., :part.shape[-1]]
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+        target_dir = self.separate_stream(
+            wav, track_name, output_dir, separator_model.samplerate, collect, chunk_seconds, overlap_seconds
+        )
+        return SeparationResult(stems=stems, samplerate=separator_model.samplerate, output_dir=target_dir)
 
     def separate(self, input_path: str, output_dir: str = "separated_songs") -> str:
         input_path = Path(input_path)
         if not input_path.exists():
             raise FileNotFoundError(f"Аудиофайл не найден: {input_path}")
 
-        if input_path.suffix == "mp3":
-            demucs.separate.main(
-                [
-                    "--mp3",
-                    "--two-stems=vocals",
-                    "-n",
-                    self.model,
-                    "-o",
-                    output_dir,
-                    str(input_path),
-                ]
+        separator_model = self._load_model()
+        wav = load_track(input_path, separator_model.audio_channels, separator_model.samplerate)
+        stems = self._separate_tensor(separator_model, wav)
+
+        output_dir = Path(output_dir).resolve() / self.model / input_path.stem
+        self._save_stems(stems, separator_model.samplerate, output_dir)
+        return output_dir
+
+    def iter_separate(
+        self,
+        source: Union[str, Path, np.ndarray, torch.Tensor],
+        samplerate: Optional[int] = None,
+        chunk_seconds: float = 30.0,
+        overlap_seconds: float = 2.0,
+    ) -> Iterator[StemChunk]:
+        """
+        Потоковое разделение окнами chunk_seconds + overlap_seconds с плавным сшиванием (overlap-add).
+        Фрагменты стемов отдаются по мере готовности; память не зависит от длины трека
+        (путь к файлу читается блоками, массив нарезается без копирования).
+        """
+        separator_model = self._load_model()
+        model_sr, channels = separator_model.samplerate, separator_model.audio_channels
+        hop = round(chunk_seconds * model_sr)
+        overlap = round(overlap_seconds * model_sr)
+        window = hop + overlap
+
+        def to_model(wav, sr: int) -> torch.Tensor:
+            wav = torch.as_tensor(wav, dtype=torch.float32)
+            if wav.dim() == 1:
+                wav = wav[None]
+            return convert_audio(wav, sr, model_sr, channels)[..., :window]
+
+        if isinstance(source, (str, Path)):
+            windows = (
+                to_model(w, sr)
+                for w, sr in iter_file_windows(str(source), chunk_seconds + overlap_seconds, chunk_seconds)
             )
         else:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                song_mp3 = AudioConverter.any_to_mp3(str(input_path), tmpdir)
-                demucs.separate.main(
-                    [
-                        "--mp3",
-                        "--two-stems=vocals",
-                        "-n",
-                        self.model,
-                        "-o",
-                        tmpdir,
-                        song_mp3,
-                    ]
+            if samplerate is None:
+                raise ValueError("Для массива нужно указать samplerate")
+            windows = (
+                to_model(w, samplerate)
+                for w in iter_array_windows(
+                    source, round((chunk_seconds + overlap_seconds) * samplerate), round(chunk_seconds * samplerate)
                 )
-                self._move_dir(Path(tmpdir) / self.model, Path(output_dir) / self.model)
+            )
 
-        output_dir = Path(output_dir).resolve() / self.model / input_path.stem
-      #  del self.model
-        return output_dir
+        fade_in = torch.linspace(0.0, 1.0, overlap)
+        fade_out = 1.0 - fade_in
+        tail: Optional[Dict[str, torch.Tensor]] = None
+        position = 0
+        for wav, is_last in with_last(windows):
+            stems = self._separate_tensor(separator_model, wav)
+            if tail is not None:
+                for name, stem in stems.items():
+                    k = min(overlap, stem.shape[-1], tail[name].shape[-1])
+                    stem[..., :k] = stem[..., :k] * fade_in[:k] + tail[name][..., :k] * fade_out[:k]
+
+            if is_last:
+                ready = stems
+            else:
+                ready = {name: stem[..., :hop] for name, stem in stems.items()}
+                tail = {name: stem[..., hop:hop + overlap] for name, stem in stems.items()}
+
+            yield StemChunk(position, model_sr, {name: stem.numpy() for name, stem in ready.items()})
+            position += hop
+
+    def separate_stream(
+        self,
+        source: Union[str, Path, np.ndarray, torch.Tensor],
+        track_name: str,
+        output_dir: Optional[str] = "separated_songs",
+        samplerate: Optional[int] = None,
+        on_chunk: Optional[Callable[[StemChunk], None]] = None,
+        chunk_seconds: float = 30.0,
+        overlap_seconds: float = 2.0,
+    ) -> Optional[Path]:
+        """
+        Потоковое разделение с постепенной записью vocals.mp3 / no_vocals.mp3:
+        начало файлов можно отдавать клиенту, пока остальная часть ещё обрабатывается.
+        on_chunk получает каждый готовый фрагмент (например, для ASR).
+        """
+        separator_model = self._load_model()
+        target_dir = None
+        writers: Dict[str, ProgressiveMp3Writer] = {}
+        if output_dir is not None:
+            target_dir = Path(output_dir).resolve() / self.model / track_name
+            writers = {
+                name: ProgressiveMp3Writer(
+                    target_dir / f"{name}.mp3", separator_model.samplerate, separator_model.audio_channels
+                )
+                for name in ("vocals", "no_vocals")
+            }
+        try:
+            for chunk in self.iter_separate(source, samplerate, chunk_seconds, overlap_seconds):
+                for name, writer in writers.items():
+                    writer.write(chunk.stems[name])
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return target_dir
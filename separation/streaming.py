@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Tuple, TypeVar
+
+import lameenc
+import numpy as np
+import soundfile
+
+
+@dataclass
+class StemChunk:
+    """
+    Готовый фрагмент стемов: float32 массивы (channels, samples), начиная с сэмпла start.
+    """
+    start: int
+    samplerate: int
+    stems: Dict[str, np.ndarray]
+
+    @property
+    def start_seconds(self) -> float:
+        return self.start / self.samplerate
+
+    @property
+    def duration(self) -> float:
+        return next(iter(self.stems.values())).shape[-1] / self.samplerate
+
+
+class ProgressiveMp3Writer:
+    """
+    Дописывает mp3 по мере поступления фрагментов: уже записанная часть файла
+    сразу доступна для воспроизведения.
+
+    Перегрузка обрабатывается как clip="rescale" в demucs save_audio, но пик всего трека
+    заранее неизвестен: масштаб берётся по наибольшему пику среди уже пришедших фрагментов
+    и действует с фрагмента, где этот пик встретился.
+    """
+
+    def __init__(self, path: Path, samplerate: int, channels: int, bitrate: int = 320):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._encoder = lameenc.Encoder()
+        self._encoder.set_bit_rate(bitrate)
+        self._encoder.set_in_sample_rate(samplerate)
+        self._encoder.set_channels(channels)
+        self._encoder.set_quality(2)
+        self._file = open(self.path, "wb")
+        self._peak = 0.0
+
+    @property
+    def scale(self) -> float:
+        # Та же формула, что и у demucs save_audio(clip="rescale")
+        return 1.0 / max(1.01 * self._peak, 1.0)
+
+    def write(self, wav: np.ndarray) -> None:
+        if wav.size:
+            self._peak = max(self._peak, float(np.abs(wav).max()))
+        pcm = np.clip(wav * (self.scale * 2 ** 15), -2 ** 15, 2 ** 15 - 1).astype(np.int16)
+        self._file.write(self._encoder.encode(pcm.T.tobytes()))
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.write(self._encoder.flush())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_file_windows(path: str, window: float, hop: float) -> Iterator[Tuple[np.ndarray, int]]:
+    """
+    Читает файл окнами длиной window секунд с шагом hop, не загружая его целиком.
+    Возвращает (channels, samples) на частоте файла и саму частоту.
+    """
+    with soundfile.SoundFile(path) as f:
+        sr = f.samplerate
+        window_len, hop_len = round(window * sr), round(hop * sr)
+        carry = np.zeros((0, f.channels), dtype=np.float32)
+        first = True
+        while True:
+            need = window_len - len(carry)
+            block = f.read(need, dtype="float32", always_2d=True)
+            if len(block) == 0 and not first:
+                # Остаток уже целиком попал в предыдущее окно
+                return
+            data = np.concatenate([carry, block]) if len(carry) else block
+            if len(data) == 0:
+                return
+            yield data.T, sr
+            first = False
+            if len(block) < need:
+                return
+            carry = data[hop_len:]
+
+
+def iter_array_windows(wav: np.ndarray, window_len: int, hop_len: int) -> Iterator[np.ndarray]:
+    """
+    Те же окна для аудио, уже лежащего в памяти (без копирования).
+    """
+    total = wav.shape[-1]
+    for start in range(0, max(total, 1), hop_len):
+        yield wav[..., start:start + window_len]
+        if start + window_len >= total:
+            return
+
+
+T = TypeVar("T")
+
+
+def with_last(items: Iterable[T]) -> Iterator[Tuple[T, bool]]:
+    """
+    Помечает последний элемент итератора (нужно, чтобы дописать хвост перекрытия).
+    """
+    iterator = iter(items)
+    try:
+        current = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield current, False
+        current = item
+    yield current, True
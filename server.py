@@ -0,0 +1,12 @@
+"""
+Запуск сервера: python server.py
+
+Главный модуль — этот, а не app.py. Процессы пулов (выравнивание, сдвиг тональности, картинки)
+стартуют через spawn и заново импортируют главный модуль как __mp_main__; этот модуль ничего
+не импортирует и не создаёт, а приложение загружается uvicorn по имени только в основном процессе.
+"""
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("app:app", host="127.0.0.1", port=3001)
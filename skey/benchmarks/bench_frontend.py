@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of the HCQT post-processing (harmonic stacking + dB conversion) and CQT cropping:
+the previous per-call / per-sample implementation vs the current one in skey.hcqt.
+
+Usage (from the skey directory):
+    python -m benchmarks.bench_frontend [--frames 646] [--repeats 20]
+"""
+
+import argparse
+import time
+
+import torch
+import torchaudio
+
+from skey.hcqt import VQT, CropCQT
+
+BATCH_SIZES = (1, 32, 384)
+
+
+def legacy_stack(vqt: torch.Tensor, bin_shifts, n_bins: int) -> torch.Tensor:
+    hvqt = []
+    for shift in bin_shifts:
+        bin_start = shift - min([0] + bin_shifts)
+        hvqt.append(vqt[:, bin_start : bin_start + n_bins, ...])
+    hvqt = torch.stack(hvqt, dim=1)
+    return ((1.0 / 80.0) * torchaudio.transforms.AmplitudeToDB(top_db=80)(hvqt)) + 1.0
+
+
+def legacy_crop(spectrograms: torch.Tensor, transpose: torch.Tensor, height: int) -> torch.Tensor:
+    return torch.stack([s[:, int(start) : int(start) + height, :] for s, start in zip(spectrograms, transpose)])
+
+
+def timeit(fn, repeats: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HCQT front-end micro-benchmark")
+    parser.add_argument("--frames", type=int, default=646, help="Time frames per clip (646 = 15 s at 22050 Hz)")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    hcqt = VQT(harmonics=[1], fmin=27.5, n_bins=99, verbose=False)
+    crop = CropCQT(84)
+    max_offset = 99 - 84
+
+    print(f"{'batch':>6} {'stage':>14} {'old, ms':>10} {'new, ms':>10} {'speedup':>8}")
+    for batch in BATCH_SIZES:
+        vqt = torch.rand(batch, hcqt.n_bins, args.frames)
+        stacked = hcqt.stack_harmonics(vqt)
+        assert torch.allclose(legacy_stack(vqt, hcqt.bin_shifts, hcqt.n_bins_per_slice), stacked)
+
+        # Training crops at random offsets, inference always at offset 0
+        random_offsets = torch.randint(0, max_offset + 1, (batch,))
+        zero_offsets = torch.zeros(batch)
+        for offsets in (random_offsets, zero_offsets):
+            assert torch.equal(legacy_crop(stacked, offsets, 84), crop(stacked, offsets))
+
+        cases = {
+            "stack+db": (
+                lambda: legacy_stack(vqt, hcqt.bin_shifts, hcqt.n_bins_per_slice),
+                lambda: hcqt.stack_harmonics(vqt),
+            ),
+            "crop random": (lambda: legacy_crop(stacked, random_offsets, 84), lambda: crop(stacked, random_offsets)),
+            "crop zero": (lambda: legacy_crop(stacked, zero_offsets, 84), lambda: crop(stacked, zero_offsets)),
+        }
+        for stage, (old, new) in cases.items():
+            old_ms, new_ms = timeit(old, args.repeats), timeit(new, args.repeats)
+            print(f"{batch:>6} {stage:>14} {old_ms:>10.3f} {new_ms:>10.3f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
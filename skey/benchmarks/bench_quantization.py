@@ -0,0 +1,81 @@
+"""
+Accuracy-regression harness for the int8 ChromaNet: speedup over fp32 on CPU, agreement with the
+fp32 KEY_MAP predictions and circle-of-fifths distance of every disagreement.
+
+Static mode is calibrated and evaluated on disjoint tracks: either --calibration-dir, or a
+deterministic split of AUDIO_DIR (--calibration-fraction of the tracks, chosen by file name hash).
+Speedup and agreement are reported on one line, so a gain is never read without its accuracy cost;
+on the development CPU both int8 modes measured only about 1.05x, as the VQT front-end dominates.
+
+Usage (from the skey directory):
+    python -m benchmarks.bench_quantization AUDIO_DIR [--ext wav] [--calibration-dir DIR] [--mode dynamic static]
+"""
+
+import argparse
+import os
+import time
+from collections import Counter
+
+import torch
+
+from skey.key_detection import KEY_MAP, circle_of_fifths_distance, find_audio_files, load_key_model
+from skey.quantization import QUANTIZATION_MODES, clip_batches, quantize_key_model, split_calibration_set
+
+
+def timed_predictions(chromanet, batches, repeats: int):
+    with torch.no_grad():
+        predictions = torch.cat([chromanet(batch) for batch in batches]).argmax(dim=1)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for batch in batches:
+                chromanet(batch)
+    return predictions.tolist(), (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Int8 ChromaNet speed and accuracy report")
+    parser.add_argument("audio_dir", help="Directory with evaluation tracks")
+    parser.add_argument("--ext", default="wav", help="Audio file extension (default: wav)")
+    parser.add_argument("--calibration-dir", default=None, help="Tracks for static calibration, disjoint from audio_dir")
+    parser.add_argument(
+        "--calibration-fraction",
+        type=float,
+        default=0.25,
+        help="Without --calibration-dir: share of audio_dir held out for calibration (default: 0.25)",
+    )
+    parser.add_argument("--mode", nargs="+", choices=QUANTIZATION_MODES, default=list(QUANTIZATION_MODES))
+    parser.add_argument("--max-files", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = find_audio_files(args.audio_dir, args.ext)[: args.max_files]
+    if args.calibration_dir:
+        calibration = find_audio_files(args.calibration_dir, args.ext)[: args.max_files]
+        shared = {os.path.realpath(p) for p in calibration} & {os.path.realpath(p) for p in paths}
+        if shared:
+            parser.exit(1, f"{len(shared)} tracks are both in the calibration and the evaluation set\n")
+        evaluation = paths
+    else:
+        calibration, evaluation = split_calibration_set(paths, args.calibration_fraction)
+
+    model = load_key_model(device="cpu")
+    batches = clip_batches(model, evaluation)
+    reference, fp32_ms = timed_predictions(model.chromanet, batches, args.repeats)
+    print(f"{len(reference)} evaluation clips, {len(calibration)} calibration tracks, fp32 ChromaNet: {fp32_ms:.1f} ms")
+
+    for mode in args.mode:
+        quantized = quantize_key_model(model, mode, calibration, args.ext)
+        predictions, int8_ms = timed_predictions(quantized.chromanet, batches, args.repeats)
+        disagreements = [(a, b) for a, b in zip(reference, predictions) if a != b]
+        distances = Counter(circle_of_fifths_distance(a, b) for a, b in disagreements)
+
+        agreement = 1 - len(disagreements) / len(reference)
+        print(f"\n[{mode}] {int8_ms:.1f} ms, speedup {fp32_ms / int8_ms:.2f}x, agreement with fp32 {agreement:.1%}")
+        for distance, count in sorted(distances.items()):
+            print(f"  circle-of-fifths distance {distance}: {count}")
+        for a, b in disagreements[:10]:
+            print(f"    {KEY_MAP[a]} -> {KEY_MAP[b]}")
+
+
+if __name__ == "__main__":
+    main()
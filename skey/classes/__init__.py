@@ -1 +1,2 @@
-from .image_generator import ImageGenerator
\ No newline at end of file
+from .song import Song
+from .stem_store import StemStore
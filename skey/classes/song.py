@@ -3,7 +3,32 @@ import librosa
 import numpy as np
 import soundfile as sf
 import os
-from skey import detect_key
+from functools import lru_cache
+from skey import detect_key, load_key_model
+from skey.key_detection import KEY_MAP, key_pitch_class
+from .stem_store import StemStore
+
+try:
+    # В сервисе модель общая с этапом key конвейера и учитывается в бюджете памяти реестра
+    from model_registry import ModelKey, get_registry
+except ImportError:
+    # skey запущен отдельно от сервиса
+    get_registry = None
+
+KEY_DEVICE = "cuda"
+
+
+@lru_cache(maxsize=None)
+def _local_key_model(device):
+    return load_key_model(device=device)
+
+
+def key_model(device=KEY_DEVICE):
+    """Модель тональности, загруженная один раз на процесс (через реестр моделей, если он есть)"""
+    if get_registry is None:
+        return _local_key_model(device)
+    return get_registry().get(ModelKey("skey", device), lambda: load_key_model(device=device))
+
 
 class Song:
     KEY_MAP = {
@@ -33,46 +58,83 @@ class Song:
         23: " Bb minor",
     }
 
-    def __init__(self, name, audiofile, sr, meta=None):
+    def __init__(self, name, audiofile, sr, meta=None, num_key=None, store=None):
         # Metadata
         self.name = name
         self.meta = meta # Represents words&&tackts
-        self.audio = {
-            'original' : None,
-            'drums' : None,
-            'bass' : None,
-            'vocal' : None,
-            'other' : None
-        }
+        if store is None:
+            self.audio = {
+                'original' : None,
+                'drums' : None,
+                'bass' : None,
+                'vocal' : None,
+                'other' : None
+            }
+            self.audio['original'] = audiofile
+        else:
+            # Стемы лежат на диске в компактном формате и читаются по требованию
+            self.audio = store
+            if audiofile is not None:
+                store['original'] = audiofile
         self.sr = sr
-        self.audio['original'] = audiofile
-        self.get_key()
+        if num_key is None:
+            self.get_key()
+        else:
+            # Тональность уже известна (например, после сдвига) — модель не запускаем
+            self.num_key = num_key
+            self.key = self.KEY_MAP[num_key]
+
+    def stem(self, audio_type, start=None, end=None):
+        """float32 стем или его фрагмент между start и end секундами; None, если стема нет"""
+        if isinstance(self.audio, StemStore):
+            return self.audio.read(audio_type, start, end) if audio_type in self.audio else None
+        audio = self.audio.get(audio_type)
+        if audio is None:
+            return None
+        first = 0 if start is None else round(start * self.sr)
+        last = None if end is None else round(end * self.sr)
+        return audio[..., first:last]
 
     def get_key(self):
-        self.num_key = detect_key(audio=self.audio['original'], extension="mp3", device="cuda")
+        key = detect_key(audio=self.stem('original'), extension="mp3", device=KEY_DEVICE, model=key_model())
+        self.num_key = next(index for index, name in KEY_MAP.items() if name == key)
         self.key = self.KEY_MAP[self.num_key]
         print(self.key)
 
+    def semitones_to(self, key_index):
+        """
+        Кратчайший сдвиг (от -6 до +5 полутонов) от текущей тоники к тонике key_index.
+        Сдвиг высоты не меняет лад, поэтому key_index другого лада — ошибка (ValueError).
+        """
+        pitch_class, minor = key_pitch_class(key_index)
+        source_pitch_class, source_minor = key_pitch_class(self.num_key)
+        if minor != source_minor:
+            raise ValueError(f"Сдвигом нельзя перейти из{self.key} в{self.KEY_MAP[key_index]}: лад не меняется")
+        steps = (pitch_class - source_pitch_class) % 12
+        return steps - 12 if steps > 5 else steps
+
     # def divide_on_stems(self):
         #TODO сделать разделение на аудиодорожки
 
     def pitch_shift(self, key_index):
-        shifted_stems = {}
+        semitones = self.semitones_to(key_index)
+        # Лад совпадает (проверено в semitones_to), так что новая тональность — ровно key_index
+        new_key = key_index
         stem_keys = ['original']
+        if isinstance(self.audio, StemStore):
+            return self._pitch_shift_store(semitones, new_key, stem_keys)
+
+        shifted_stems = {}
         for audio_type in stem_keys:
-            source_audio = self.audio[audio_type]
+            source_audio = self.stem(audio_type)
             if source_audio is None:
                 shifted_stems[audio_type] = None
             else:
-                shifted_audio = librosa.effects.pitch_shift(source_audio, sr=self.sr, n_steps=(key_index - self.num_key))
-                print(len(shifted_audio))
-                shifted_stems[audio_type] = shifted_audio
-        
+                shifted_stems[audio_type] = pyrb.pitch_shift(source_audio, self.sr, semitones).astype(np.float32)
+
         valid_audio_files = [arr for arr in shifted_stems.values() if arr is not None]
         if not valid_audio_files:
             return None
-        # for arr in valid_audio_files:
-        #     print(len(arr))
         lenght = min(len(arr) for arr in valid_audio_files)
         result_mix = np.zeros(lenght, dtype=np.float32)
         for audio_type in stem_keys:
@@ -80,15 +142,42 @@ class Song:
             if source_audio is not None:
                 trimmed_audio = source_audio[:lenght]
                 shifted_stems[audio_type] = trimmed_audio
-                result_mix += trimmed_audio
-        print(len(result_mix))
-        new_song = Song(self.name + self.KEY_MAP[key_index], result_mix, self.sr, self.meta)
+                np.add(result_mix, trimmed_audio, out=result_mix)
+        new_song = Song(self.name + self.KEY_MAP[new_key], result_mix, self.sr, self.meta, num_key=new_key)
         for audio_type in stem_keys:
             new_song.audio[audio_type] = shifted_stems[audio_type]
         return new_song
 
+    def _pitch_shift_store(self, semitones, new_key, stem_keys):
+        # Сдвинутые стемы по одному пишутся в соседнее хранилище, в памяти держится не больше одного
+        directory = self.audio.directory
+        new_store = StemStore(directory.parent / f"{directory.name}{semitones:+d}", self.sr, self.audio.dtype)
+        for audio_type in stem_keys:
+            source_audio = self.stem(audio_type)
+            if source_audio is not None:
+                new_store[audio_type] = pyrb.pitch_shift(source_audio, self.sr, semitones)
+        if not len(new_store):
+            return None
+        return Song(self.name + self.KEY_MAP[new_key], None, self.sr, self.meta, num_key=new_key, store=new_store)
+
+    def mix(self, stem_keys, start=None, end=None, out=None):
+        """Сумма стемов во float32; при переданном out пишется в него без новых выделений памяти"""
+        if isinstance(self.audio, StemStore):
+            return self.audio.mix(stem_keys, start, end, out=out)
+        stems = [self.stem(audio_type, start, end) for audio_type in stem_keys]
+        stems = [stem for stem in stems if stem is not None]
+        if not stems:
+            return None
+        lenght = min(stem.shape[-1] for stem in stems)
+        out = np.zeros(stems[0].shape[:-1] + (lenght,), dtype=np.float32) if out is None else out[..., :lenght]
+        out.fill(0.0)
+        for stem in stems:
+            np.add(out, stem[..., :lenght], out=out)
+        return out
+
     def export_audio(self, filename="ryu.mp3", track_type="original"):
         """Saves the current state of the audio to a file."""
-        if self.audio[track_type] is not None:
-            sf.write(filename, self.audio[track_type], self.sr)
+        audio = self.stem(track_type)
+        if audio is not None:
+            sf.write(filename, audio, self.sr)
             print(f"Saved {track_type} to {filename}")
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import numpy as np
+
+STEM_NAMES = ('original', 'drums', 'bass', 'vocal', 'other')
+# Сколько сэмплов декодируется за раз при смешивании: буфер маленький и переиспользуется
+MIX_CHUNK = 1 << 16
+INT16_SCALE = 1.0 / 32767
+
+
+class StemStore(MutableMapping):
+    """
+    Стемы песни в .npy файлах (int16 или float16) в одной папке.
+    Файл отображается в память (np.load(mmap_mode="r")) только при первом обращении,
+    срезы по времени не копируют данные.
+
+    store["vocal"]                 -> компактный массив на диске (memmap)
+    store.slice("vocal", 10, 20)   -> view на 10..20 секунды без копирования
+    store.read("vocal", out=buf)   -> float32 в заранее выделенный буфер
+    store.mix(["drums", "bass"])   -> сумма стемов без промежуточных float32 копий
+    """
+
+    def __init__(self, directory, sr, dtype="int16"):
+        if np.dtype(dtype) not in (np.dtype("int16"), np.dtype("float16")):
+            raise ValueError(f"Поддерживаются только int16 и float16, получено {dtype}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sr = sr
+        self.dtype = np.dtype(dtype)
+        self._arrays = {}
+
+    @classmethod
+    def from_arrays(cls, directory, stems, sr, dtype="int16"):
+        store = cls(directory, sr, dtype)
+        for name, audio in stems.items():
+            if audio is not None:
+                store[name] = audio
+        return store
+
+    def _path(self, name):
+        return self.directory / f"{name}.npy"
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            path = self._path(name)
+            if not path.exists():
+                raise KeyError(name)
+            self._arrays[name] = np.load(path, mmap_mode="r")
+        return self._arrays[name]
+
+    def __setitem__(self, name, audio):
+        audio = np.asarray(audio)
+        if self.dtype == np.int16 and audio.dtype != np.int16:
+            audio = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        else:
+            audio = audio.astype(self.dtype, copy=False)
+        # Запись во временный файл и замена: открытые memmap старой версии остаются валидными
+        tmp_path = self._path(name).with_suffix(".tmp.npy")
+        np.save(tmp_path, audio)
+        os.replace(tmp_path, self._path(name))
+        self._arrays.pop(name, None)
+
+    def __delitem__(self, name):
+        self._arrays.pop(name, None)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self._arrays or self._path(name).exists()
+
+    def __iter__(self):
+        return (path.stem for path in sorted(self.directory.glob("*.npy")) if not path.stem.endswith(".tmp"))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def length(self, name):
+        return self[name].shape[-1]
+
+    def _frames(self, start, end, length):
+        start = 0 if start is None else max(0, round(start * self.sr))
+        end = length if end is None else min(length, round(end * self.sr))
+        return start, max(start, end)
+
+    def slice(self, name, start=None, end=None):
+        """
+        Фрагмент стема между start и end секундами в исходном формате, без копирования.
+        """
+        audio = self[name]
+        first, last = self._frames(start, end, audio.shape[-1])
+        return audio[..., first:last]
+
+    def read(self, name, start=None, end=None, out=None):
+        """
+        Фрагмент стема во float32. Если передан out, результат пишется в него.
+        """
+        raw = self.slice(name, start, end)
+        if out is None:
+            out = np.empty(raw.shape, dtype=np.float32)
+        out = out[..., :raw.shape[-1]]
+        if self.dtype == np.int16:
+            np.multiply(raw, np.float32(INT16_SCALE), out=out, casting="unsafe")
+        else:
+            out[...] = raw
+        return out
+
+    def mix(self, names, start=None, end=None, out=None, gains=None):
+        """
+        Сумма стемов (с коэффициентами gains) в буфер out. Декодирование идёт кусками
+        по MIX_CHUNK сэмплов через один небольшой буфер, полные float32 копии стемов не создаются.
+        Длина результата — по самому короткому стему.
+        """
+        names = [name for name in names if name in self]
+        if not names:
+            return None
+        length = min(self.slice(name, start, end).shape[-1] for name in names)
+        shape = self.slice(names[0], start, end).shape[:-1] + (length,)
+        if out is None:
+            out = np.zeros(shape, dtype=np.float32)
+        else:
+            out = out[..., :length]
+            out.fill(0.0)
+        gains = gains or {}
+        scratch = np.empty(shape[:-1] + (min(MIX_CHUNK, length),), dtype=np.float32)
+        for name in names:
+            raw = self.slice(name, start, end)
+            scale = np.float32(gains.get(name, 1.0) * (INT16_SCALE if self.dtype == np.int16 else 1.0))
+            for first in range(0, length, MIX_CHUNK):
+                last = min(first + MIX_CHUNK, length)
+                chunk = scratch[..., :last - first]
+                np.multiply(raw[..., first:last], scale, out=chunk, casting="unsafe")
+                out[..., first:last] += chunk
+        return out
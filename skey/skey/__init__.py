@@ -1,3 +1,3 @@
-from .key_detection import detect_key
+from .key_detection import KeyEstimate, KeyModel, detect_key, detect_key_excerpt, detect_keys_batch, load_key_model
 
-__all__ = ["detect_key"]
+__all__ = ["KeyEstimate", "KeyModel", "detect_key", "detect_key_excerpt", "detect_keys_batch", "load_key_model"]
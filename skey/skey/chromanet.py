@@ -1,6 +1,6 @@
 from typing import List
 
-from einops import rearrange
+import torch
 from torch import nn
 
 from .convnext import ConvNeXtBlock, TimeDownsamplingBlock
@@ -28,10 +28,10 @@ class OctavePool(nn.Module):
         self.bins_per_octave = bins_per_octave
 
     def forward(self, x):
-        # x: (batch_size, channel, H, W)
-        x = rearrange(x, "B C (j k) W -> B C k j W", k=self.bins_per_octave)
-        x = x.mean(dim=3)
-        return x
+        # x: (batch_size, channel, j * k, W) -> (batch_size, channel, j, k, W), averaged over octaves j.
+        # reshape with the batch and time sizes taken from x keeps both dynamic when traced for export
+        x = x.reshape(x.shape[0], x.shape[1], -1, self.bins_per_octave, x.shape[3])
+        return x.mean(dim=2)
 
 
 class ChromaNet(nn.Module):
@@ -100,7 +100,12 @@ class ChromaNet(nn.Module):
             x = time_downsampling_block(x)
             x = convnext_block(x)
         x = self.octave_pool(x)
-        x = self.global_average_pool(x)
+        if torch.jit.is_tracing():
+            # Height is already 12, so the pooling only averages over time; AdaptiveAvgPool2d
+            # would freeze the number of frames into an exported graph
+            x = x.mean(dim=3, keepdim=True)
+        else:
+            x = self.global_average_pool(x)
         x = self.classifier(x)
         x = self.batch_norm(x)
         x = self.flatten(x)
@@ -1,8 +1,29 @@
 # skey/cli.py
 
 import argparse
+import csv
+import json
+import sys
 
-from skey.key_detection import detect_key
+from skey.key_detection import detect_keys_batch, find_audio_files, load_key_model
+
+
+def write_results(paths, keys, output=None, fmt=None):
+    if fmt is None:
+        fmt = "jsonl" if output is not None and output.endswith(".jsonl") else "csv"
+    out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+    try:
+        if fmt == "jsonl":
+            for path, key in zip(paths, keys):
+                out.write(json.dumps({"path": path, "key": key}, ensure_ascii=False) + "\n")
+        else:
+            writer = csv.writer(out)
+            writer.writerow(["Audio File", "Predicted Key"])
+            for path, key in zip(paths, keys):
+                writer.writerow([path, key if key is not None else "error"])
+    finally:
+        if output:
+            out.close()
 
 
 def main():
@@ -11,12 +32,38 @@ def main():
     parser.add_argument(
         "--checkpoint",
         default=None,
-        help="Path to model checkpoint (.pt). Loads default if not provided.",
+        help="Path to a weights-only model checkpoint (python -m skey.export --weights). Loads default if not provided.",
+    )
+    parser.add_argument(
+        "--full-checkpoint",
+        action="store_true",
+        help="--checkpoint is a full training checkpoint (fully unpickled, use only for trusted files)",
     )
     parser.add_argument("--ext", default="wav", help="Audio file extension (default: wav) if audio_dir is a directory")
     parser.add_argument("--device", default="cpu", help="Computation device (e.g., 'cpu', 'cuda', 'mps')")
+    parser.add_argument("--batch-size", type=int, default=16, help="Clips per forward pass (default: 16)")
+    parser.add_argument("--workers", type=int, default=4, help="DataLoader workers for audio decoding (default: 4)")
+    parser.add_argument("--output", default=None, help="Write results to a .csv or .jsonl file instead of stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Output format (default: from --output extension, else csv)")
+    # Static int8 agrees with fp32 on too few tracks to be offered here; it stays available
+    # from skey.quantization for experiments with a separate calibration set
+    parser.add_argument(
+        "--quantize", choices=["dynamic"], default=None, help="Run ChromaNet in int8 on the CPU (dynamic quantization)"
+    )
     args = parser.parse_args()
 
-    ckpt_path = args.checkpoint
+    paths = find_audio_files(args.audio_dir, args.ext)
+    if not paths:
+        parser.exit(1, f"No .{args.ext} files found in {args.audio_dir}\n")
+
+    model = load_key_model(args.checkpoint, args.device, weights_only=not args.full_checkpoint)
+    if args.quantize:
+        from skey.quantization import quantize_key_model
+
+        model = quantize_key_model(model, args.quantize)
+    keys = detect_keys_batch(paths, model=model, batch_size=args.batch_size, num_workers=args.workers)
+    write_results(paths, keys, args.output, args.format)
+
 
-    detect_key(audio_path=args.audio_dir, extension=args.ext, device=args.device, ckpt_path=ckpt_path, cli=True)
+if __name__ == "__main__":
+    main()
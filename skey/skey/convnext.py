@@ -30,6 +30,19 @@ class DropPath(nn.Module):
         return f"drop_prob={round(self.drop_prob, 3):0.3f}"
 
 
+def layer_norm(x: torch.Tensor, eps: float = 1e-5) -> torch.Tensor:
+    """
+    LayerNorm over all but the batch dimension, without affine parameters.
+    When traced for export (skey.export) it is written with reductions, otherwise
+    the normalized shape, and with it the input length, would be frozen into the graph.
+    """
+    if torch.jit.is_tracing():
+        mean = x.mean(dim=(1, 2, 3), keepdim=True)
+        var = (x - mean).pow(2).mean(dim=(1, 2, 3), keepdim=True)
+        return (x - mean) / torch.sqrt(var + eps)
+    return nn.functional.layer_norm(x, x.shape[1:], eps=eps)
+
+
 class ConvNeXtBlock(nn.Module):
     r"""ConvNeXt Block. There are two equivalent implementations:
     (1) DwConv -> LayerNorm (channels_first) -> 1x1 Conv -> GELU -> 1x1 Conv; all in (N, C, H, W)
@@ -63,7 +76,7 @@ class ConvNeXtBlock(nn.Module):
             groups=in_channels,
             padding_mode="replicate",
         )  # depthwise conv
-        self.norm = nn.functional.layer_norm
+        self.norm = layer_norm
         self.pwconv1 = nn.Linear(out_channels, 4 * out_channels)  # pointwise/1x1 convs, implemented with linear layers
         self.act = nn.GELU()
         self.pwconv2 = nn.Linear(4 * out_channels, in_channels)
@@ -77,7 +90,7 @@ class ConvNeXtBlock(nn.Module):
     def forward(self, x):
         input = x
         x = self.dwconv(x)
-        x = self.norm(x, x.shape[1:])
+        x = self.norm(x)
         x = x.permute(0, 2, 3, 1)  # (N, C, H, W) -> (N, H, W, C)
         x = self.pwconv1(x)
         x = self.act(x)
@@ -101,12 +114,12 @@ class TimeDownsamplingBlock(nn.Module):
 
     def __init__(self, in_channels, out_channels, bias=True):
         super().__init__()
-        self.norm = nn.functional.layer_norm
+        self.norm = layer_norm
         self.conv = nn.Conv2d(in_channels, out_channels, kernel_size=(1, 2), stride=(1, 2), bias=bias)
         self.act = nn.GELU()
 
     def forward(self, x):
-        x = self.norm(x, x.shape[1:])
+        x = self.norm(x)
         x = self.conv(x)
         x = self.act(x)
         return x
@@ -0,0 +1,161 @@
+import argparse
+import logging
+import warnings
+from pathlib import Path
+from typing import List, Sequence
+
+import numpy as np
+import torch
+from torch import nn
+
+from .chromanet import ChromaNet
+from .hcqt import VQT, CropCQT
+from .key_detection import DEFAULT_CHECKPOINT_PATH, KEY_MAP, KeyModel, load_checkpoint, load_key_model
+
+
+class KeyDetectionGraph(nn.Module):
+    """
+    Fixed-config inference graph: VQT front-end, crop of the lowest bins and ChromaNet.
+
+    Wraps the loaded modules as they are (`VQT -> CropCQT(transpose=0) -> ChromaNet`); their
+    forwards switch to length-independent ops while traced, so one exported graph accepts any
+    batch size and clip length.
+
+    Args:
+        hcqt (VQT): Loaded VQT front-end.
+        crop_fn (CropCQT): Crop applied to the VQT output.
+        chromanet (ChromaNet): Loaded ChromaNet.
+
+    Forward:
+        Args:
+            audio (Tensor): Mono waveforms of shape (batch_size, samples) at the checkpoint rate.
+
+        Returns:
+            Tensor: Key probabilities of shape (batch_size, 24), indexed like KEY_MAP.
+    """
+
+    def __init__(self, hcqt: VQT, crop_fn: CropCQT, chromanet: ChromaNet):
+        super().__init__()
+        self.hcqt = hcqt
+        self.crop_fn = crop_fn
+        self.chromanet = chromanet
+
+    def forward(self, audio: torch.Tensor) -> torch.Tensor:
+        return self.chromanet(self.crop_fn(self.hcqt(audio), audio.new_zeros(1)))
+
+
+def build_graph(model: KeyModel) -> KeyDetectionGraph:
+    return KeyDetectionGraph(model.hcqt, model.crop_fn, model.chromanet).to(model.device).eval()
+
+
+def export_weights(path: str | Path, ckpt_path: str | Path | None = DEFAULT_CHECKPOINT_PATH) -> Path:
+    """
+    Writes a weights-only copy of the checkpoint (model state and sampling rate, no optimizer
+    or training state), so it can be loaded with `torch.load(..., weights_only=True)`.
+
+    Args:
+        path (str): Output file.
+        ckpt_path (str): Full training checkpoint.
+
+    Returns:
+        Path: The written file.
+    """
+    ckpt = load_checkpoint(ckpt_path)
+    stone = {k: v for k, v in ckpt["stone"].items() if k.startswith(("hcqt.", "chromanet."))}
+    path = Path(path)
+    torch.save({"stone": stone, "audio": {"sr": int(ckpt["audio"]["sr"])}}, path)
+    return path
+
+
+def _example_input(model: KeyModel, seconds: float) -> torch.Tensor:
+    return torch.randn(2, int(model.sr * seconds), device=model.device) * 0.1
+
+
+def export_torchscript(model: KeyModel, path: str | Path, example_seconds: float = 10.0) -> Path:
+    """
+    Traces the inference graph into a TorchScript file loadable with `torch.jit.load`.
+    """
+    graph = build_graph(model)
+    # nnAudio reads kernel sizes as Python ints; they are constants of the fixed config
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        traced = torch.jit.trace(graph, _example_input(model, example_seconds), check_trace=False)
+    path = Path(path)
+    torch.jit.save(traced, str(path))
+    return path
+
+
+def export_onnx(model: KeyModel, path: str | Path, example_seconds: float = 10.0, opset_version: int = 17) -> Path:
+    """
+    Exports the inference graph to ONNX with dynamic batch and sample axes.
+    """
+    graph = build_graph(model)
+    path = Path(path)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        torch.onnx.export(
+            graph,
+            (_example_input(model, example_seconds),),
+            str(path),
+            input_names=["audio"],
+            output_names=["probs"],
+            dynamic_axes={"audio": {0: "batch", 1: "samples"}, "probs": {0: "batch"}},
+            opset_version=opset_version,
+        )
+    return path
+
+
+class OnnxKeyModel:
+    """
+    Runs an exported ONNX graph with ONNX Runtime on CPU.
+
+    Args:
+        path (str): Path to the .onnx file from `export_onnx`.
+        sr (int): Sampling rate the graph was exported for. Defaults to 22050 (default checkpoint).
+        num_threads (int, optional): Intra-op threads; ONNX Runtime default if None.
+    """
+
+    def __init__(self, path: str | Path, sr: int = 22050, num_threads: int | None = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.sr = sr
+
+    def predict(self, waveforms: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Returns key probabilities of shape (len(waveforms), 24) for zero-padded mono clips.
+        """
+        flat = [np.asarray(w, dtype=np.float32).reshape(-1) for w in waveforms]
+        batch = np.zeros((len(flat), max(w.shape[0] for w in flat)), dtype=np.float32)
+        for i, w in enumerate(flat):
+            batch[i, : w.shape[0]] = w
+        return self.session.run(None, {"audio": batch})[0]
+
+    def detect_keys(self, waveforms: Sequence[np.ndarray]) -> List[str]:
+        return [KEY_MAP[int(i)] for i in self.predict(waveforms).argmax(axis=1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the key detection graph")
+    parser.add_argument("--checkpoint", default=None, help="Path to a full training checkpoint (.pt). Loads default if not provided.")
+    parser.add_argument("--weights", default=None, help="Write a weights-only checkpoint to this path")
+    parser.add_argument("--torchscript", default=None, help="Write a traced TorchScript graph to this path")
+    parser.add_argument("--onnx", default=None, help="Write an ONNX graph to this path")
+    args = parser.parse_args()
+
+    if args.weights:
+        logging.info(f"Weights-only checkpoint written to {export_weights(args.weights, args.checkpoint)}")
+    if args.torchscript or args.onnx:
+        # Without --checkpoint the graph is built from the shipped weights-only copy
+        model = load_key_model(args.checkpoint, "cpu", weights_only=args.checkpoint is None)
+        if args.torchscript:
+            logging.info(f"TorchScript graph written to {export_torchscript(model, args.torchscript)}")
+        if args.onnx:
+            logging.info(f"ONNX graph written to {export_onnx(model, args.onnx)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import math
 
 import nnAudio.features.vqt
 import torch
-import torchaudio
+import torchaudio.functional as F
 
 
 # relies on nnAudio v0.3.2
@@ -31,18 +31,27 @@ class VQT(nnAudio.features.vqt.VQT):
         fmin = fmin * (2**low_octave_shift)
         n_bins = n_bins + max([0] + self.bin_shifts) - min([0] + self.bin_shifts)
         super().__init__(fmin=fmin, n_bins=n_bins, bins_per_octave=bins_per_octave, **kwargs)
+        # Harmonic slices are fixed by the config: with one harmonic the slice is a view of the VQT,
+        # otherwise a single index_select. Not persistent, so the checkpoint format does not change.
+        self.bin_starts = [shift - min([0] + self.bin_shifts) for shift in self.bin_shifts]
+        harmonic_index = torch.cat([torch.arange(start, start + self.n_bins_per_slice) for start in self.bin_starts])
+        self.register_buffer("harmonic_index", harmonic_index, persistent=False)
 
     def forward(self, x, output_format="Magnitude", normalization_type="librosa"):
-        vqt = super().forward(x, output_format, normalization_type)
-        hvqt = []
-        for shift in self.bin_shifts:
-            bin_start = shift - min([0] + self.bin_shifts)
-            bin_stop = bin_start + self.n_bins_per_slice
-            vqt_slice = vqt[:, bin_start:bin_stop, ...]
-            hvqt.append(vqt_slice)
-        hvqt = torch.stack(hvqt, dim=1)
-        log_hcqt = ((1.0 / 80.0) * torchaudio.transforms.AmplitudeToDB(top_db=80)(hvqt)) + 1.0
-        return log_hcqt
+        return self.stack_harmonics(super().forward(x, output_format, normalization_type))
+
+    def stack_harmonics(self, vqt: torch.Tensor) -> torch.Tensor:
+        """
+        (batch, bins, frames) VQT magnitude -> (batch, harmonics, n_bins, frames) scaled log-magnitude.
+        """
+        if len(self.bin_starts) == 1:
+            hvqt = vqt.narrow(1, self.bin_starts[0], self.n_bins_per_slice).unsqueeze(1)
+        else:
+            hvqt = vqt.index_select(1, self.harmonic_index).unflatten(1, (len(self.bin_starts), self.n_bins_per_slice))
+        # Same as torchaudio.transforms.AmplitudeToDB(stype="power", top_db=80); the result is a new tensor,
+        # so the scaling can be done in place
+        log_hcqt = F.amplitude_to_DB(hvqt, multiplier=10.0, amin=1e-10, db_multiplier=0.0, top_db=80.0)
+        return log_hcqt.mul_(1.0 / 80.0).add_(1.0)
 
 
 class CropCQT(torch.nn.Module):
@@ -69,6 +78,9 @@ class CropCQT(torch.nn.Module):
         self.height = height
 
     def forward(self, spectrograms: torch.Tensor, transpose: torch.Tensor) -> torch.Tensor:
-        return torch.stack(
-            [s[:, int(start_idx) : int(start_idx) + self.height, :] for s, start_idx in zip(spectrograms, transpose)]
-        )
+        # One host transfer for all offsets instead of int() per row
+        starts = transpose.tolist()
+        if len(set(starts)) == 1:
+            # Same offset for the whole batch (inference): a view, no copy
+            return spectrograms.narrow(2, int(starts[0]), self.height)
+        return torch.stack([s.narrow(1, int(start), self.height) for s, start in zip(spectrograms, starts)])
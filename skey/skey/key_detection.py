@@ -2,8 +2,9 @@ import glob
 import logging
 import os
 import csv
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
 
 import numpy as np
 import torch
@@ -16,6 +17,8 @@ from .hcqt import VQT, CropCQT
 logging.basicConfig(level=logging.INFO)
 
 DEFAULT_CHECKPOINT_PATH = Path(__file__).parent / "models/skey.pt"
+# Weights-only copy of the default checkpoint (skey.export.export_weights), loaded in production
+DEFAULT_WEIGHTS_PATH = Path(__file__).parent / "models/skey.weights.pt"
 
 KEY_MAP = {
         0: "A Major",
@@ -44,6 +47,41 @@ KEY_MAP = {
         23: "Bb minor",
     }
 
+def key_pitch_class(key_index: int) -> Tuple[int, bool]:
+    """
+    Returns the tonic as semitones above A and whether the key is minor
+    (KEY_MAP lists majors from A and minors from B).
+    """
+    if key_index < 12:
+        return key_index, False
+    return (key_index - 12 + 2) % 12, True
+
+
+def transpose_key(key_index: int, semitones: int) -> int:
+    """
+    KEY_MAP index of the key shifted by the given number of semitones (mode is kept).
+    """
+    pitch_class, minor = key_pitch_class(key_index)
+    shifted = (pitch_class + semitones) % 12
+    return 12 + (shifted - 2) % 12 if minor else shifted
+
+
+def circle_of_fifths_distance(a: int, b: int) -> int:
+    """
+    Steps between two keys on the circle of fifths (0-6). Minor keys are placed at their
+    relative major, so relative keys are at distance 0.
+    """
+
+    def position(key_index: int) -> int:
+        pitch_class, minor = key_pitch_class(key_index)
+        if minor:
+            pitch_class = (pitch_class + 3) % 12
+        return pitch_class * 7 % 12
+
+    steps = abs(position(a) - position(b))
+    return min(steps, 12 - steps)
+
+
 def yield_audio_paths(paths: List[str]) -> Iterator[Dict[str, Any]]:
     """
     Yields audio file paths in a randomized order.
@@ -118,8 +156,16 @@ class AudioDataset(torch.utils.data.IterableDataset):
         self.device = device
 
     def __iter__(self) -> Iterator[Tuple[torch.Tensor, str]]:
-        for data in yield_audio_paths(self.paths):
-            audio = load_audio(data["song_path"], self.sr).to(self.device)
+        paths = self.paths
+        # Each DataLoader worker decodes its own shard of the paths
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is not None:
+            paths = paths[worker_info.id :: worker_info.num_workers]
+        for data in yield_audio_paths(paths):
+            try:
+                audio = load_audio(data["song_path"], self.sr).to(self.device)
+            except ValueError:
+                continue
             if torch.max(torch.abs(audio)) > 0:
                 yield audio, data["song_path"]
 
@@ -190,12 +236,14 @@ def infer_key(
         return "error"
 
 
-def load_checkpoint(checkpoint_path: str | Path | None = DEFAULT_CHECKPOINT_PATH) -> Dict[str, Any]:
+def load_checkpoint(checkpoint_path: str | Path | None = DEFAULT_CHECKPOINT_PATH, weights_only: bool = False) -> Dict[str, Any]:
     """
     Loads a checkpoint file from the specified checkpoint_path.
 
     Args:
         checkpoint_path (str): Path to the checkpoint file.
+        weights_only (bool, optional): Load with the restricted unpickler; requires a weights-only
+            checkpoint written by `skey.export.export_weights`. Defaults to False.
 
     Returns:
         Dict[str, Any]: Loaded checkpoint dictionary.
@@ -207,37 +255,133 @@ def load_checkpoint(checkpoint_path: str | Path | None = DEFAULT_CHECKPOINT_PATH
     logging.info(f"Loading checkpoint from {checkpoint_path}")
     if not os.path.exists(str(checkpoint_path)):
         raise FileNotFoundError(f"Checkpoint file {checkpoint_path} does not exist.")
-    return torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+    return torch.load(checkpoint_path, map_location="cpu", weights_only=weights_only)
+
+
+@dataclass
+class KeyModel:
+    """
+    Loaded key detection model: front-end, classifier and the sampling rate it expects.
+    """
+
+    hcqt: VQT
+    chromanet: ChromaNet
+    crop_fn: CropCQT
+    sr: int
+    device: torch.device
+
+
+@dataclass
+class KeyEstimate:
+    """
+    Result of excerpt key detection.
+
+    Attributes:
+        key (str): Predicted key from KEY_MAP.
+        confidence (float): Averaged probability of the predicted key.
+        margin (float): Gap between the two most probable keys in the averaged probabilities.
+        analysed_seconds (float): Amount of audio that went through the model.
+        full_track (bool): Whether the estimate fell back to the whole track.
+    """
+
+    key: str
+    confidence: float
+    margin: float
+    analysed_seconds: float
+    full_track: bool = False
+
+
+def _estimate(probs: torch.Tensor, analysed_seconds: float, full_track: bool = False) -> KeyEstimate:
+    top = torch.topk(probs, 2)
+    return KeyEstimate(
+        key=KEY_MAP[int(top.indices[0])],
+        confidence=float(top.values[0]),
+        margin=float(top.values[0] - top.values[1]),
+        analysed_seconds=analysed_seconds,
+        full_track=full_track,
+    )
+
+
+def resolve_device(device: str) -> torch.device:
+    if device != "cpu" and not torch.cuda.is_available() and not torch.backends.mps.is_available():
+        device = "cpu"
+    return torch.device(device)
+
+
+def load_key_model(
+    ckpt_path: str | Path | None = DEFAULT_WEIGHTS_PATH, device: str = "cpu", weights_only: bool = True
+) -> KeyModel:
+    """
+    Loads the checkpoint and model components once, so they can be reused across calls.
+
+    Args:
+        ckpt_path (str): Path to the model checkpoint file. Defaults to the weights-only default checkpoint.
+        device (str, optional): Device to load the model onto. Defaults to "cpu".
+        weights_only (bool, optional): Load with the restricted unpickler. Pass False only for a trusted
+            full training checkpoint. Defaults to True.
+
+    Returns:
+        KeyModel: Loaded model components together with the checkpoint sampling rate.
+    """
+    if ckpt_path is None or (weights_only and Path(ckpt_path) == DEFAULT_CHECKPOINT_PATH):
+        # The shipped training checkpoint is read through its weights-only copy
+        ckpt_path = DEFAULT_WEIGHTS_PATH
+    d = resolve_device(device)
+    ckpt = load_checkpoint(ckpt_path, weights_only)
+    hcqt, chromanet, crop_fn = load_model_components(ckpt, d)
+    return KeyModel(hcqt, chromanet, crop_fn, ckpt["audio"]["sr"], d)
 
 
 def detect_key(
-    audio: np.ndarray,
+    audio: np.ndarray | None = None,
     extension: str = "mp3",
     device: str = "cpu",
-    ckpt_path: str | Path = DEFAULT_CHECKPOINT_PATH,
+    ckpt_path: str | Path = DEFAULT_WEIGHTS_PATH,
     cli: bool = False,
-) -> list[str] | None:
+    model: KeyModel | None = None,
+    audio_path: str | Path | None = None,
+    excerpt: bool = False,
+) -> list[str] | str | KeyEstimate | None:
     """
     Detects the musical key of audio files using a pre-trained model.
 
     Args:
-        ckpt_path (str): Path to the model checkpoint file.
-        audio_path (str): Path to the audio file or directory containing audio files.
+        ckpt_path (str): Path to a weights-only model checkpoint.
+        audio (np.ndarray): Audio waveform sampled at the checkpoint sampling rate.
+        audio_path (str, optional): Path to the audio file or directory containing audio files, used instead of `audio`.
         extension (str, optional): File extension of audio files to process. No need to pass this argument when audio_path is a single audio file. Defaults to "wav".
         device (str, optional): Device to perform inference on ("cpu", "cuda", or "mps"). Defaults to "cpu".
         cli (bool, optional): If True, prints results to console. If False, returns results. Defaults to False.
+        model (KeyModel, optional): Preloaded model from `load_key_model`. If None, the checkpoint is loaded.
+        excerpt (bool, optional): Analyse evenly spaced excerpts of `audio` (see `detect_key_excerpt`)
+            and return a KeyEstimate instead of the key string. Defaults to False.
 
     Returns:
-        list[str] | None: List of predicted keys for the audio files. Returns None if no audio files are found.
+        list[str] | str | KeyEstimate | None: List of predicted keys for the audio files, the key of `audio`
+        (KeyEstimate in excerpt mode). Returns None if no audio files are found or cli is True.
     """
-    if device != "cpu" and not torch.cuda.is_available() and not torch.backends.mps.is_available():
-        device = "cpu"
-    d = torch.device(device)
-
-    ckpt = load_checkpoint(ckpt_path)
-    sr = ckpt["audio"]["sr"]
-
-    hcqt, chromanet, crop_fn = load_model_components(ckpt, d)
+    if model is None:
+        model = load_key_model(ckpt_path, device)
+
+    if audio_path is not None:
+        paths = find_audio_files(audio_path, extension)
+        if not paths:
+            logging.warning(f"No .{extension} files found in {audio_path}")
+            return None
+        keys = detect_keys_batch(paths, model=model)
+        if cli:
+            for path, key in zip(paths, keys):
+                print(f"Predicted key for {path}: {key if key is not None else 'error'}")
+            return None
+        return keys
+    if excerpt:
+        estimate = detect_key_excerpt(audio, model)
+        logging.info(
+            f"Key {estimate.key} (confidence {estimate.confidence:.2f}, {estimate.analysed_seconds:.0f} s analysed)"
+        )
+        return None if cli else estimate
+
+    hcqt, chromanet, crop_fn, d = model.hcqt, model.chromanet, model.crop_fn, model.device
 
     audio_tensor = torch.from_numpy(audio)
     if len(audio_tensor.shape) == 1:
@@ -245,7 +389,199 @@ def detect_key(
 
     results = infer_key(hcqt, chromanet, crop_fn, audio_tensor.to(d), d)
 
-    print(f"\nТональность определена\n")
+    logging.info(f"Key detected: {KEY_MAP.get(results, results)}")
 
     if not cli:
         return KEY_MAP[results]
+
+
+def find_audio_files(audio_path: str | Path, extension: str = "wav") -> List[str]:
+    """
+    Returns the audio file itself, or all files with the given extension under a directory (recursively).
+    """
+    audio_path = Path(audio_path)
+    if audio_path.is_file():
+        return [str(audio_path)]
+    return sorted(glob.glob(os.path.join(str(audio_path), "**", f"*.{extension.lstrip('.')}"), recursive=True))
+
+
+def _length_buckets(
+    clips: List[Tuple[int, torch.Tensor]], batch_size: int, max_pad_ratio: float
+) -> Iterator[List[Tuple[int, torch.Tensor]]]:
+    """
+    Groups clips of similar length so that padding stays within max_pad_ratio of the longest clip.
+    """
+    clips = sorted(clips, key=lambda item: item[1].shape[-1])
+    bucket: List[Tuple[int, torch.Tensor]] = []
+    for item in clips:
+        if bucket and (
+            len(bucket) == batch_size or item[1].shape[-1] > bucket[0][1].shape[-1] * (1 + max_pad_ratio)
+        ):
+            yield bucket
+            bucket = []
+        bucket.append(item)
+    if bucket:
+        yield bucket
+
+
+def infer_probs_batch(model: KeyModel, waveforms: Sequence[torch.Tensor]) -> torch.Tensor:
+    """
+    Runs VQT + ChromaNet on a zero-padded batch of mono waveforms.
+
+    Args:
+        model (KeyModel): Loaded model.
+        waveforms (Sequence[torch.Tensor]): Waveforms of shape (samples,) or (1, samples).
+
+    Returns:
+        torch.Tensor: Key probabilities of shape (len(waveforms), 24) on the CPU, indexed like KEY_MAP.
+    """
+    flat = [torch.as_tensor(w, dtype=torch.float32).reshape(-1) for w in waveforms]
+    length = max(w.shape[-1] for w in flat)
+    batch = torch.zeros(len(flat), length, dtype=torch.float32)
+    for i, w in enumerate(flat):
+        batch[i, : w.shape[-1]] = w
+    batch = batch.to(model.device)
+    with torch.no_grad():
+        cropped = model.crop_fn(model.hcqt(batch), torch.zeros(len(flat), device=model.device))
+        probs = model.chromanet(cropped)
+    return probs.cpu()
+
+
+def infer_keys_batch(model: KeyModel, waveforms: Sequence[torch.Tensor]) -> List[int]:
+    """
+    Runs VQT + ChromaNet on a zero-padded batch of mono waveforms.
+
+    Args:
+        model (KeyModel): Loaded model.
+        waveforms (Sequence[torch.Tensor]): Waveforms of shape (samples,) or (1, samples).
+
+    Returns:
+        List[int]: Predicted KEY_MAP index for each waveform.
+    """
+    return infer_probs_batch(model, waveforms).argmax(dim=1).tolist()
+
+
+def detect_key_excerpt(
+    audio: np.ndarray | torch.Tensor,
+    model: KeyModel,
+    window_seconds: float = 15.0,
+    n_windows: int = 4,
+    max_windows: int = 16,
+    margin_threshold: float = 0.1,
+) -> KeyEstimate:
+    """
+    Estimates the key from a few evenly spaced excerpts instead of the whole track.
+
+    The first `n_windows` windows go through the model in one batch. If the margin between the two
+    most probable keys of the averaged probabilities reaches `margin_threshold`, that estimate is
+    returned. Otherwise the number of windows is doubled (already analysed windows are reused) up to
+    `max_windows`, and if the windows still disagree the whole track is analysed.
+
+    Args:
+        audio (np.ndarray | torch.Tensor): Mono waveform sampled at the checkpoint rate.
+        model (KeyModel): Loaded model.
+        window_seconds (float, optional): Length of one excerpt. Defaults to 15 (training clip length).
+        n_windows (int, optional): Windows in the first batch. Defaults to 4.
+        max_windows (int, optional): Upper bound on windows before falling back to the whole track. Defaults to 16.
+        margin_threshold (float, optional): Required gap between the top two averaged probabilities. Defaults to 0.1.
+
+    Returns:
+        KeyEstimate: Predicted key, its confidence and how much audio was analysed.
+    """
+    audio = torch.as_tensor(audio, dtype=torch.float32).reshape(-1)
+    total = audio.shape[-1]
+    window = int(window_seconds * model.sr)
+    if total <= window * n_windows:
+        # Short tracks are cheaper to analyse in a single pass
+        return _estimate(infer_probs_batch(model, [audio])[0], total / model.sr, full_track=True)
+
+    probs: Dict[int, torch.Tensor] = {}
+    count = n_windows
+    while True:
+        starts = [int(s) for s in np.linspace(0, total - window, count)]
+        new = [s for s in dict.fromkeys(starts) if s not in probs]
+        if new:
+            for start, p in zip(new, infer_probs_batch(model, [audio[s : s + window] for s in new])):
+                probs[start] = p
+        estimate = _estimate(torch.stack(list(probs.values())).mean(dim=0), len(probs) * window / model.sr)
+        if estimate.margin >= margin_threshold:
+            return estimate
+        if count >= max_windows:
+            break
+        count = min(count * 2, max_windows)
+
+    logging.info(f"Excerpts disagree (margin {estimate.margin:.3f}), analysing the whole track")
+    full = _estimate(infer_probs_batch(model, [audio])[0], total / model.sr, full_track=True)
+    full.analysed_seconds += estimate.analysed_seconds
+    return full
+
+
+def detect_keys_batch(
+    inputs: Sequence[np.ndarray | torch.Tensor | str | Path],
+    device: str = "cpu",
+    ckpt_path: str | Path = DEFAULT_WEIGHTS_PATH,
+    model: KeyModel | None = None,
+    batch_size: int = 16,
+    num_workers: int = 0,
+    max_pad_ratio: float = 0.1,
+    pool_size: int = 64,
+) -> List[str | None]:
+    """
+    Detects keys for many clips with a single model load and batched forward passes.
+
+    Args:
+        inputs (Sequence): Waveforms sampled at the checkpoint rate, or paths to audio files.
+        device (str, optional): Device to perform inference on. Defaults to "cpu".
+        ckpt_path (str): Path to a weights-only model checkpoint.
+        model (KeyModel, optional): Preloaded model from `load_key_model`.
+        batch_size (int, optional): Maximum number of clips per forward pass. Defaults to 16.
+        num_workers (int, optional): DataLoader workers decoding audio files in parallel. Defaults to 0.
+        max_pad_ratio (float, optional): Maximum zero padding relative to the longest clip in a batch. Defaults to 0.1.
+        pool_size (int, optional): Number of decoded clips held in memory for length bucketing. Defaults to 64.
+
+    Returns:
+        List[str | None]: Predicted key for each input in input order, None if a clip could not be processed.
+    """
+    if model is None:
+        model = load_key_model(ckpt_path, device)
+
+    results: List[str | None] = [None] * len(inputs)
+    path_indices: Dict[str, List[int]] = {}
+    arrays: List[Tuple[int, torch.Tensor]] = []
+    for i, item in enumerate(inputs):
+        if isinstance(item, (str, Path)):
+            path_indices.setdefault(str(item), []).append(i)
+        else:
+            tensor = torch.as_tensor(item, dtype=torch.float32)
+            if tensor.numel() > 0 and torch.max(torch.abs(tensor)) > 0:
+                arrays.append((i, tensor))
+
+    def run(pool: List[Tuple[int, torch.Tensor]]) -> None:
+        for bucket in _length_buckets(pool, batch_size, max_pad_ratio):
+            indices = [i for i, _ in bucket]
+            try:
+                predictions = infer_keys_batch(model, [w for _, w in bucket])
+            except Exception as e:
+                logging.warning(f"Batch inference failed ({e}), retrying clips one by one")
+                predictions = [infer_key(model.hcqt, model.chromanet, model.crop_fn, w.reshape(1, -1), model.device) for _, w in bucket]
+            for i, prediction in zip(indices, predictions):
+                results[i] = KEY_MAP[prediction] if prediction != "error" else None
+
+    def decoded_paths() -> Iterable[Tuple[int, torch.Tensor]]:
+        if not path_indices:
+            return
+        dataset = AudioDataset(list(path_indices), model.sr, torch.device("cpu"))
+        loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=num_workers)
+        for audio, path in tqdm(loader, total=len(path_indices), disable=len(path_indices) < 2):
+            for i in path_indices[path]:
+                yield i, audio
+
+    pool = list(arrays)
+    for item in decoded_paths():
+        pool.append(item)
+        if len(pool) >= pool_size:
+            run(pool)
+            pool = []
+    if pool:
+        run(pool)
+    return results
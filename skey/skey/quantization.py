@@ -0,0 +1,177 @@
+import copy
+import dataclasses
+import hashlib
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import torch
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from .chromanet import ChromaNet
+from .key_detection import KeyModel, find_audio_files, load_audio
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+
+def _blocks(chromanet: ChromaNet) -> Iterator[nn.ModuleList]:
+    yield chromanet.time_downsampling_blocks
+    yield chromanet.convnext_blocks
+
+
+def quantize_dynamic_chromanet(chromanet: ChromaNet) -> ChromaNet:
+    """
+    Int8 weights for the pointwise Linear layers, activations are quantized on the fly.
+    No calibration needed.
+    """
+    return quantize_dynamic(copy.deepcopy(chromanet).eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_chromanet(chromanet: ChromaNet, calibration: Iterable[torch.Tensor], backend: str = "x86") -> ChromaNet:
+    """
+    Static int8 quantization of the ConvNeXt and time downsampling blocks with FX graph mode.
+
+    Each block is traced and quantized on its own, so `ChromaNet.forward` and the fp32 head
+    (octave pooling, classifier, batch norm, softmax) stay unchanged. Depthwise convolutions use
+    replicate padding, which quantized kernels do not support; they stay in fp32.
+
+    Args:
+        chromanet (ChromaNet): fp32 model, not modified.
+        calibration (Iterable[torch.Tensor]): Cropped HCQT batches (batch, 1, 84, frames) used to observe activation ranges.
+        backend (str, optional): Quantized engine ("x86", "fbgemm", "qnnpack"). Defaults to "x86".
+
+    Returns:
+        ChromaNet: Quantized copy for CPU inference.
+    """
+    calibration = list(calibration)
+    if not calibration:
+        raise ValueError("Static quantization needs at least one calibration batch")
+
+    net = copy.deepcopy(chromanet).eval()
+    # Names are relative to the block being prepared: ConvNeXtBlock.dwconv uses replicate padding
+    qconfig_mapping = get_default_qconfig_mapping(backend).set_module_name("dwconv", None)
+
+    # prepare_fx needs an example input of every block
+    example_inputs = {}
+    hooks = [
+        block.register_forward_pre_hook(lambda module, args: example_inputs.setdefault(module, args))
+        for blocks in _blocks(net)
+        for block in blocks
+    ]
+    with torch.no_grad():
+        net(calibration[0])
+    for hook in hooks:
+        hook.remove()
+
+    for blocks in _blocks(net):
+        for i, block in enumerate(blocks):
+            blocks[i] = prepare_fx(block, qconfig_mapping, example_inputs[block])
+    with torch.no_grad():
+        for batch in calibration:
+            net(batch)
+    for blocks in _blocks(net):
+        for i, block in enumerate(blocks):
+            blocks[i] = convert_fx(block)
+    return net
+
+
+def split_calibration_set(paths: Sequence[str], fraction: float = 0.25) -> Tuple[List[str], List[str]]:
+    """
+    Deterministic split of tracks into (calibration, evaluation) sets by a hash of the file name,
+    so the same track always lands on the same side and accuracy is never measured on calibration data.
+    """
+    if len(paths) < 2:
+        raise ValueError("Need at least two tracks to split into calibration and evaluation sets")
+    ranked = sorted(paths, key=lambda p: hashlib.sha1(Path(p).name.encode("utf-8")).hexdigest())
+    n_calibration = min(len(ranked) - 1, max(1, round(len(ranked) * fraction)))
+    calibration = set(ranked[:n_calibration])
+    return [p for p in paths if p in calibration], [p for p in paths if p not in calibration]
+
+
+def clip_batches(
+    model: KeyModel,
+    paths: Sequence[str],
+    clip_seconds: float = 15.0,
+    batch_size: int = 8,
+) -> List[torch.Tensor]:
+    """
+    Cropped HCQT batches from the middle `clip_seconds` of each track. Shorter or unreadable tracks are skipped.
+    """
+    clip_len = int(clip_seconds * model.sr)
+    clips = []
+    for path in paths:
+        try:
+            audio = load_audio(path, model.sr).reshape(-1)
+        except ValueError:
+            continue
+        start = max(0, (audio.shape[-1] - clip_len) // 2)
+        clip = audio[start : start + clip_len]
+        if clip.shape[-1] == clip_len:
+            clips.append(clip)
+    if not clips:
+        raise ValueError(f"No tracks of at least {clip_seconds} s among {len(paths)} files")
+
+    batches = []
+    with torch.no_grad():
+        for i in range(0, len(clips), batch_size):
+            batch = torch.stack(clips[i : i + batch_size]).to(model.device)
+            batches.append(model.crop_fn(model.hcqt(batch), torch.zeros(len(batch))).cpu())
+    return batches
+
+
+def calibration_batches(
+    model: KeyModel,
+    audio_dir: str | Path,
+    extension: str = "wav",
+    max_files: int = 32,
+    clip_seconds: float = 15.0,
+    batch_size: int = 8,
+) -> List[torch.Tensor]:
+    """
+    Cropped HCQT batches from the middle `clip_seconds` of up to `max_files` tracks in a directory.
+    """
+    batches = clip_batches(model, find_audio_files(audio_dir, extension)[:max_files], clip_seconds, batch_size)
+    logging.info(f"Calibrating on {sum(len(b) for b in batches)} clips from {audio_dir}")
+    return batches
+
+
+def quantize_key_model(
+    model: KeyModel,
+    mode: str = "dynamic",
+    calibration_dir: str | Path | Sequence[str] | None = None,
+    extension: str = "wav",
+) -> KeyModel:
+    """
+    Returns a copy of the model with an int8 ChromaNet for CPU inference. The VQT front-end stays in fp32.
+
+    Args:
+        model (KeyModel): Loaded fp32 model.
+        mode (str, optional): "dynamic" (no calibration) or "static" (needs calibration_dir). Defaults to "dynamic".
+        calibration_dir (str, optional): Directory of representative tracks for static calibration,
+            or a list of track paths (e.g. the calibration side of `split_calibration_set`).
+        extension (str, optional): Audio file extension in calibration_dir. Defaults to "wav".
+
+    Returns:
+        KeyModel: Model whose chromanet is quantized and which runs on the CPU.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {QUANTIZATION_MODES}")
+    if model.device.type != "cpu":
+        model = dataclasses.replace(
+            model, hcqt=copy.deepcopy(model.hcqt).cpu(), chromanet=copy.deepcopy(model.chromanet).cpu(), device=torch.device("cpu")
+        )
+
+    if mode == "dynamic":
+        chromanet = quantize_dynamic_chromanet(model.chromanet)
+    else:
+        if calibration_dir is None:
+            raise ValueError("Static quantization needs calibration_dir")
+        if isinstance(calibration_dir, (str, Path)):
+            batches = calibration_batches(model, calibration_dir, extension)
+        else:
+            batches = clip_batches(model, calibration_dir)
+        chromanet = quantize_static_chromanet(model.chromanet, batches)
+    return dataclasses.replace(model, chromanet=chromanet)
+
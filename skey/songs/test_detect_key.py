@@ -3,11 +3,17 @@ from pathlib import Path
 import pytest
 import torch
 
+import numpy as np
+import soundfile as sf
+
 from skey.key_detection import (
     DEFAULT_CHECKPOINT_PATH,
+    KEY_MAP,
+    KeyModel,
     detect_key,
+    detect_keys_batch,
+    find_audio_files,
     infer_key,
-    key_map,
     load_audio,
     load_checkpoint,
     load_model_components,
@@ -15,7 +21,7 @@ from skey.key_detection import (
 
 # Ensure the test audio file is in the tests/ directory
 TEST_AUDIO_FILENAME = "nocturne_n02_in_e-flat_major.mp3"
-EXPECTED_KEY_FOR_TEST_AUDIO = "D# Major"  # E-flat Major is D# Major in key_map
+EXPECTED_KEY_FOR_TEST_AUDIO = "D# Major"  # E-flat Major is D# Major in KEY_MAP
 
 
 @pytest.fixture(scope="module")
@@ -66,10 +72,10 @@ def test_infer_key_specific_song(audio_path: str, model_components):
     if waveform.nelement() > 0:  # Proceed only if waveform is not empty
         assert torch.max(torch.abs(waveform)) > 1e-9, "Loaded waveform is silent."
 
-    predicted_key = infer_key(hcqt, chromanet, crop_fn, waveform, device)
+    predicted_key = KEY_MAP[infer_key(hcqt, chromanet, crop_fn, waveform, device)]
 
     assert isinstance(predicted_key, str), "Predicted key should be a string."
-    assert predicted_key in key_map.values(), f"Predicted key '{predicted_key}' not in known key_map."
+    assert predicted_key in KEY_MAP.values(), f"Predicted key '{predicted_key}' not in known KEY_MAP."
     assert predicted_key == EXPECTED_KEY_FOR_TEST_AUDIO, (
         f"Expected key '{EXPECTED_KEY_FOR_TEST_AUDIO}' but got '{predicted_key}' for {TEST_AUDIO_FILENAME}."
     )
@@ -120,3 +126,177 @@ def test_infer_key_short_audio(model_components):
 
     predicted_key = infer_key(hcqt, chromanet, crop_fn, short_waveform, device)
     assert predicted_key == "error"  # "Expected 'error' for very short audio due to processing
+
+
+def _chord(freqs, seconds: float, sr: int) -> np.ndarray:
+    t = np.arange(int(sr * seconds)) / sr
+    return (0.5 * sum(np.sin(2 * np.pi * f * t) for f in freqs) / len(freqs)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def key_model(model_components) -> KeyModel:
+    hcqt, chromanet, crop_fn, device, sr = model_components
+    return KeyModel(hcqt, chromanet, crop_fn, sr, device)
+
+
+@pytest.fixture(scope="module")
+def synthetic_clips(key_model):
+    sr = key_model.sr
+    return [
+        _chord([261.6, 329.6, 392.0], 10, sr),
+        _chord([220.0, 261.6, 329.6], 10.5, sr),
+        _chord([293.7, 370.0, 440.0], 30, sr),
+    ]
+
+
+def test_detect_keys_batch_matches_single(key_model, synthetic_clips):
+    """Batched inference returns the same keys as one-by-one detect_key, in input order."""
+    single = [detect_key(audio=clip, model=key_model) for clip in synthetic_clips]
+    batched = detect_keys_batch(synthetic_clips, model=key_model, batch_size=2)
+    assert batched == single
+
+
+def test_detect_keys_batch_paths(tmp_path, key_model, synthetic_clips):
+    """Directory mode decodes files through the DataLoader and keeps results aligned with paths."""
+    for i, clip in enumerate(synthetic_clips):
+        sf.write(tmp_path / f"{i}.wav", clip, key_model.sr)
+    (tmp_path / "broken.wav").write_text("not audio")
+
+    paths = find_audio_files(tmp_path, "wav")
+    assert len(paths) == 4
+
+    keys = detect_keys_batch(paths, model=key_model, num_workers=2)
+    expected = [detect_key(audio=load_audio(p, key_model.sr).numpy(), model=key_model) for p in paths[:3]]
+    assert keys[:3] == expected
+    assert keys[3] is None  # broken.wav sorts last and cannot be decoded
+
+
+@pytest.fixture(scope="module")
+def export_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("export")
+
+
+@pytest.fixture(scope="module")
+def noisy_clips(synthetic_clips):
+    # Pure sines leave the lowest VQT bins at float rounding noise, which differs between
+    # backends (and between batch sizes in eager mode); real recordings always have a noise floor
+    rng = np.random.default_rng(0)
+    return [(c + 1e-3 * rng.standard_normal(c.shape)).astype(np.float32) for c in synthetic_clips]
+
+
+def _eager_probs(key_model, clips) -> np.ndarray:
+    with torch.no_grad():
+        batch = torch.from_numpy(np.stack(clips))
+        cropped = key_model.crop_fn(key_model.hcqt(batch), torch.zeros(len(clips)))
+        return key_model.chromanet(cropped).numpy()
+
+
+def test_weights_only_checkpoint(export_dir, key_model, synthetic_clips):
+    """The weights-only artifact loads with the restricted unpickler and predicts the same keys."""
+    from skey.export import export_weights
+    from skey.key_detection import load_key_model
+
+    path = export_weights(export_dir / "skey.weights.pt")
+    restored = load_key_model(path, "cpu", weights_only=True)
+    assert restored.sr == key_model.sr
+    assert detect_keys_batch(synthetic_clips, model=restored) == detect_keys_batch(synthetic_clips, model=key_model)
+
+
+def test_torchscript_parity(export_dir, key_model, noisy_clips):
+    """The traced graph matches the eager model for lengths other than the one it was traced with."""
+    from skey.export import export_torchscript
+
+    traced = torch.jit.load(str(export_torchscript(key_model, export_dir / "skey.ts", example_seconds=5)))
+    for clips in ([c[: key_model.sr * 10] for c in noisy_clips], [noisy_clips[2]]):
+        with torch.no_grad():
+            probs = traced(torch.from_numpy(np.stack(clips))).numpy()
+        np.testing.assert_allclose(probs, _eager_probs(key_model, clips), atol=1e-4)
+
+
+@pytest.fixture(scope="module")
+def onnx_model(export_dir, key_model):
+    pytest.importorskip("onnxruntime")
+    from skey.export import OnnxKeyModel, export_onnx
+
+    return OnnxKeyModel(export_onnx(key_model, export_dir / "skey.onnx", example_seconds=5), sr=key_model.sr)
+
+
+def test_onnx_parity(onnx_model, key_model, noisy_clips):
+    """ONNX Runtime on CPU reproduces the eager probabilities for any batch size and clip length."""
+    clips = [c[: key_model.sr * 10] for c in noisy_clips]
+    np.testing.assert_allclose(onnx_model.predict(clips), _eager_probs(key_model, clips), atol=1e-4)
+    expected = [detect_key(audio=clip, model=key_model) for clip in noisy_clips]
+    assert [onnx_model.detect_keys([clip])[0] for clip in noisy_clips] == expected
+
+
+def test_onnx_specific_song(onnx_model, audio_path):
+    waveform = load_audio(audio_path, sr=onnx_model.sr).numpy()
+    assert onnx_model.detect_keys([waveform]) == [EXPECTED_KEY_FOR_TEST_AUDIO]
+
+
+def test_detect_key_excerpt_consistent_track(key_model):
+    """A track in one key stops after the first batch of windows."""
+    from skey.key_detection import detect_key_excerpt
+
+    clip = _chord([261.6, 329.6, 392.0], 120, key_model.sr)
+    estimate = detect_key_excerpt(clip, key_model, window_seconds=10, n_windows=3, margin_threshold=0.0)
+    assert estimate.key == detect_key(audio=clip[: key_model.sr * 10], model=key_model)
+    assert estimate.analysed_seconds == pytest.approx(30)
+    assert not estimate.full_track
+    assert 0.0 < estimate.confidence <= 1.0
+
+
+def test_detect_key_excerpt_fallback(key_model):
+    """Unreachable margin: windows are refined up to max_windows, then the whole track decides."""
+    from skey.key_detection import detect_key_excerpt
+
+    sr = key_model.sr
+    clip = np.concatenate([_chord([261.6, 329.6, 392.0], 40, sr), _chord([293.7, 370.0, 440.0], 40, sr)])
+    estimate = detect_key_excerpt(clip, key_model, window_seconds=5, n_windows=2, max_windows=4, margin_threshold=1.0)
+    assert estimate.full_track
+    assert estimate.key == detect_key(audio=clip, model=key_model)
+    assert estimate.analysed_seconds == pytest.approx(4 * 5 + 80)
+
+    short = detect_key(audio=clip[: sr * 8], model=key_model, excerpt=True)
+    assert short.full_track and short.analysed_seconds == pytest.approx(8)
+
+
+def test_crop_cqt_offsets():
+    """Per-row offsets crop the same bins as slicing each spectrogram; equal offsets give a view."""
+    from skey.hcqt import CropCQT
+
+    spectrograms = torch.rand(5, 1, 99, 20)
+    offsets = torch.tensor([0, 3, 15, 7, 3])
+    cropped = CropCQT(84)(spectrograms, offsets)
+    for s, c, start in zip(spectrograms, cropped, offsets.tolist()):
+        assert torch.equal(c, s[:, start : start + 84])
+
+    view = CropCQT(84)(spectrograms, torch.full((5,), 2))
+    assert view.data_ptr() == spectrograms[:, :, 2:].data_ptr()
+
+
+def test_key_arithmetic():
+    from skey.key_detection import circle_of_fifths_distance, transpose_key
+
+    index = {key: i for i, key in KEY_MAP.items()}
+    assert KEY_MAP[transpose_key(index["C Major"], 2)] == "D Major"
+    assert KEY_MAP[transpose_key(index["A minor"], -1)] == "G# minor"
+    assert all(transpose_key(transpose_key(i, 5), -5) == i for i in KEY_MAP)
+    assert circle_of_fifths_distance(index["C Major"], index["G Major"]) == 1
+    assert circle_of_fifths_distance(index["C Major"], index["A minor"]) == 0
+    assert circle_of_fifths_distance(index["C Major"], index["F# Major"]) == 6
+
+
+def test_quantized_chromanet(key_model, noisy_clips):
+    """Int8 ChromaNet keeps the output contract and agrees with fp32 on clear chords."""
+    from skey.quantization import quantize_dynamic_chromanet, quantize_static_chromanet
+
+    clips = [c[: key_model.sr * 10] for c in noisy_clips]
+    with torch.no_grad():
+        cropped = key_model.crop_fn(key_model.hcqt(torch.from_numpy(np.stack(clips))), torch.zeros(len(clips)))
+        reference = key_model.chromanet(cropped)
+        for chromanet in (quantize_dynamic_chromanet(key_model.chromanet), quantize_static_chromanet(key_model.chromanet, [cropped])):
+            probs = chromanet(cropped)
+            assert probs.shape == reference.shape
+            assert torch.allclose(probs.sum(dim=1), torch.ones(len(clips)), atol=1e-4)
+        assert torch.equal(quantize_dynamic_chromanet(key_model.chromanet)(cropped).argmax(dim=1), reference.argmax(dim=1))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from classes import Song
+
+SR = 8000
+
+
+@pytest.fixture
+def c_major():
+    return Song("song", np.zeros(SR, dtype=np.float32), SR, num_key=3)
+
+
+@pytest.mark.parametrize("key_index, semitones", [(3, 0), (8, 5), (10, -5), (9, -6), (4, 1), (1, -2)])
+def test_semitones_to_same_mode(c_major, key_index, semitones):
+    """The shortest shift between tonics of the same mode, from -6 to +5 semitones."""
+    assert c_major.semitones_to(key_index) == semitones
+
+
+def test_semitones_to_rejects_mode_change(c_major):
+    """A pitch shift keeps the mode, so C Major cannot reach A minor (its relative key)."""
+    with pytest.raises(ValueError):
+        c_major.semitones_to(22)
+    with pytest.raises(ValueError):
+        c_major.pitch_shift(22)
+
+
+def test_semitones_to_minor():
+    song = Song("song", np.zeros(SR, dtype=np.float32), SR, num_key=22)  # A minor
+    assert song.semitones_to(15) == 5  # D minor
+    assert song.semitones_to(12) == 2  # B minor
+
+
+def test_get_key_loads_model_once(monkeypatch):
+    """Key detection reuses one loaded model instead of reading the checkpoint on every call."""
+    from classes import song as song_module
+
+    loads, used = [], []
+    monkeypatch.setattr(song_module, "get_registry", None)
+    monkeypatch.setattr(song_module, "load_key_model", lambda device: loads.append(device) or object())
+    monkeypatch.setattr(song_module, "detect_key", lambda audio, extension, device, model: used.append(model) or "D Major")
+    song_module._local_key_model.cache_clear()
+    try:
+        for _ in range(2):
+            song = Song("song", np.zeros(SR, dtype=np.float32), SR)
+            assert song.key == " D Major" and song.num_key == 5
+    finally:
+        song_module._local_key_model.cache_clear()
+    assert loads == ["cuda"]
+    assert used[0] is used[1]
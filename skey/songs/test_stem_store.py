@@ -0,0 +1,132 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from classes import Song, StemStore
+from classes import stem_store
+
+SR = 8000
+
+
+@pytest.fixture
+def stems():
+    rng = np.random.default_rng(0)
+    return {
+        "drums": (0.3 * rng.standard_normal(SR * 3)).clip(-1, 1).astype(np.float32),
+        "bass": (0.3 * rng.standard_normal(SR * 2)).clip(-1, 1).astype(np.float32),
+        "vocal": None,
+    }
+
+
+@pytest.mark.parametrize("dtype, atol", [("int16", 1 / 32767), ("float16", 1e-3)])
+def test_round_trip(tmp_path, stems, dtype, atol):
+    """Stems written through the store read back as float32 within the precision of the format."""
+    store = StemStore.from_arrays(tmp_path, stems, SR, dtype)
+    assert sorted(store) == ["bass", "drums"]  # None stems are not written
+    assert store["drums"].dtype == np.dtype(dtype)
+    restored = store.read("drums")
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, stems["drums"], atol=atol)
+
+
+def test_invalid_dtype(tmp_path):
+    """Only the compact formats are accepted."""
+    with pytest.raises(ValueError):
+        StemStore(tmp_path, SR, "float32")
+
+
+def test_missing_stem(tmp_path):
+    store = StemStore(tmp_path, SR)
+    assert "vocal" not in store
+    with pytest.raises(KeyError):
+        store["vocal"]
+    with pytest.raises(KeyError):
+        del store["vocal"]
+
+
+def test_slice_is_a_view(tmp_path, stems):
+    """Time slices come straight from the memory-mapped file without a copy."""
+    store = StemStore.from_arrays(tmp_path, stems, SR)
+    part = store.slice("drums", 1, 2)
+    assert isinstance(store["drums"], np.memmap)
+    assert part.shape == (SR,)
+    assert np.shares_memory(part, store["drums"])
+    assert store.slice("drums", 2.5, 10).shape == (SR // 2,)  # clipped to the stem length
+
+
+def test_read_into_buffer(tmp_path, stems):
+    """read(out=...) fills the caller's buffer and returns a view trimmed to the fragment."""
+    store = StemStore.from_arrays(tmp_path, stems, SR)
+    buffer = np.full(SR * 4, np.nan, dtype=np.float32)
+    result = store.read("bass", out=buffer)
+    assert np.shares_memory(result, buffer)
+    assert result.shape == (SR * 2,)
+    np.testing.assert_allclose(result, store.read("bass"))
+
+
+def test_mix_matches_sum(tmp_path, stems, monkeypatch):
+    """Chunked mixing equals the plain float32 sum, trimmed to the shortest stem."""
+    monkeypatch.setattr(stem_store, "MIX_CHUNK", 1000)
+    store = StemStore.from_arrays(tmp_path, stems, SR)
+    expected = store.read("drums")[: SR * 2] + 0.5 * store.read("bass")
+
+    mixed = store.mix(["drums", "bass", "vocal"], gains={"bass": 0.5})
+    assert mixed.shape == (SR * 2,)
+    np.testing.assert_allclose(mixed, expected, atol=1e-6)
+
+    buffer = np.ones(SR * 3, dtype=np.float32)
+    in_place = store.mix(["drums", "bass"], 0.5, 1.5, out=buffer, gains={"bass": 0.5})
+    assert np.shares_memory(in_place, buffer)
+    np.testing.assert_allclose(in_place, expected[SR // 2 : SR * 3 // 2], atol=1e-6)
+    assert store.mix(["vocal"]) is None
+
+
+def test_overwrite_keeps_open_views(tmp_path, stems):
+    """Replacing a stem does not invalidate arrays mapped from the previous version."""
+    store = StemStore.from_arrays(tmp_path, stems, SR)
+    old = store["drums"]
+    before = np.array(old)
+    store["drums"] = np.zeros(SR, dtype=np.float32)
+    np.testing.assert_array_equal(old, before)
+    assert store.length("drums") == SR
+    assert not store["drums"].any()
+
+
+def test_iteration_skips_temporary_files(tmp_path, stems):
+    store = StemStore.from_arrays(tmp_path, stems, SR)
+    np.save(tmp_path / "other.tmp.npy", np.zeros(4, dtype=np.int16))  # interrupted write
+    assert list(store) == ["bass", "drums"]
+    assert len(store) == 2
+
+
+def test_reuse_existing_directory(tmp_path, stems):
+    """A new store on the same directory picks up the stems written earlier."""
+    StemStore.from_arrays(tmp_path, stems, SR)
+    reopened = StemStore(tmp_path, SR)
+    assert set(reopened) == {"drums", "bass"}
+    np.testing.assert_allclose(reopened.read("drums"), stems["drums"], atol=1 / 32767)
+    del reopened["bass"]
+    assert "bass" not in StemStore(tmp_path, SR)
+
+
+def test_song_backed_by_store(tmp_path, stems):
+    """Song reads stems and mixes through the store; a known key skips the model."""
+    store = StemStore.from_arrays(tmp_path / "song", stems, SR)
+    song = Song("song", stems["drums"], SR, num_key=3, store=store)
+    assert song.key == " C Major"
+    assert "original" in store
+    np.testing.assert_allclose(song.stem("drums", 1, 2), store.read("drums", 1, 2))
+    assert song.stem("vocal") is None
+    np.testing.assert_allclose(song.mix(["drums", "bass"]), store.mix(["drums", "bass"]))
+
+
+@pytest.mark.skipif(shutil.which("rubberband") is None, reason="rubberband CLI is not installed")
+def test_song_pitch_shift_store(tmp_path, stems):
+    """Shifted stems go to a sibling store next to the source one."""
+    store = StemStore.from_arrays(tmp_path / "song", stems, SR)
+    song = Song("song", stems["drums"], SR, num_key=3, store=store)
+    shifted = song.pitch_shift(8)  # C Major -> F Major
+    assert shifted.audio.directory == tmp_path / "song+5"
+    assert shifted.num_key == 8
+    assert "original" in shifted.audio
@@ -27,6 +27,7 @@ class Stone(torch.nn.Module):
         self.kernels = kernels
         self.chromanet = ChromaNet(self.n_bins, self.n_harmonics, self.out_channels, self.kernels, temperature)
         self.octave_pool = OctavePool(12)
+        self.crop_fn = CropCQT(self.n_bins)
 
     def forward(self, x: dict) -> Tuple[Tensor, Tensor, Tensor]:
         """
@@ -45,14 +46,13 @@ class Stone(torch.nn.Module):
         original = torch.randint(1, 13, (len(s1),))
         transpose = (to_transpose + original) % 12
         difference = transpose - original
-        crop_fn = CropCQT(self.n_bins)
 
         # crop CQT
-        stack_original = crop_fn(stack_hcqt, torch.cat((original, original), dim=0))
+        stack_original = self.crop_fn(stack_hcqt, torch.cat((original, original), dim=0))
         mean_hcqt = self.octave_pool(torch.mean(stack_original, dim=3).unsqueeze(axis=3)).squeeze()
         mean_hcqt = (mean_hcqt[:batch] + mean_hcqt[batch:]) / 2
 
-        source_transpose = crop_fn(stack_hcqt[:batch, ...], transpose)
+        source_transpose = self.crop_fn(stack_hcqt[:batch, ...], transpose)
         stack_input = torch.cat((stack_original, source_transpose), dim=0)  # torch.Size([384, 1, 84, 646])
         y = self.chromanet(stack_input)  # (384, 1, 12)
 
@@ -0,0 +1,2 @@
+from .transposer import Transposer, get_transposer, shift_audio, shifted_key
+from .streaming import ShiftedWavStream, parse_range
@@ -0,0 +1,150 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import librosa
+import numpy as np
+
+from separation.streaming import ProgressiveMp3Writer
+from skey.skey.key_detection import KEY_MAP, transpose_key
+from .streaming import BLOCK_SECONDS, shift_blocks
+
+logger = logging.getLogger(__name__)
+
+# Сколько сдвигов рендерится одновременно
+TRANSPOSE_WORKERS = int(os.getenv("TRANSPOSE_WORKERS", "2"))
+TRANSPOSED_DIR = "data/transposed_songs"
+# Чаще всего пользователи сдвигают тональность на один-два полутона
+PREFETCH_SHIFTS = (-1, 1, -2, 2)
+
+_KEY_INDEX = {name: index for index, name in KEY_MAP.items()}
+
+
+def shifted_key(key: str, semitones: int) -> str:
+    """
+    Тональность после сдвига на semitones полутонов — без повторного определения моделью.
+    """
+    if key not in _KEY_INDEX:
+        raise ValueError(f"Неизвестная тональность: {key}")
+    return KEY_MAP[transpose_key(_KEY_INDEX[key], semitones)]
+
+
+def _iter_shifted(audio: np.ndarray, sr: int, semitones: float) -> Iterator[np.ndarray]:
+    # audio: (channels, samples); блоками, как при отдаче на лету (ShiftedWavStream)
+    block = round(BLOCK_SECONDS * sr)
+    blocks = (audio[:, i : i + block] for i in range(0, audio.shape[1], block))
+    return shift_blocks(blocks, sr, audio.shape[0], semitones, audio.shape[1], block=block)
+
+
+def shift_audio(audio: np.ndarray, sr: int, semitones: float) -> np.ndarray:
+    """
+    Сдвиг высоты тона rubberband'ом (тот же стретчер, что у ShiftedWavStream) с сохранением длительности.
+    audio: (samples,) или (channels, samples); форма результата та же.
+    """
+    if semitones == 0:
+        return audio
+    shifted = np.concatenate(list(_iter_shifted(np.atleast_2d(audio), sr, semitones)), axis=1)
+    return shifted[0] if audio.ndim == 1 else shifted
+
+
+def _render(source_path: str, target_path: str, semitones: int) -> Path:
+    # Выполняется в процессе пула: читает исходный стем, сдвигает и атомарно пишет mp3 по блокам
+    audio, sr = librosa.load(source_path, sr=None, mono=False)
+    audio = np.atleast_2d(audio)
+    tmp_path = Path(target_path).with_suffix(".tmp")
+    with ProgressiveMp3Writer(tmp_path, sr, audio.shape[0]) as writer:
+        for block in _iter_shifted(audio, sr, semitones):
+            writer.write(block)
+    os.replace(tmp_path, target_path)
+    return Path(target_path)
+
+
+class Transposer:
+    """
+    Рендер сдвинутых по высоте версий стема в пуле процессов с кэшем на диске
+    (один файл на пару (трек, полутоны)). Одинаковые запросы, пришедшие во время рендера,
+    ждут один и тот же Future.
+    """
+
+    def __init__(self, cache_dir: str = TRANSPOSED_DIR, max_workers: int = TRANSPOSE_WORKERS):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # spawn: пул создаётся по первому запросу, когда в сервере уже работают потоки, а fork
+        # многопоточного процесса может унаследовать захваченные блокировки
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def cached_path(self, track: str, semitones: int) -> Path:
+        return self.cache_dir / track / f"{semitones:+d}.mp3"
+
+    def render(self, track: str, source_path: str, semitones: int) -> Future:
+        """
+        Future с путём к сдвинутому файлу. Без сдвига возвращается исходный файл,
+        уже отрендеренные сдвиги берутся из кэша.
+        """
+        done: Future = Future()
+        if semitones == 0:
+            done.set_result(Path(source_path))
+            return done
+        target = self.cached_path(track, semitones)
+        if target.exists():
+            done.set_result(target)
+            return done
+
+        key = (track, semitones)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if not os.path.exists(source_path):
+                    raise FileNotFoundError(f"Стем не найден: {source_path}")
+                target.parent.mkdir(parents=True, exist_ok=True)
+                future = self._get_pool().submit(_render, source_path, str(target), semitones)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _forget(self, key: Tuple[str, int]) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def prefetch(self, track: str, source_path: str, shifts: Iterable[int] = PREFETCH_SHIFTS) -> None:
+        """
+        Фоновый рендер популярных сдвигов сразу после разделения трека.
+        """
+        for semitones in shifts:
+            future = self.render(track, source_path, semitones)
+            future.add_done_callback(lambda f, s=semitones: _log_failure(f, track, s))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _log_failure(future: Future, track: str, semitones: int) -> None:
+    if future.exception() is not None:
+        logger.warning(f"Не удалось сдвинуть {track} на {semitones:+d}: {future.exception()}")
+
+
+_transposer: Optional[Transposer] = None
+_transposer_lock = threading.Lock()
+
+
+def get_transposer() -> Transposer:
+    """
+    Общий на процесс Transposer.
+    """
+    global _transposer
+    with _transposer_lock:
+        if _transposer is None:
+            _transposer = Transposer()
+        return _transposer
@@ -2,28 +2,81 @@ from __future__ import annotations
 import asyncio
 import pathlib
 import os
+import threading
 from yandex_cloud_ml_sdk import AsyncYCloudML
 from dotenv import load_dotenv
 
+from outbound import BATCH, get_outbound
+from .image_store import ImageStore, get_image_store
+
 load_dotenv()
 YANDEX_FOLDER_ID = os.getenv("YANDEX_CLOUD_FOLDER")
 YANDEX_GPT_AUTH = os.getenv("YANDEX_CLOUD_API_KEY")
 
 
+def _make_sdk():
+    # Async-клиент SDK привязан к event loop, поэтому создаётся один раз в loop планировщика outbound
+    return AsyncYCloudML(
+        folder_id=YANDEX_FOLDER_ID,
+        auth=YANDEX_GPT_AUTH
+    )
+
+
 class ImageGenerator:
-    def __init__(self, model: str = "yandex-art"):
-        self.sdk = AsyncYCloudML(
-            folder_id=YANDEX_FOLDER_ID,
-            auth=YANDEX_GPT_AUTH
+    """
+    Генерация картинок Yandex Art через хранилище ImageStore: запрос, который уже генерировался,
+    обслуживается из хранилища, а одинаковые запросы, пришедшие одновременно, ждут одну генерацию.
+    Объект общий для всех запросов (get_image_generator).
+    """
+
+    def __init__(self, model: str = "yandex-art", width_ratio: int = 16, height_ratio: int = 9, seed: int = 50,
+                 store: ImageStore | None = None):
+        self.model = model
+        self.width_ratio = width_ratio
+        self.height_ratio = height_ratio
+        self.seed = seed
+        self.store = store or get_image_store()
+        self._inflight: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.outbound = get_outbound()
+
+    async def _request(self, sdk, text: str) -> bytes:
+        # SDK общий для всех генераторов, модель с настройками этого объекта собирается на запрос (без сети)
+        art_model = sdk.models.image_generation(self.model).configure(
+            width_ratio=self.width_ratio, height_ratio=self.height_ratio, seed=self.seed
         )
-        self.art_model = self.sdk.models.image_generation(model)
-        self.art_model = self.art_model.configure(width_ratio=16, height_ratio=9, seed=50)
+        operation = await art_model.run_deferred(text)
+        result = await operation
+        return result.image_bytes
+
+    async def _generate(self, key: str, text: str) -> pathlib.Path:
+        while True:
+            path = self.store.get(key)
+            if path is not None:
+                return path
+            with self._lock:
+                event = self._inflight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._inflight[key] = threading.Event()
+            if not owner:
+                # Такую же картинку уже генерирует другой запрос; если он упадёт, генерация начнётся заново
+                await asyncio.to_thread(event.wait)
+                continue
+            try:
+                image_bytes = await self.outbound.run(
+                    "art", _make_sdk, lambda sdk: self._request(sdk, text), BATCH
+                )
+                return self.store.put(key, image_bytes)
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                event.set()
 
     async def generate_image_by_text(self, text: str, out_path: pathlib.Path) -> None:
-        operation = await self.art_model.run_deferred(text)
-        result = await operation
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_bytes(result.image_bytes)
+        key = self.store.key(self.model, text, self.seed, self.width_ratio, self.height_ratio)
+        await self._generate(key, text)
+        self.store.link(key, out_path)
 
     async def generate_list_of_images(self, prompts: list[str], root_path: str) -> None:
         out_dir = pathlib.Path(root_path)
@@ -36,4 +89,16 @@ class ImageGenerator:
             )
             for i, text in enumerate(prompts, start=1)
         ]
-        await asyncio.gather(*tasks)
\ No newline at end of file
+        await asyncio.gather(*tasks)
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_image_generator() -> ImageGenerator:
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = ImageGenerator()
+        return _generator
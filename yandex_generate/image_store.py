@@ -0,0 +1,66 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/image_store")
+
+
+class ImageStore:
+    """
+    Сгенерированные картинки, адресуемые по содержимому запроса: ключ — sha256 от
+    (модель, промпт, seed, соотношение сторон). Одинаковый запрос всегда даёт тот же файл,
+    в папку трека он попадает жёсткой ссылкой, а не новой генерацией.
+    """
+
+    def __init__(self, directory: str = IMAGE_STORE_DIR):
+        self.directory = pathlib.Path(directory)
+
+    @staticmethod
+    def key(model: str, prompt: str, seed: int, width_ratio: int, height_ratio: int) -> str:
+        payload = json.dumps([model, prompt.strip(), seed, width_ratio, height_ratio], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}.jpg"
+
+    def get(self, key: str) -> pathlib.Path | None:
+        path = self.path(key)
+        return path if path.exists() else None
+
+    def put(self, key: str, image_bytes: bytes) -> pathlib.Path:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(image_bytes)
+        os.replace(tmp_path, path)
+        return path
+
+    def link(self, key: str, out_path: pathlib.Path) -> pathlib.Path:
+        """
+        Кладёт картинку из хранилища в out_path жёсткой ссылкой (копией, если ссылка невозможна,
+        например хранилище на другом диске).
+        """
+        out_path = pathlib.Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.unlink(missing_ok=True)
+        try:
+            os.link(self.path(key), out_path)
+        except OSError:
+            shutil.copyfile(self.path(key), out_path)
+        return out_path
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore()
+        return _store
@@ -0,0 +1,180 @@
+from __future__ import annotations
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Ширина каждой версии картинки; высота — по исходным пропорциям (16:9)
+RENDITION_WIDTHS = {"thumbnail": 320, "mobile": 960, "full": 1920}
+RENDITION_QUALITY = 80
+RENDITIONS_DIR = "renditions"
+MANIFEST_NAME = "renditions.json"
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", "2"))
+
+
+def _write_replace(path: pathlib.Path, write) -> None:
+    """
+    Атомарная запись: write(file) пишет во временный файл рядом с path, затем он заменяет path.
+    Имя временного файла уникально, поэтому одновременные рендеры одной папки не пишут в один файл.
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False) as tmp:
+        try:
+            write(tmp)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    # mkstemp создаёт файл с правами 0600, а версии и manifest раздаются как статика
+    os.chmod(tmp.name, 0o644)
+    os.replace(tmp.name, path)
+
+
+def source_images(images_dir: pathlib.Path) -> list[pathlib.Path]:
+    return sorted(p for p in pathlib.Path(images_dir).glob("gener*.jpg"))
+
+
+def source_signature(path: pathlib.Path) -> str:
+    """
+    Отпечаток исходника: inode, размер и mtime. Картинки кладутся жёсткими ссылками на файлы
+    ImageStore (ImageStore.link), и mtime у новой ссылки — старого файла хранилища, поэтому
+    одного mtime мало: при замене картинки меняется inode.
+    """
+    stat = pathlib.Path(path).stat()
+    return f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def is_fresh(entry: dict | None, source: pathlib.Path) -> bool:
+    """
+    Запись manifest для source соответствует текущему файлу.
+    """
+    try:
+        return entry is not None and entry.get("source") == source_signature(source)
+    except FileNotFoundError:
+        return False
+
+
+def render_image(source_path: str, out_dir: str, previous: dict | None = None) -> dict:
+    """
+    Уменьшенные WebP-версии одной картинки. Выполняется в процессе пула.
+    Версии не пересчитываются, если previous (запись из прошлого manifest) сделана с этого же
+    исходника и файлы на месте.
+    Returns: {"source": отпечаток, "renditions": {"thumbnail": {"file", "width", "height", "bytes"}, ...}}
+    """
+    source = pathlib.Path(source_path)
+    out = pathlib.Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    # Отпечаток снимается до чтения: если картинку заменят во время рендера, следующий проход её пересчитает
+    signature = source_signature(source)
+    reuse = previous is not None and previous.get("source") == signature
+    renditions = {}
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        for name, width in RENDITION_WIDTHS.items():
+            # Картинку не увеличиваем: если исходник уже, версия получается в исходном размере
+            width = min(width, image.width)
+            height = round(image.height * width / image.width)
+            path = out / f"{source.stem}_{name}.webp"
+            if not (reuse and path.exists()):
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+                _write_replace(path, lambda f: resized.save(f, "WEBP", quality=RENDITION_QUALITY, method=4))
+            renditions[name] = {"file": path.name, "width": width, "height": height, "bytes": path.stat().st_size}
+    return {"source": signature, "renditions": renditions}
+
+
+class RenditionRenderer:
+    """
+    Рендер версий картинок трека в пуле процессов. Результат — manifest renditions.json в папке картинок:
+    {"gener1.jpg": {"source": отпечаток исходника, "renditions": {"thumbnail": {...}, "mobile": {...}, "full": {...}}}, ...}
+    """
+
+    def __init__(self, max_workers: int = RENDITION_WORKERS):
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # spawn: пул создаётся по первому запросу, когда в сервере уже работают потоки, а fork
+        # многопоточного процесса может унаследовать захваченные блокировки. Рабочим нужен только PIL
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def render_folder(self, images_dir: str) -> dict:
+        """
+        Рендерит версии всех картинок папки и записывает manifest. Блокирует до окончания.
+        """
+        images_dir = pathlib.Path(images_dir)
+        sources = source_images(images_dir)
+        out_dir = str(images_dir / RENDITIONS_DIR)
+        previous = load_manifest(images_dir) or {}
+        with self._lock:
+            pool = self._get_pool()
+        results = pool.map(
+            render_image, [str(p) for p in sources], [out_dir] * len(sources), [previous.get(p.name) for p in sources]
+        )
+        manifest = {source.name: renditions for source, renditions in zip(sources, results)}
+        data = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        _write_replace(images_dir / MANIFEST_NAME, lambda f: f.write(data))
+        logger.info(f"Rendered {len(sources)} images in {images_dir}")
+        return manifest
+
+    def submit_folder(self, images_dir: str) -> Future:
+        """
+        Фоновый рендер папки (например, для треков, обработанных до появления версий).
+        Повторные вызовы, пока рендер идёт, возвращают тот же Future.
+        """
+        key = str(images_dir)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._pending[key] = future
+
+        def run():
+            try:
+                future.set_result(self.render_folder(images_dir))
+            except Exception as e:
+                logger.error(f"Rendition failed for {images_dir}: {e}")
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def load_manifest(images_dir: str) -> dict | None:
+    path = pathlib.Path(images_dir) / MANIFEST_NAME
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_rendition_renderer() -> RenditionRenderer:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = RenditionRenderer()
+        return _renderer
@@ -0,0 +1,94 @@
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from yandex_generate import renditions
+from yandex_generate.renditions import MANIFEST_NAME, RenditionRenderer, is_fresh, load_manifest
+
+
+def _image(path: pathlib.Path, color: str, mtime: float) -> pathlib.Path:
+    Image.new("RGB", (640, 360), color).save(path, "JPEG")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_relinked_source_is_rendered_again(tmp_path):
+    """A source replaced by a hard link to an older blob is detected and re-rendered."""
+    store = tmp_path / "store"
+    store.mkdir()
+    old_blob = _image(store / "old.jpg", "red", 1_000_000)
+    new_blob = _image(store / "new.jpg", "blue", 900_000)  # older mtime than the first image
+    images = tmp_path / "images"
+    images.mkdir()
+    source = images / "gener1.jpg"
+    os.link(old_blob, source)
+
+    renderer = RenditionRenderer(max_workers=1)
+    try:
+        first = renderer.render_folder(str(images))
+        assert is_fresh(first["gener1.jpg"], source)
+        thumbnail = images / renditions.RENDITIONS_DIR / first["gener1.jpg"]["renditions"]["thumbnail"]["file"]
+        with Image.open(thumbnail) as image:
+            assert image.size == (320, 180)
+            assert image.getpixel((10, 10))[0] > 200
+
+        # Same as ImageStore.link: the old link is replaced by a link to another blob
+        source.unlink()
+        os.link(new_blob, source)
+        assert not is_fresh(load_manifest(str(images))["gener1.jpg"], source)
+
+        second = renderer.render_folder(str(images))
+        assert is_fresh(second["gener1.jpg"], source)
+        with Image.open(thumbnail) as image:
+            assert image.getpixel((10, 10))[2] > 200
+    finally:
+        renderer.shutdown()
+
+
+def test_unchanged_source_is_reused(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    _image(images / "gener1.jpg", "green", 1_000_000)
+    renderer = RenditionRenderer(max_workers=1)
+    try:
+        renderer.render_folder(str(images))
+        thumbnail = images / renditions.RENDITIONS_DIR / "gener1_thumbnail.webp"
+        os.utime(thumbnail, (1, 1))
+        renderer.render_folder(str(images))
+        assert thumbnail.stat().st_mtime == 1  # not rewritten
+        assert (images / MANIFEST_NAME).exists()
+    finally:
+        renderer.shutdown()
+
+
+def test_concurrent_renders_of_one_folder(tmp_path):
+    """Renders of the same folder running at once do not share temporary files."""
+    images = tmp_path / "images"
+    images.mkdir()
+    for i, color in enumerate(["red", "green", "blue", "white"], 1):
+        _image(images / f"gener{i}.jpg", color, 1_000_000)
+    renderer = RenditionRenderer(max_workers=4)
+    try:
+        with ThreadPoolExecutor(8) as threads:
+            manifests = list(threads.map(lambda _: renderer.render_folder(str(images)), range(8)))
+        assert all(manifest == manifests[0] for manifest in manifests)
+        assert load_manifest(str(images)) == manifests[0]
+        assert not list(images.rglob("*.tmp"))
+    finally:
+        renderer.shutdown()
+
+
+def test_overlapping_writes_use_own_temporary_files(tmp_path):
+    """A write that starts while another one to the same path is in progress does not clobber it."""
+    target = tmp_path / MANIFEST_NAME
+
+    def outer(f):
+        f.write(b"outer")
+        renditions._write_replace(target, lambda inner: inner.write(b"inner"))
+
+    renditions._write_replace(target, outer)
+    assert target.read_bytes() == b"outer"
+    assert oct(target.stat().st_mode & 0o777) == oct(0o644)
+    assert list(tmp_path.iterdir()) == [target]